@@ -3,6 +3,7 @@ TD Management and Verification System - Flask application factory.
 Redis-backed sessions, CSRF, role-based access.
 """
 import os
+import click
 from flask import Flask
 from flask import g
 from . import config
@@ -13,6 +14,8 @@ from .extensions import (
     session_store,
     init_redis,
     get_redis,
+    get_session_redis,
+    get_local_store,
 )
 
 
@@ -32,18 +35,50 @@ def create_app(config_overrides=None):
     if config_overrides:
         app.config.update(config_overrides)
 
-    # Redis and session (fallback to filesystem if Redis unavailable)
+    # Redis and session (fallback to the local store if Redis unavailable)
     init_redis(app)
     redis_client = get_redis()
     if redis_client:
-        app.config["SESSION_REDIS"] = redis_client
+        app.config["SESSION_REDIS"] = get_session_redis()
     else:
-        # Already set to filesystem in init_redis if Redis unavailable
+        # Already set to filesystem in init_redis if Redis and the local store are unavailable
         pass
 
+    if app.config.get("DATABASE_REPLICA_URL"):
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        binds["replica"] = app.config["DATABASE_REPLICA_URL"]
+        app.config["SQLALCHEMY_BINDS"] = binds
     db.init_app(app)
+    if app.config.get("SQLITE_TUNING"):
+        from .services.sqlite_tuning import configure_engine
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.dialect.name == "sqlite":
+                    configure_engine(engine, app.config)
+    if app.config.get("SQL_PROFILING"):
+        from .services.sql_profiler import install as install_sql_profiler
+        install_sql_profiler(app)
+    if app.config.get("SLOW_QUERY_LOG"):
+        from .services.slow_query_log import install as install_slow_query_log
+        install_slow_query_log(app)
+    if app.config.get("TRACING"):
+        from .services.tracing import install as install_tracing
+        install_tracing(app)
+    if app.config.get("MEMORY_PROFILING"):
+        from .services.memory_profiler import install as install_memory_profiler
+        install_memory_profiler(app)
+    if app.config.get("METRICS_ENABLED"):
+        from .services.metrics_service import install as install_metrics
+        install_metrics(app)
     csrf.init_app(app)
-    session_store.init_app(app)
+    if get_local_store() is not None and app.config.get("SESSION_TYPE") == "redis":
+        from .services.local_store import LocalSessionInterface
+        app.session_interface = LocalSessionInterface(app, get_session_redis())
+    else:
+        session_store.init_app(app)
+    if app.config.get("SESSION_SERIALIZER") == "compact":
+        from .services.session_serializer import CompactSessionSerializer
+        app.session_interface.serializer = CompactSessionSerializer(app)
     login_manager.init_app(app)
     login_manager.login_view = "auth.login"
     login_manager.session_protection = "strong"
@@ -61,18 +96,19 @@ def create_app(config_overrides=None):
     def before_request():
         from flask_login import current_user
         from .services.maintenance_service import is_maintenance_mode
-        from .services.session_service import touch_session, is_session_expired
+        from .services.session_service import touch_session, is_session_expired, untrack_session
         if current_user.is_authenticated:
             if is_session_expired():
                 from flask import redirect, url_for
                 from flask_login import logout_user
+                untrack_session(current_user.id)
                 logout_user()
                 return redirect(url_for("auth.login") + "?expired=1")
             touch_session(current_user.id)
         if is_maintenance_mode():
             from flask import request
             allowed = request.endpoint and (
-                request.endpoint.startswith("developer.") or request.endpoint == "auth.logout" or request.endpoint == "maintenance_message"
+                request.endpoint.startswith("developer.") or request.endpoint in ("auth.logout", "maintenance_message", "metrics")
             )
             if not allowed and request.endpoint != "static":
                 from flask import redirect, url_for
@@ -112,6 +148,88 @@ def create_app(config_overrides=None):
             print("Backup failed.")
             raise SystemExit(1)
 
+    @app.cli.command("backup-verify")
+    def backup_verify_cmd():
+        from .services import backup_catalog
+        failed = 0
+        for entry in backup_catalog.entries():
+            ok, message = backup_catalog.verify(entry["name"])
+            print(f"{entry['name']}: {message}")
+            failed += not ok
+        if failed:
+            raise SystemExit(1)
+
+    # CLI: incremental logical backups (nightly; see services/logical_backup.py)
+    @app.cli.command("backup-logical")
+    @click.option("--full", is_flag=True, help="Start a new chain with a full base backup.")
+    def backup_logical_cmd(full):
+        from .services.logical_backup import prune_logical_backups, run_logical_backup
+        manifest = run_logical_backup(full=full, progress=lambda table, rows, seconds: print(
+            f"{table:20} {rows:>10,} rows  {seconds:7.2f} s"))
+        size = sum(s["bytes"] for s in manifest["segments"].values())
+        print(f"Backup {manifest['id']} ({manifest['kind']}, {size / 1048576:.1f} MB, {manifest['duration_s']:.1f} s)")
+        for backup_id in prune_logical_backups():
+            print("Pruned", backup_id)
+
+    @app.cli.command("restore-logical")
+    @click.argument("backup_id")
+    def restore_logical_cmd(backup_id):
+        from .services.logical_backup import BackupChainError, restore_logical
+        from .services.maintenance_service import set_maintenance_mode
+        from .services.session_service import flush_all_sessions
+        if not set_maintenance_mode(True):
+            print("Restore refused: maintenance mode could not be turned on (Redis unavailable).")
+            raise SystemExit(1)
+        flush_all_sessions()
+        try:
+            totals = restore_logical(backup_id, progress=lambda backup, table, rows: print(
+                f"{backup}  {table:20} {rows:>10,} rows"))
+        except BackupChainError as e:
+            print("Restore refused:", e)
+            raise SystemExit(1)
+        finally:
+            if not set_maintenance_mode(False):
+                print("Maintenance mode could not be turned off (Redis unavailable); turn it off from the developer page.")
+        print(f"Restored {sum(totals.values()):,} rows from {backup_id}.")
+
+    # CLI: schema migrations (run on deploy after db.create_all)
+    @app.cli.command("db-upgrade")
+    def db_upgrade_cmd():
+        from .services.migration_service import upgrade
+        applied = upgrade(progress=lambda version, name: print(f"Applying {version:04d}: {name}"))
+        print(f"{len(applied)} migration(s) applied." if applied else "Database is up to date.")
+
+    @app.cli.command("db-status")
+    def db_status_cmd():
+        from .services.migration_service import migration_status
+        for version, name, applied_at in migration_status():
+            state = f"applied {str(applied_at)[:19]}" if applied_at else "pending"
+            print(f"{version:04d}  {state:28}  {name}")
+
+    # CLI: synthetic production-scale dataset for benchmarks (see services/synthetic_data.py)
+    @app.cli.command("seed-synthetic")
+    @click.option("--lines", default=200, show_default=True)
+    @click.option("--fg-codes", default=20000, show_default=True)
+    @click.option("--verifications", default=50000, show_default=True)
+    @click.option("--operators", default=100, show_default=True)
+    @click.option("--audit-per-verification", default=2, show_default=True)
+    @click.option("--max-items", default=2000, show_default=True, help="Cap on TD items per FG code.")
+    @click.option("--days", default=365, show_default=True, help="Spread verifications over this many days.")
+    @click.option("--seed", default=1, show_default=True)
+    def seed_synthetic_cmd(**options):
+        import time
+        from .services.synthetic_data import generate
+        started = time.perf_counter()
+        try:
+            counts = generate(**options, progress=lambda table, rows, seconds: print(
+                f"{table:20} {rows:>10,} rows  {seconds:7.1f} s  {rows / max(seconds, 1e-9) * 60:>12,.0f} rows/min"))
+        except ValueError as e:
+            print(e)
+            raise SystemExit(1)
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        print(f"{'total':20} {total:>10,} rows  {elapsed:7.1f} s  {total / elapsed * 60:>12,.0f} rows/min")
+
     # Root redirect
     @app.route("/")
     def index():
@@ -125,4 +243,14 @@ def create_app(config_overrides=None):
             return redirect(url_for("admin.dashboard"))
         return redirect(url_for("operator.dashboard"))
 
+    # Stop a restore client left running by a worker on this host that died mid-restore
+    from .services.restore_job import StateUnavailable, recover as recover_restore
+    with app.app_context():
+        try:
+            recover_restore()
+        except StateUnavailable:
+            pass
+        except Exception:
+            app.logger.warning("Could not check for an interrupted restore", exc_info=True)
+
     return app
@@ -3,6 +3,7 @@ Configuration for TD Management and Verification System.
 Production-grade settings; DEBUG disabled in production.
 """
 import os
+import tempfile
 from datetime import timedelta
 
 # Base
@@ -22,14 +23,49 @@ else:
     _sqlite_path = os.path.join(_project_root, "td_checklist.db").replace("\\", "/")
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{_sqlite_path}"
     SQLALCHEMY_ENGINE_OPTIONS = {}
+# SQLite mode (single box, no PostgreSQL): pragmas and write serialization, see services/sqlite_tuning.py
+SQLITE_TUNING = os.environ.get("SQLITE_TUNING", "1").lower() in ("1", "true", "yes")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 10000))
+SQLITE_SYNCHRONOUS = "NORMAL"
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_CACHE_KB = 32 * 1024
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+# Optional read replica for reports and exports (see services/replica_service.py)
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+if DATABASE_REPLICA_URL and DATABASE_REPLICA_URL.startswith("postgres://"):
+    DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace("postgres://", "postgresql://", 1)
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 10))
+REPLICA_LAG_CHECK_SECONDS = 5
 
 # Redis
 REDIS_URL = os.environ.get("REDIS_URL") or "redis://localhost:6379/0"
+# Connection pool per worker (one for app data, one for binary session blobs)
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 20))
+REDIS_POOL_TIMEOUT = 1.0  # wait for a free pooled connection
+REDIS_CONNECT_TIMEOUT = float(os.environ.get("REDIS_CONNECT_TIMEOUT", 1.0))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 1.0))
+REDIS_HEALTH_CHECK_INTERVAL = 30
+# Circuit breaker: open after N consecutive connection/timeout errors, probe in background
+REDIS_BREAKER_FAILURE_THRESHOLD = 3
+REDIS_BREAKER_PROBE_SECONDS = 5
 REDIS_SESSION_PREFIX = "td_session:"
 REDIS_RATE_LIMIT_PREFIX = "td_ratelimit:"
-REDIS_ACTIVE_SESSIONS_KEY = "td_active_sessions"
+# Sorted sets scored by last activity (see session_service)
+REDIS_ACTIVE_SESSIONS_KEY = "td_active_session_index"
+REDIS_USER_SESSIONS_PREFIX = "td_user_sessions:"
 REDIS_MAINTENANCE_KEY = "td_maintenance_mode"
+REDIS_MAINTENANCE_CHANNEL = "td_maintenance_events"
+REDIS_SESSION_LEGACY_UNTIL_KEY = "td_session_legacy_until"  # default legacy-session cutoff, set once
+REDIS_RESTORE_JOB_KEY = "td_restore_job"  # state of the current/last restore; ":lock" and ":cancel" beside it
+
+# Redis-less mode: if Redis is unreachable at startup, sessions, rate limits and the maintenance
+# flag use a SQLite (WAL) store shared by all workers on the host. Empty path = filesystem sessions only.
+LOCAL_STORE_PATH = os.environ.get("LOCAL_STORE_PATH", os.path.join(tempfile.gettempdir(), "td_local_store.db"))
+LOCAL_STORE_BUSY_TIMEOUT_MS = 5000
+LOCAL_STORE_SWEEP_SECONDS = 60
+
+# Maintenance flag is cached per worker; pub/sub pushes changes, resync bounds staleness
+MAINTENANCE_RESYNC_SECONDS = 5
 
 # Session (stored in Redis)
 SESSION_TYPE = "redis"
@@ -42,6 +78,21 @@ SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SECURE = True
 SESSION_COOKIE_SAMESITE = "Lax"
 SESSION_PERMANENT = True
+# "compact": signed, versioned msgpack with short keys (see session_serializer); "msgpack": Flask-Session default
+SESSION_SERIALIZER = "compact"
+# Read unsigned sessions written before the compact format (plain msgpack/JSON) until the cutoff:
+# SESSION_ACCEPT_LEGACY_UNTIL as UTC "YYYY-MM-DD HH:MM", else one PERMANENT_SESSION_LIFETIME after
+# the first worker started (kept in Redis, not reset by restarts). Older blobs have expired from
+# Redis by then; remove with the legacy decoder.
+SESSION_ACCEPT_LEGACY = os.environ.get("SESSION_ACCEPT_LEGACY", "1").lower() in ("1", "true", "yes")
+SESSION_ACCEPT_LEGACY_UNTIL = os.environ.get("SESSION_ACCEPT_LEGACY_UNTIL")
+# Only rewrite the session when touch_session records activity (not on every request)
+SESSION_REFRESH_EACH_REQUEST = False
+# Minimum seconds between activity writes per session; 0 writes on every request. Activity and the
+# TTL trail the last request by up to this much, so idle sessions end up to this early
+SESSION_TOUCH_INTERVAL_SECONDS = 60
+# Keys per SCAN page and per UNLINK pipeline when flushing all sessions or rate-limit counters
+SESSION_FLUSH_BATCH_SIZE = 500
 
 # CSRF
 WTF_CSRF_ENABLED = True
@@ -50,8 +101,20 @@ WTF_CSRF_SSL_STRICT = True
 
 # Security
 BCRYPT_LOG_ROUNDS = 12
+# bcrypt runs on a per-worker executor; slots cap concurrent hashes across all workers on the host.
+# Logins queue rather than fail: a shift change of 40 operators is ~40 x 0.25 s / 2 slots = 5 s
+# of hashing (20 s on one slow core), inside the queue timeout; beyond it the login asks to retry
+PASSWORD_HASH_WORKERS = 1
+PASSWORD_HASH_SLOTS = 2
+PASSWORD_HASH_SLOT_DIR = os.environ.get("PASSWORD_HASH_SLOT_DIR") or os.path.join(tempfile.gettempdir(), "td_bcrypt_slots")
+PASSWORD_HASH_MAX_PENDING = 64
+PASSWORD_HASH_QUEUE_TIMEOUT = 30
 MAX_LOGIN_ATTEMPTS = 5
+LOGIN_ATTEMPT_WINDOW_SECONDS = 120
 LOGIN_COOLDOWN_SECONDS = 120
+# Checklist submits per operator (sliding window)
+SUBMIT_RATE_LIMIT = 20
+SUBMIT_RATE_WINDOW_SECONDS = 60
 PASSWORD_MIN_LENGTH = 10
 PASSWORD_REQUIRE_NUMBER = True
 PASSWORD_REQUIRE_LETTER = True
@@ -63,6 +126,59 @@ MAX_DEVELOPER_ACCOUNTS = 2
 # Backup
 BACKUP_DIR = os.environ.get("BACKUP_DIR") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "backups")
 BACKUP_RETENTION_DAYS = 30
+# PostgreSQL: directory-format pg_dump and pg_restore with BACKUP_JOBS parallel jobs; BACKUP_COMPRESSION is
+# passed to pg_dump -Z (a gzip level, or e.g. zstd:3 with pg_dump 16+)
+BACKUP_JOBS = int(os.environ.get("BACKUP_JOBS", min(4, os.cpu_count() or 1)))
+BACKUP_COMPRESSION = os.environ.get("BACKUP_COMPRESSION", "6")
+BACKUP_TIMEOUT_SECONDS = int(os.environ.get("BACKUP_TIMEOUT_SECONDS", 1800))
+BACKUP_RESTORE_TIMEOUT_SECONDS = int(os.environ.get("BACKUP_RESTORE_TIMEOUT_SECONDS", 3600))
+# Restores run as background jobs (services/restore_job.py); a job without a heartbeat for
+# RESTORE_JOB_STALE_SECONDS lost its worker. Finished job status is kept RESTORE_JOB_KEEP_SECONDS.
+RESTORE_JOB_STALE_SECONDS = 60
+RESTORE_JOB_KEEP_SECONDS = 7 * 24 * 3600
+RESTORE_PROGRESS_TOKEN_SECONDS = 2 * 3600  # signed progress-poll token; covers verification plus a restore
+# Incremental logical backups (services/logical_backup.py): a new full base after LOGICAL_BACKUP_FULL_EVERY deltas
+LOGICAL_BACKUP_DIR = os.environ.get("LOGICAL_BACKUP_DIR") or os.path.join(BACKUP_DIR, "logical")
+LOGICAL_BACKUP_FULL_EVERY = int(os.environ.get("LOGICAL_BACKUP_FULL_EVERY", 7))
+LOGICAL_BACKUP_OVERLAP_SECONDS = 600  # deltas re-read rows stamped this long before the previous backup
+
+# Per-request SQL counts and N+1 warnings (services/sql_profiler.py); off = no instrumentation at all
+SQL_PROFILING = os.environ.get("SQL_PROFILING", "0").lower() in ("1", "true", "yes")
+SQL_N_PLUS_ONE_THRESHOLD = 10
+SQL_N_PLUS_ONE_RAISE = False  # raise NPlusOneDetected instead of logging (tests)
+
+# Slow query log (services/slow_query_log.py): statements over SLOW_QUERY_MS, newest SLOW_QUERY_BUFFER kept;
+# off = no timing hook on the engines
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "0").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+SLOW_QUERY_BUFFER = 500
+REDIS_SLOW_QUERY_KEY = "td_slow_queries"
+
+# Request tracing (services/tracing.py): span timelines of sampled requests, viewed at /developer/traces
+TRACING = os.environ.get("TRACING", "0").lower() in ("1", "true", "yes")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0.01))  # developers can force one with X-Trace: 1
+TRACE_FILE = os.environ.get("TRACE_FILE") or os.path.join(tempfile.gettempdir(), "td_traces.jsonl")
+TRACE_FILE_MAX_BYTES = 50 * 1024 * 1024  # then rotated once to TRACE_FILE.1
+TRACE_MAX_SPANS = 2000
+
+# Worker memory (services/memory_profiler.py): peak RSS per endpoint, tracemalloc snapshots at /developer/memory
+MEMORY_PROFILING = os.environ.get("MEMORY_PROFILING", "0").lower() in ("1", "true", "yes")  # ~1.4 ms per request
+MEMORY_RECORD_MIN_MB = float(os.environ.get("MEMORY_RECORD_MIN_MB", 8))  # keep requests whose peak grew this much
+MEMORY_SAMPLE_BUFFER = 1000
+REDIS_MEMORY_SAMPLES_KEY = "td_memory_samples"
+MEMORY_SNAPSHOT_DIR = os.environ.get("MEMORY_SNAPSHOT_DIR") or os.path.join(tempfile.gettempdir(), "td_memory")
+MEMORY_SNAPSHOTS_KEEP = 10
+MEMORY_TRACEMALLOC_FRAMES = 1  # sites are reported by line; each extra frame slows traced code further
+REDIS_MEMORY_CONTROL_CHANNEL = "td_memory_control"  # tracemalloc commands to one worker (pid) or all
+REDIS_MEMORY_WORKERS_KEY = "td_memory_workers"  # pids with recent status; status JSON in "<key>:<pid>"
+MEMORY_WORKER_REPORT_SECONDS = 10  # workers report status this often; silent for 3x this = gone
+
+# Prometheus metrics at /metrics (services/metrics_service.py); per-worker snapshots are summed from
+# METRICS_DIR; gunicorn.conf.py clears it at master start and archives exited workers
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0").lower() in ("1", "true", "yes")
+METRICS_DIR = os.environ.get("METRICS_DIR") or os.path.join(tempfile.gettempdir(), "td_metrics")
+METRICS_FLUSH_SECONDS = 5
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")  # scraper access without a developer login
 
 # Pagination
 ITEMS_PER_PAGE = 20
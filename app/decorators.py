@@ -2,7 +2,7 @@
 Role-based and login decorators. Backend-only enforcement; never rely on frontend.
 """
 from functools import wraps
-from flask import abort
+from flask import abort, g, request
 from flask_login import current_user
 
 
@@ -40,3 +40,39 @@ def admin_required(f):
 def operator_or_above(f):
     """Operator, admin, or developer."""
     return role_required("developer", "admin", "operator")(f)
+
+
+def replica_reads(f):
+    """Run the view's ORM reads on the read replica when one is configured and within the lag guard."""
+    @wraps(f)
+    def inner(*args, **kwargs):
+        g.db_replica_reads = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.db_replica_reads = False
+    return inner
+
+
+def rate_limit(scope, limit, window_seconds, cooldown_seconds=None, key_func=None):
+    """
+    Sliding-window limit per user (or per client IP when anonymous); one Redis round trip per request.
+    Over the limit → 429 with Retry-After. key_func() may return a custom identifier.
+    """
+    def decorator(f):
+        @wraps(f)
+        def inner(*args, **kwargs):
+            from .services.rate_limit_service import hit
+            if key_func:
+                identifier = key_func()
+            elif current_user.is_authenticated:
+                identifier = f"user:{current_user.id}"
+            else:
+                identifier = f"ip:{request.remote_addr or 'unknown'}"
+            allowed, wait = hit([identifier], limit, window_seconds, cooldown_seconds or window_seconds, scope)
+            if not allowed:
+                g.retry_after = wait
+                abort(429)
+            return f(*args, **kwargs)
+        return inner
+    return decorator
@@ -2,40 +2,109 @@
 Flask extensions. Initialized in app factory.
 """
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as BaseSession
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager
 from flask_session import Session
 import redis
 import os
 
-db = SQLAlchemy()
+
+
+class RoutingSession(BaseSession):
+    """Sends ORM SELECTs inside @replica_reads views to the read replica; writes and raw SQL use the primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and getattr(clause, "is_select", False):
+            from .services.replica_service import replica_engine, use_replica
+            if use_replica():
+                engine = replica_engine()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 csrf = CSRFProtect()
 login_manager = LoginManager()
 session_store = Session()
 redis_client = None
+session_redis_client = None
+redis_breaker = None
+local_store = None
 
 
 def get_redis():
-    """Return Redis client (set by app factory)."""
+    """
+    Return Redis client (set by app factory): redis-py, or the local store's LocalRedis if Redis was
+    unavailable at startup. None while the circuit breaker is open, or without Redis and local store.
+    """
+    if redis_client is None or (redis_breaker is not None and not redis_breaker.allow()):
+        return None
     return redis_client
 
 
+def get_redis_breaker():
+    """Circuit breaker shared by all Redis clients (None if Redis was unavailable at startup)."""
+    return redis_breaker
+
+
+def get_session_redis():
+    """Return binary-safe Redis client for Flask-Session (serialized session blobs are not UTF-8), or None."""
+    return session_redis_client
+
+
+def get_local_store():
+    """SQLite store shared by workers, used instead of Redis if Redis was unavailable at startup (else None)."""
+    return local_store
+
+
+def _redis_pool(app, decode_responses):
+    return redis.BlockingConnectionPool.from_url(
+        app.config["REDIS_URL"],
+        decode_responses=decode_responses,
+        max_connections=app.config["REDIS_MAX_CONNECTIONS"],
+        timeout=app.config["REDIS_POOL_TIMEOUT"],
+        socket_connect_timeout=app.config["REDIS_CONNECT_TIMEOUT"],
+        socket_timeout=app.config["REDIS_SOCKET_TIMEOUT"],
+        health_check_interval=app.config["REDIS_HEALTH_CHECK_INTERVAL"],
+    )
+
+
 def init_redis(app):
-    """Create Redis connection from app config. Returns None if Redis unavailable (for local dev)."""
-    global redis_client
+    """
+    Create pooled Redis clients from app config, sharing one circuit breaker.
+    If Redis is unavailable at startup (local dev), returns the local store's client, or None if it is disabled.
+    """
+    global redis_client, session_redis_client, redis_breaker, local_store
+    from .services.redis_breaker import CircuitBreaker, make_client
+    local_store = None
     try:
-        redis_client = redis.from_url(
-            app.config["REDIS_URL"],
-            decode_responses=True,
-            socket_connect_timeout=2,
-            socket_timeout=2,
+        redis_breaker = CircuitBreaker(
+            app.config["REDIS_BREAKER_FAILURE_THRESHOLD"],
+            app.config["REDIS_BREAKER_PROBE_SECONDS"],
         )
+        redis_client = make_client(redis_breaker, _redis_pool(app, decode_responses=True))
         # Test connection
         redis_client.ping()
+        probe_client = redis.Redis(connection_pool=redis_client.connection_pool)
+        redis_breaker.probe = probe_client.ping
+        session_redis_client = make_client(redis_breaker, _redis_pool(app, decode_responses=False))
     except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError, Exception):
         redis_client = None
-        # Fall back to filesystem sessions if Redis unavailable
-        if app.config.get("SESSION_TYPE") == "redis":
+        session_redis_client = None
+        redis_breaker = None
+        # Fall back to the local store behind the same client API (or filesystem sessions if it is disabled)
+        if app.config.get("LOCAL_STORE_PATH"):
+            from .services.local_store import LocalRedis, LocalStore
+            local_store = LocalStore(
+                app.config["LOCAL_STORE_PATH"],
+                busy_timeout_ms=app.config["LOCAL_STORE_BUSY_TIMEOUT_MS"],
+                sweep_seconds=app.config["LOCAL_STORE_SWEEP_SECONDS"],
+            )
+            redis_client = LocalRedis(local_store, decode_responses=True)
+            session_redis_client = LocalRedis(local_store, decode_responses=False)
+        elif app.config.get("SESSION_TYPE") == "redis":
             app.config["SESSION_TYPE"] = "filesystem"
             app.config["SESSION_FILE_DIR"] = app.config.get("SESSION_FILE_DIR") or os.path.join(
                 os.path.dirname(os.path.dirname(__file__)), "flask_session"
@@ -4,8 +4,8 @@ Soft delete (is_active) for users, FG codes, TD items. Audit-friendly.
 """
 from datetime import datetime
 from flask_login import UserMixin
-import bcrypt
 from .extensions import db
+from .services.password_service import hash_password, verify_password, needs_rehash
 import re
 
 
@@ -37,18 +37,18 @@ class User(UserMixin, db.Model):
     __table_args__ = (db.CheckConstraint("role IN ('developer', 'admin', 'operator')", name="ck_user_role"),)
 
     def set_password(self, raw_password):
-        self.password_hash = bcrypt.hashpw(
-            raw_password.encode("utf-8"), bcrypt.gensalt(rounds=12)
-        ).decode("utf-8")
+        self.password_hash = hash_password(raw_password)
         self.updated_at = datetime.utcnow()
 
     def check_password(self, raw_password):
-        try:
-            return bcrypt.checkpw(
-                raw_password.encode("utf-8"), self.password_hash.encode("utf-8")
-            )
-        except Exception:
+        """May raise PasswordHasherBusy during login storms; callers should ask the user to retry."""
+        if not self.password_hash:
             return False
+        return verify_password(raw_password, self.password_hash)
+
+    def password_needs_rehash(self):
+        """True if the stored hash was made with a different BCRYPT_LOG_ROUNDS."""
+        return needs_rehash(self.password_hash)
 
     def is_developer(self):
         return self.role == "developer"
@@ -101,7 +101,11 @@ class FGCode(db.Model):
 
     td_items = db.relationship("TDItem", back_populates="fg_code", lazy="dynamic")
 
-    __table_args__ = (db.UniqueConstraint("line_id", "code", name="uq_fg_line_code"),)
+    __table_args__ = (
+        db.UniqueConstraint("line_id", "code", name="uq_fg_line_code"),
+        # Active FG codes of a line, ordered by code (verification flow)
+        db.Index("ix_fg_codes_line_active", "line_id", "code", postgresql_where=db.text("is_active"), sqlite_where=db.text("is_active = 1")),
+    )
 
 
 class TDItem(db.Model):
@@ -125,6 +129,8 @@ class TDItem(db.Model):
         db.UniqueConstraint("fg_id", "item_code", name="uq_fg_item_code"),
         db.CheckConstraint("item_type IN ('child_part', 'consumable')", name="ck_td_item_type"),
         db.CheckConstraint("quantity >= 0", name="ck_td_quantity_nonneg"),
+        # Active checklist items of an FG, ordered by item code (uq_fg_item_code covers all items)
+        db.Index("ix_td_items_fg_active", "fg_id", "item_code", postgresql_where=db.text("is_active"), sqlite_where=db.text("is_active = 1")),
     )
 
 
@@ -141,13 +147,19 @@ class Verification(db.Model):
 
     items = db.relationship("VerificationItem", back_populates="verification", lazy="joined", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.Index("ix_verifications_verified_at", "verified_at"),
+        db.Index("ix_verifications_fg_verified_at", "fg_id", "verified_at"),
+        db.Index("ix_verifications_operator_verified_at", "operator_id", "verified_at"),
+    )
+
 
 class VerificationItem(db.Model):
     """Per-item actual quantity recorded in a verification. Immutable."""
     __tablename__ = "verification_items"
     id = db.Column(db.Integer, primary_key=True)
-    verification_id = db.Column(db.Integer, db.ForeignKey("verifications.id"), nullable=False)
-    td_item_id = db.Column(db.Integer, db.ForeignKey("td_items.id"), nullable=False)
+    verification_id = db.Column(db.Integer, db.ForeignKey("verifications.id"), nullable=False, index=True)
+    td_item_id = db.Column(db.Integer, db.ForeignKey("td_items.id"), nullable=False, index=True)
     expected_quantity = db.Column(db.Numeric(12, 2), nullable=False)
     actual_quantity = db.Column(db.Numeric(12, 2), nullable=False)
     unit = db.Column(db.String(20), nullable=False)
@@ -167,7 +179,7 @@ class AuditLog(db.Model):
     details = db.Column(db.Text, nullable=True)
     ip_address = db.Column(db.String(45), nullable=True)
     user_agent = db.Column(db.String(255), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
 
     user = db.relationship("User", backref=db.backref("audit_logs", lazy="dynamic"))
 
@@ -179,4 +191,4 @@ class LoginAttempt(db.Model):
     username = db.Column(db.String(80), nullable=False, index=True)
     success = db.Column(db.Boolean, nullable=False)
     ip_address = db.Column(db.String(45), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -5,8 +5,9 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import current_user
 from ..extensions import db
 from ..models import Line, FGCode, TDItem, AuditLog
-from ..decorators import admin_required
+from ..decorators import admin_required, replica_reads
 from ..services.audit_service import log_td_create, log_td_update, log_td_deactivate
+from ..services.tracing import span
 from ..utils.validators import normalize_fg_code, normalize_unit, normalize_whitespace
 from ..config import ITEMS_PER_PAGE, TD_ITEMS_PER_PAGE
 import io
@@ -17,6 +18,7 @@ admin_bp = Blueprint("admin", __name__)
 
 @admin_bp.route("/")
 @admin_required
+@replica_reads
 def dashboard():
     from ..models import Line, FGCode, TDItem, Verification
     from datetime import datetime, timedelta
@@ -370,6 +372,7 @@ def td_activate(fg_id, item_id):
 # ---- Export ----
 @admin_bp.route("/export/td/<int:fg_id>")
 @admin_required
+@replica_reads
 def export_td(fg_id):
     fg = FGCode.query.get_or_404(fg_id)
     items = TDItem.query.filter_by(fg_id=fg_id).order_by(TDItem.item_code).all()
@@ -399,7 +402,8 @@ def export_td(fg_id):
             "Yes" if it.is_active else "No",
         ])
     buf = io.BytesIO()
-    wb.save(buf)
+    with span("openpyxl.save", "export"):
+        wb.save(buf)
     buf.seek(0)
     return send_file(
         buf,
@@ -411,6 +415,7 @@ def export_td(fg_id):
 
 @admin_bp.route("/export/audit-logs")
 @admin_required
+@replica_reads
 def export_audit_logs():
     from_date = request.args.get("from")
     to_date = request.args.get("to")
@@ -452,7 +457,8 @@ def export_audit_logs():
             log.ip_address or "",
         ])
     buf = io.BytesIO()
-    wb.save(buf)
+    with span("openpyxl.save", "export"):
+        wb.save(buf)
     buf.seek(0)
     return send_file(
         buf,
@@ -464,6 +470,7 @@ def export_audit_logs():
 
 @admin_bp.route("/audit-logs")
 @admin_required
+@replica_reads
 def audit_logs():
     page = request.args.get("page", 1, type=int)
     q = AuditLog.query.order_by(AuditLog.created_at.desc())
@@ -473,11 +480,18 @@ def audit_logs():
 
 @admin_bp.route("/export/verifications")
 @admin_required
+@replica_reads
 def export_verifications():
+    from sqlalchemy.orm import joinedload
     from ..models import Verification, VerificationItem
     from_date = request.args.get("from")
     to_date = request.args.get("to")
-    q = Verification.query.order_by(Verification.verified_at.desc())
+    # FG code, operator, items and item codes joined into the one query (no query per row)
+    q = Verification.query.options(
+        joinedload(Verification.fg_code),
+        joinedload(Verification.operator),
+        joinedload(Verification.items).joinedload(VerificationItem.td_item),
+    ).order_by(Verification.verified_at.desc())
     if from_date:
         try:
             q = q.filter(Verification.verified_at >= datetime.strptime(from_date, "%Y-%m-%d"))
@@ -520,7 +534,8 @@ def export_verifications():
                 vi.unit,
             ])
     buf = io.BytesIO()
-    wb.save(buf)
+    with span("openpyxl.save", "export"):
+        wb.save(buf)
     buf.seek(0)
     return send_file(
         buf,
@@ -6,18 +6,15 @@ from flask_login import login_user, logout_user, current_user
 from ..extensions import db
 from ..models import User, LoginAttempt
 from flask_login import login_required
-from ..services.rate_limit_service import (
-    is_rate_limited,
-    get_remaining_cooldown,
-    record_failed_attempt,
-    clear_rate_limit,
-)
+from ..services.rate_limit_service import login_cooldown, record_failed_attempts, clear_rate_limit
 from ..services.audit_service import (
     log_login_success,
     log_login_failure,
     log_logout,
     log_password_change,
 )
+from ..services.session_service import untrack_session
+from ..services.password_service import PasswordHasherBusy
 from ..utils.validators import validate_password
 
 auth_bp = Blueprint("auth", __name__)
@@ -27,6 +24,14 @@ def _get_client_id():
     return request.remote_addr or "unknown"
 
 
+def _login_failed(username, client_id, reason):
+    """Count a failed login (one Redis round trip), then its attempt row and audit entry in one commit."""
+    record_failed_attempts(client_id, username)
+    db.session.add(LoginAttempt(username=username, success=False, ip_address=client_id))
+    log_login_failure(username, reason, commit=False)
+    db.session.commit()
+
+
 @auth_bp.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
@@ -39,30 +44,37 @@ def login():
         flash("Username is required.", "danger")
         return render_template("auth/login.html")
     client_id = _get_client_id()
-    if is_rate_limited(client_id) or is_rate_limited(username):
-        secs = max(get_remaining_cooldown(client_id), get_remaining_cooldown(username))
+    # Checked before hashing, so a client in cooldown cannot make the server run bcrypt. Attempts are
+    # counted only once they failed: concurrent logins from one address (a shift behind NAT) must
+    # not add up to a cooldown, so check and record cannot be one call.
+    secs = login_cooldown(client_id, username)
+    if secs:
         flash(f"Too many failed attempts. Try again in {secs} seconds.", "danger")
         return render_template("auth/login.html")
     user = User.query.filter_by(username=username).first()
-    if not user or not user.check_password(password):
-        record_failed_attempt(client_id)
-        record_failed_attempt(username)
-        attempt = LoginAttempt(username=username, success=False, ip_address=client_id)
-        db.session.add(attempt)
-        db.session.commit()
-        log_login_failure(username, "invalid_credentials")
+    try:
+        password_ok = bool(user) and user.check_password(password)
+    except PasswordHasherBusy:
+        flash("Many users are signing in right now. Please try again in a few seconds.", "warning")
+        return render_template("auth/login.html"), 503
+    # Login writes (attempt, audit entry, optional rehash) go out in a single commit
+    if not password_ok:
+        _login_failed(username, client_id, "invalid_credentials")
         flash("Invalid username or password.", "danger")
         return render_template("auth/login.html")
     if not user.is_active:
-        log_login_failure(username, "account_inactive")
+        _login_failed(username, client_id, "account_inactive")
         flash("Account is deactivated. Contact an administrator.", "danger")
         return render_template("auth/login.html")
-    clear_rate_limit(client_id)
-    clear_rate_limit(username)
-    attempt = LoginAttempt(username=username, success=True, ip_address=client_id)
-    db.session.add(attempt)
+    clear_rate_limit(client_id, username)
+    if user.password_needs_rehash():
+        try:
+            user.set_password(password)
+        except PasswordHasherBusy:
+            pass  # keep the old hash; rehash on a later login
+    db.session.add(LoginAttempt(username=username, success=True, ip_address=client_id))
+    log_login_success(user.id, user.username, commit=False)
     db.session.commit()
-    log_login_success(user.id, user.username)
     login_user(user)
     if user.must_change_password:
         return redirect(url_for("auth.change_password", first=1))
@@ -74,6 +86,7 @@ def login():
 def logout():
     if current_user.is_authenticated:
         log_logout(current_user.id, current_user.username)
+        untrack_session(current_user.id)
         logout_user()
     return redirect(url_for("auth.login"))
 
@@ -1,11 +1,12 @@
 """
-Developer-only: users, backup, restore, maintenance, system dashboard, logout all.
+Developer-only: users, backup, restore, maintenance, system dashboard, logout all, slow queries,
+traces, memory.
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, current_app, abort, jsonify
 from flask_login import current_user
 from ..extensions import db
 from ..models import User, AuditLog
-from ..decorators import developer_required
+from ..decorators import developer_required, replica_reads
 from ..services.audit_service import (
     log_user_created,
     log_user_deactivated,
@@ -13,13 +14,23 @@ from ..services.audit_service import (
     log_force_password_reset,
     log_maintenance_toggle,
     log_logout_all,
+    log_sessions_revoked,
     log_restore_db,
 )
-from ..services.backup_service import run_backup, list_backups, restore_from_file, prune_old_backups
+from ..services.backup_service import run_backup, list_backups, prune_old_backups
+from ..services import backup_catalog
 from ..services.maintenance_service import is_maintenance_mode, set_maintenance_mode
-from ..services.session_service import flush_all_sessions, get_active_sessions_count
+from ..services.password_service import get_hash_metrics
+from ..services import memory_profiler, restore_job, slow_query_log, tracing
+from ..services.session_service import (
+    flush_all_sessions,
+    get_active_sessions_count,
+    list_active_sessions,
+    revoke_user_sessions,
+)
+from ..services.sqlite_tuning import begin_write
 from ..utils.validators import validate_password
-from ..config import MAX_DEVELOPER_ACCOUNTS
+from ..config import MAX_DEVELOPER_ACCOUNTS, PERMANENT_SESSION_LIFETIME
 import os
 import time
 
@@ -28,23 +39,28 @@ developer_bp = Blueprint("developer", __name__)
 
 @developer_bp.route("/")
 @developer_required
+@replica_reads
 def dashboard():
-    from ..extensions import get_redis
+    from ..extensions import get_redis, get_redis_breaker, get_local_store
+    from ..services.replica_service import replica_status
     from ..models import User, Line, FGCode, TDItem, Verification
     r = get_redis()
+    breaker = get_redis_breaker()
     db_ok = True
     try:
         db.session.execute(db.text("SELECT 1"))
     except Exception:
         db_ok = False
     redis_ok = False
-    redis_available = r is not None
-    if r:
+    redis_available = breaker is not None  # without it r is the local store's client
+    if r and redis_available:
         try:
             redis_ok = r.ping()
         except Exception:
             redis_ok = False
+    redis_breaker = breaker.snapshot() if breaker else None
     active_sessions = get_active_sessions_count()
+    hash_metrics = get_hash_metrics()
     maintenance = is_maintenance_mode()
     backups = list_backups()[:10]
     # Statistics
@@ -61,7 +77,11 @@ def dashboard():
         db_ok=db_ok,
         redis_ok=redis_ok,
         redis_available=redis_available,
+        redis_breaker=redis_breaker,
+        local_store=get_local_store() is not None,
+        replica=replica_status(),
         active_sessions=active_sessions,
+        hash_metrics=hash_metrics,
         maintenance=maintenance,
         backups=backups,
         total_users=total_users,
@@ -81,7 +101,9 @@ def maintenance_page():
     if request.method == "GET":
         return render_template("developer/maintenance.html", enabled=is_maintenance_mode())
     enabled = request.form.get("enable") == "1"
-    set_maintenance_mode(enabled)
+    if not set_maintenance_mode(enabled):
+        flash("Maintenance mode could not be changed: Redis is unavailable. Try again shortly.", "danger")
+        return redirect(url_for("developer.maintenance_page"))
     log_maintenance_toggle(current_user.id, current_user.username, enabled)
     flash("Maintenance mode " + ("enabled" if enabled else "disabled") + ".", "success")
     return redirect(url_for("developer.dashboard"))
@@ -92,7 +114,7 @@ def maintenance_page():
 @developer_required
 def users_list():
     users = User.query.order_by(User.username).all()
-    return render_template("developer/users_list.html", users=users)
+    return render_template("developer/user_list.html", users=users)
 
 
 @developer_bp.route("/users/create", methods=["GET", "POST"])
@@ -107,6 +129,7 @@ def user_create():
     if role not in ("developer", "admin", "operator"):
         role = "operator"
     if role == "developer":
+        begin_write(db.session)  # count and insert in one transaction on SQLite
         dev_count = User.query.filter_by(role="developer", is_active=True).count()
         if dev_count >= MAX_DEVELOPER_ACCOUNTS:
             flash(f"Maximum {MAX_DEVELOPER_ACCOUNTS} developer accounts allowed.", "danger")
@@ -144,6 +167,7 @@ def user_deactivate(user_id):
         flash("You cannot deactivate yourself.", "danger")
         return redirect(url_for("developer.users_list"))
     if user.role == "developer":
+        begin_write(db.session)  # count and update in one transaction on SQLite
         dev_count = User.query.filter_by(role="developer", is_active=True).count()
         if dev_count <= 1:
             flash("Cannot deactivate the last developer.", "danger")
@@ -196,7 +220,7 @@ def force_reset_password(user_id):
 @developer_required
 def backup_list():
     backups = list_backups()
-    return render_template("developer/backup_list.html", backups=backups)
+    return render_template("developer/backup_list.html", backups=backups, restore=restore_job.current())
 
 
 @developer_bp.route("/backup/create")
@@ -207,24 +231,77 @@ def backup_create():
         prune_old_backups()
         flash("Backup created.", "success")
     else:
-        flash("Backup failed. Ensure pg_dump is available and DATABASE_URL is set.", "danger")
+        flash("Backup failed. Ensure pg_dump is available (PostgreSQL) and the backup directory is writable.", "danger")
     return redirect(url_for("developer.backup_list"))
 
 
 @developer_bp.route("/backup/download/<path:filename>")
 @developer_required
 def backup_download(filename):
-    from ..config import BACKUP_DIR
-    import urllib.parse
-    base = os.path.basename(filename)
-    if not base.startswith("td_backup_") or not base.endswith(".sql"):
+    entry = backup_catalog.get(os.path.basename(filename))
+    if entry is None:
         flash("Invalid file.", "danger")
         return redirect(url_for("developer.backup_list"))
-    path = os.path.join(BACKUP_DIR, base)
-    if not os.path.isfile(path):
+    path = entry["path"]
+    try:
+        size = backup_catalog.download_size(path)
+    except OSError:
         flash("File not found.", "danger")
         return redirect(url_for("developer.backup_list"))
-    return send_file(path, as_attachment=True, download_name=base)
+    if size != entry["size"]:
+        flash(f"{entry['name']} changed on disk since it was cataloged ({size} bytes, catalog {entry['size']}).", "danger")
+        return redirect(url_for("developer.backup_list"))
+    etag = entry["sha256"]
+    is_dir = os.path.isdir(path)
+    if etag and not request.range:
+        # Whole download: verified while it streams, so the checksum header is never sent with other bytes
+        logger = current_app.logger
+
+        def chunks():
+            try:
+                yield from backup_catalog.iter_verified(path, etag)
+            except backup_catalog.ChecksumMismatch as e:
+                logger.error("Backup download aborted, checksum mismatch: %s", e)
+                raise
+
+        response = current_app.response_class(
+            chunks(), mimetype="application/x-tar" if is_dir else "application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{entry["name"]}{".tar" if is_dir else ""}"',
+                     "Content-Length": str(size), "Accept-Ranges": "bytes", "X-Checksum-SHA256": etag},
+        )
+        response.set_etag(etag)
+        return response
+    if not is_dir:
+        # send_file streams the file and answers Range / If-Range requests itself
+        response = send_file(path, as_attachment=True, download_name=entry["name"], etag=etag or True, conditional=True)
+    else:
+        # pg_dump directory archive: streamed as a tar (restore with `tar x` then pg_restore -j)
+        start, stop, status = 0, size, 200
+        if_range = request.headers.get("If-Range")
+        if request.range and (not if_range or (etag and if_range.strip('"') == etag)):
+            span = request.range.range_for_length(size)
+            if span is None:
+                return current_app.response_class(status=416, headers={"Content-Range": f"bytes */{size}"})
+            start, stop = span
+            status = 206
+        response = current_app.response_class(
+            backup_catalog.iter_tar(path, start, stop), status=status, mimetype="application/x-tar",
+            headers={"Content-Disposition": f'attachment; filename="{entry["name"]}.tar"',
+                     "Content-Length": str(stop - start), "Accept-Ranges": "bytes"},
+        )
+        if status == 206:
+            response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        if etag:
+            response.set_etag(etag)
+    return response  # ranges are not hashed: no X-Checksum-SHA256 (compare the assembled file with the full download's)
+
+
+@developer_bp.route("/backup/verify/<path:filename>", methods=["POST"])
+@developer_required
+def backup_verify(filename):
+    ok, message = backup_catalog.verify(os.path.basename(filename))
+    flash(f"{os.path.basename(filename)}: {message}", "success" if ok else "danger")
+    return redirect(url_for("developer.backup_list"))
 
 
 @developer_bp.route("/backup/restore", methods=["GET", "POST"])
@@ -239,30 +316,75 @@ def backup_restore():
     if confirm != "RESTORE" or confirm2 != "RESTORE":
         flash("You must type RESTORE in both boxes to confirm.", "danger")
         return redirect(url_for("developer.backup_restore"))
-    if not backup_path or not os.path.isfile(backup_path):
-        flash("Invalid backup file.", "danger")
+    job, error = restore_job.start(backup_path, current_user.id, current_user.username)
+    if job is None:
+        flash(error, "danger")
+        return redirect(url_for("developer.backup_list"))
+    log_restore_db(current_user.id, current_user.username, job["backup"])
+    return redirect(url_for("developer.restore_progress", job_id=job["id"]))
+
+
+@developer_bp.route("/backup/restore/<job_id>")
+@developer_required
+def restore_progress(job_id):
+    job = restore_job.current()
+    if not job or job["id"] != job_id:
+        flash("That restore job is no longer known.", "warning")
         return redirect(url_for("developer.backup_list"))
-    log_restore_db(current_user.id, current_user.username, backup_path)
-    success, err = restore_from_file(backup_path, current_user.id, current_user.username)
-    if success:
-        flash("Database restored. All users were logged out.", "success")
+    return render_template("developer/restore_progress.html", job=job, token=restore_job.progress_token(job_id))
+
+
+@developer_bp.route("/backup/restore/<job_id>/status")
+@developer_required
+def restore_status(job_id):
+    job = restore_job.current()
+    if not job or job["id"] != job_id:
+        abort(404)
+    fields = ("id", "backup", "phase", "running", "done", "total", "unit", "message", "maintenance",
+              "started_by", "started_at", "updated_at", "finished_at")
+    response = jsonify({field: job.get(field) for field in fields})
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@developer_bp.route("/backup/restore/progress")
+def restore_progress_poll():
+    """
+    Phase and progress numbers for the progress page, authorized by the X-Restore-Token header
+    (restore_job.progress_token) instead of the session: the restore logs everyone out and may
+    drop the users table while it is polled. The page polls without cookies, so no user is loaded.
+    """
+    progress = restore_job.progress_for_token(request.headers.get("X-Restore-Token"))
+    if progress is None:
+        abort(404)
+    response = jsonify(progress)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@developer_bp.route("/backup/restore/<job_id>/cancel", methods=["POST"])
+@developer_required
+def restore_cancel(job_id):
+    if restore_job.cancel(job_id):
+        flash("Cancel requested; the restore stops at its next progress step.", "warning")
     else:
-        flash("Restore failed: " + (err or "unknown"), "danger")
-    return redirect(url_for("developer.backup_list"))
+        flash("The restore is not running.", "info")
+    return redirect(url_for("developer.restore_progress", job_id=job_id))
 
 
 @developer_bp.route("/logout-all", methods=["POST"])
 @developer_required
 def logout_all():
-    flush_all_sessions()
-    log_logout_all(current_user.id, current_user.username)
-    flash("All sessions have been logged out.", "success")
+    count = flush_all_sessions()
+    log_logout_all(current_user.id, current_user.username, count)
+    flash(f"All sessions have been logged out ({count} removed).", "success")
     return redirect(url_for("developer.dashboard"))
 
 
 # ---- Audit logs (developer view) ----
 @developer_bp.route("/audit-logs")
 @developer_required
+@replica_reads
 def audit_logs():
     page = request.args.get("page", 1, type=int)
     from ..config import ITEMS_PER_PAGE
@@ -275,4 +397,174 @@ def audit_logs():
 @developer_bp.route("/sessions")
 @developer_required
 def active_sessions():
-    return render_template("developer/active_sessions.html", count=get_active_sessions_count())
+    from datetime import datetime
+    by_user = list_active_sessions()
+    users = {u.id: u for u in User.query.filter(User.id.in_(list(by_user))).all()} if by_user else {}
+    rows = []
+    for user_id, sessions in by_user.items():
+        rows.append({
+            "user_id": user_id,
+            "user": users.get(user_id),
+            "sessions": [(sid, datetime.utcfromtimestamp(ts)) for sid, ts in sessions],
+        })
+    rows.sort(key=lambda row: row["sessions"][0][1], reverse=True)
+    count = sum(len(row["sessions"]) for row in rows)
+    window_minutes = int(PERMANENT_SESSION_LIFETIME.total_seconds() // 60)  # the index cutoff (_active_cutoff)
+    return render_template("developer/active_sessions.html", count=count, rows=rows, window_minutes=window_minutes)
+
+
+@developer_bp.route("/sessions/<int:user_id>/revoke", methods=["POST"])
+@developer_required
+def revoke_sessions(user_id):
+    user = User.query.get_or_404(user_id)
+    sid = request.form.get("sid") or None
+    count = revoke_user_sessions(user.id, sid=sid)
+    log_sessions_revoked(current_user.id, current_user.username, user.username, count)
+    flash(f"Revoked {count} session(s) for {user.username}.", "success")
+    return redirect(url_for("developer.active_sessions"))
+
+
+# ---- Slow query log ----
+@developer_bp.route("/slow-queries")
+@developer_required
+def slow_queries():
+    from datetime import datetime
+    try:
+        records = slow_query_log.entries()
+    except Exception:
+        records = []
+        flash("Could not read the slow query log.", "warning")
+    groups = slow_query_log.top_offenders(records)
+    for group in groups:
+        group["last_seen"] = datetime.utcfromtimestamp(group["last_at"])
+    return render_template(
+        "developer/slow_queries.html",
+        groups=groups,
+        count=len(records),
+        enabled=current_app.config.get("SLOW_QUERY_LOG"),
+        threshold_ms=current_app.config["SLOW_QUERY_MS"],
+        buffer_size=current_app.config["SLOW_QUERY_BUFFER"],
+    )
+
+
+@developer_bp.route("/slow-queries/clear", methods=["POST"])
+@developer_required
+def slow_queries_clear():
+    try:
+        slow_query_log.clear()
+        flash("Slow query log cleared.", "success")
+    except Exception:
+        flash("Could not clear the slow query log.", "danger")
+    return redirect(url_for("developer.slow_queries"))
+
+
+# ---- Request traces ----
+@developer_bp.route("/traces")
+@developer_required
+def traces():
+    from datetime import datetime
+    trace_id = request.args.get("id", "").strip()
+    if trace_id:
+        return redirect(url_for("developer.trace_detail", trace_id=trace_id))
+    rows = tracing.recent(100)
+    for row in rows:
+        row["at"] = datetime.utcfromtimestamp(row["at"])
+    return render_template(
+        "developer/traces.html",
+        rows=rows,
+        enabled=current_app.config.get("TRACING"),
+        sample_rate=current_app.config["TRACE_SAMPLE_RATE"],
+    )
+
+
+@developer_bp.route("/traces/<trace_id>")
+@developer_required
+def trace_detail(trace_id):
+    from datetime import datetime
+    trace = tracing.find(trace_id)
+    if trace is None:
+        flash(f"Trace {trace_id} not found (it may have been rotated out).", "warning")
+        return redirect(url_for("developer.traces"))
+    trace["at"] = datetime.utcfromtimestamp(trace["at"])
+    totals = {}
+    for name, category, start, duration, detail in trace["spans"]:
+        count, ms = totals.get(category, (0, 0.0))
+        totals[category] = (count + 1, ms + duration)
+    return render_template("developer/trace_detail.html", trace=trace, rows=tracing.waterfall(trace),
+                           totals=sorted(totals.items(), key=lambda kv: kv[1][1], reverse=True))
+
+
+# ---- Worker memory ----
+@developer_bp.route("/memory")
+@developer_required
+def memory():
+    from datetime import datetime
+    try:
+        records = memory_profiler.samples()
+    except Exception:
+        records = []
+        flash("Could not read the memory samples.", "warning")
+    groups = memory_profiler.summarize(records)
+    for row in groups + records:
+        for key in ("at", "first_at", "last_at"):
+            if key in row:
+                row[key] = datetime.utcfromtimestamp(row[key])
+    workers = memory_profiler.workers()
+    for row in workers:
+        row["at"] = datetime.utcfromtimestamp(row["at"])
+    snapshots = memory_profiler.list_snapshots()
+    for snap in snapshots:
+        snap["at"] = datetime.utcfromtimestamp(snap["at"])
+    report, title = None, None
+    old, new = request.args.get("old"), request.args.get("new")
+    try:
+        if old and new:
+            report, title = memory_profiler.compare(old, new), f"{old} → {new}"
+        elif new:
+            report, title = memory_profiler.top_sites(new), new
+    except (OSError, ValueError) as e:
+        flash(f"Could not read snapshot: {e}", "danger")
+    return render_template(
+        "developer/memory.html",
+        status=memory_profiler.worker_status(),
+        workers=workers,
+        enabled=current_app.config.get("MEMORY_PROFILING"),
+        min_growth_mb=current_app.config["MEMORY_RECORD_MIN_MB"],
+        groups=groups,
+        records=records[:50],
+        worker_rows=memory_profiler.endpoint_stats(),
+        snapshots=snapshots,
+        report=report,
+        report_title=title,
+        diff=bool(old and new),
+    )
+
+
+@developer_bp.route("/memory/tracemalloc", methods=["POST"])
+@developer_required
+def memory_tracemalloc():
+    action = request.form.get("action")
+    pid = request.form.get("pid", type=int)  # missing or "all": every worker
+    target = f"worker {pid}" if pid else "all workers"
+    if not current_app.config.get("MEMORY_PROFILING"):
+        flash("tracemalloc control needs MEMORY_PROFILING on.", "warning")
+    elif action not in memory_profiler.ACTIONS:
+        flash("Unknown tracemalloc action.", "danger")
+    elif pid == os.getpid():
+        flash(f"Worker {pid}: {memory_profiler.apply(action)}.", "success")  # the serving worker: at once
+    elif memory_profiler.send(action, pid):
+        flash(f"Sent {action} to {target}; the workers table shows the result within a few seconds.", "success")
+    else:
+        flash(f"Cannot reach {target} without Redis or the local store.", "danger")
+    return redirect(url_for("developer.memory"))
+
+
+@developer_bp.route("/memory/clear", methods=["POST"])
+@developer_required
+def memory_clear():
+    try:
+        memory_profiler.clear_samples()
+        flash("Memory samples cleared.", "success")
+    except Exception:
+        flash("Could not clear the memory samples.", "danger")
+    return redirect(url_for("developer.memory"))
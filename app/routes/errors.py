@@ -1,7 +1,8 @@
 """
 Custom error pages. No stack traces in production.
 """
-from flask import render_template, redirect, url_for
+from flask import render_template, redirect, url_for, g
+from ..services.password_service import PasswordHasherBusy
 
 
 def register_error_handlers(app):
@@ -17,6 +18,15 @@ def register_error_handlers(app):
     def not_found(e):
         return render_template("errors/404.html"), 404
 
+    @app.errorhandler(429)
+    def too_many_requests(e):
+        retry_after = g.get("retry_after") or 60
+        return render_template("errors/429.html", retry_after=retry_after), 429, {"Retry-After": str(retry_after)}
+
+    @app.errorhandler(PasswordHasherBusy)
+    def hasher_busy(e):
+        return render_template("errors/503.html"), 503, {"Retry-After": "5"}
+
     @app.errorhandler(500)
     def server_error(e):
         if not app.debug:
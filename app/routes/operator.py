@@ -12,4 +12,4 @@ operator_bp = Blueprint("operator", __name__)
 @operator_or_above
 def dashboard():
     lines = Line.query.filter_by(is_active=True).order_by(Line.code).all()
-    return render_template("operator/dashboard.html", lines=lines)
+    return render_template("operators/dashboard.html", lines=lines)
@@ -4,10 +4,13 @@ Does not modify TD master.
 """
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import current_user
+from sqlalchemy.orm import joinedload
 from ..extensions import db
 from ..models import Line, FGCode, TDItem, Verification, VerificationItem
-from ..decorators import operator_or_above
+from ..decorators import operator_or_above, rate_limit
+from ..config import SUBMIT_RATE_LIMIT, SUBMIT_RATE_WINDOW_SECONDS
 from ..services.audit_service import log_verification_submit
+from ..services.metrics_service import enabled as metrics_enabled, inc
 
 verification_bp = Blueprint("verification", __name__)
 
@@ -37,6 +40,7 @@ def load_checklist(fg_id):
 
 @verification_bp.route("/fg/<int:fg_id>/submit", methods=["POST"])
 @operator_or_above
+@rate_limit("submit", SUBMIT_RATE_LIMIT, SUBMIT_RATE_WINDOW_SECONDS)
 def submit_checklist(fg_id):
     fg = FGCode.query.filter_by(id=fg_id, is_active=True).first_or_404()
     items = TDItem.query.filter_by(fg_id=fg_id, is_active=True).order_by(TDItem.item_code).all()
@@ -47,30 +51,38 @@ def submit_checklist(fg_id):
     ver = Verification(fg_id=fg_id, operator_id=current_user.id, notes=notes or None)
     db.session.add(ver)
     db.session.flush()
+    rows = []
     for item in items:
         key = f"actual_{item.id}"
         try:
             actual = float(request.form.get(key, 0) or 0)
         except ValueError:
             actual = 0
-        vi = VerificationItem(
-            verification_id=ver.id,
-            td_item_id=item.id,
-            expected_quantity=item.quantity,
-            actual_quantity=actual,
-            unit=item.unit,
-        )
-        db.session.add(vi)
+        rows.append({
+            "verification_id": ver.id,
+            "td_item_id": item.id,
+            "expected_quantity": item.quantity,
+            "actual_quantity": actual,
+            "unit": item.unit,
+        })
+    # One batched INSERT for all items, not one per item
+    db.session.execute(db.insert(VerificationItem), rows)
+    # Read before commit expires the objects (each would be loaded again)
+    ver_id, user_id, username, fg_code, line_code = ver.id, current_user.id, current_user.username, fg.code, fg.line.code
     db.session.commit()
-    log_verification_submit(current_user.id, current_user.username, ver.id, fg.code)
+    log_verification_submit(user_id, username, ver_id, fg_code)
+    if metrics_enabled():
+        inc("td_verification_submits_total", line_code)
     flash("Verification submitted successfully. It cannot be modified.", "success")
-    return redirect(url_for("verification.result", verification_id=ver.id))
+    return redirect(url_for("verification.result", verification_id=ver_id))
 
 
 @verification_bp.route("/result/<int:verification_id>")
 @operator_or_above
 def result(verification_id):
-    ver = Verification.query.get_or_404(verification_id)
+    ver = Verification.query.options(
+        joinedload(Verification.items).joinedload(VerificationItem.td_item)
+    ).filter_by(id=verification_id).first_or_404()
     # Ensure the current user can view this verification (same role rules as submit)
     fg = ver.fg_code
     return render_template("verification/result.html", verification=ver, fg=fg)
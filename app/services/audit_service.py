@@ -4,9 +4,11 @@ Audit logging. Never remove audit history when user is deactivated.
 from flask import request
 from ..extensions import db
 from ..models import AuditLog
+from .metrics_service import inc
 
 
-def log(user_id, username, action, resource=None, resource_id=None, details=None):
+def log(user_id, username, action, resource=None, resource_id=None, details=None, commit=True):
+    """Add an audit entry. With commit=False the caller commits it together with its own changes."""
     ip = request.remote_addr if request else None
     ua = request.user_agent.string[:255] if request and request.user_agent else None
     entry = AuditLog(
@@ -20,15 +22,17 @@ def log(user_id, username, action, resource=None, resource_id=None, details=None
         user_agent=ua,
     )
     db.session.add(entry)
-    db.session.commit()
+    inc("td_audit_writes_total", action)
+    if commit:
+        db.session.commit()
 
 
-def log_login_success(user_id, username):
-    log(user_id, username, "login_success", resource="auth")
+def log_login_success(user_id, username, commit=True):
+    log(user_id, username, "login_success", resource="auth", commit=commit)
 
 
-def log_login_failure(username, reason="invalid_credentials"):
-    log(None, username, "login_failure", details=reason)
+def log_login_failure(username, reason="invalid_credentials", commit=True):
+    log(None, username, "login_failure", details=reason, commit=commit)
 
 
 def log_logout(user_id, username):
@@ -60,8 +64,12 @@ def log_maintenance_toggle(by_user_id, by_username, enabled):
     log(by_user_id, by_username, "maintenance_toggle", details=f"enabled={enabled}")
 
 
-def log_logout_all(by_user_id, by_username):
-    log(by_user_id, by_username, "logout_all_sessions")
+def log_logout_all(by_user_id, by_username, count=None):
+    log(by_user_id, by_username, "logout_all_sessions", details=f"sessions={count}" if count is not None else None)
+
+
+def log_sessions_revoked(by_user_id, by_username, target_username, count):
+    log(by_user_id, by_username, "sessions_revoked", resource="user", resource_id=target_username, details=f"sessions={count}")
 
 
 def log_restore_db(by_user_id, by_username, backup_file):
@@ -0,0 +1,269 @@
+"""
+Backup catalog: BACKUP_DIR/catalog.json describes every backup, so pages list backups without
+globbing and stat-ing BACKUP_DIR.
+
+Each entry holds name, format, created_at, size, duration_s, sha256, db_version, schema_version,
+table_rows and verified_at. run_backup adds an entry and prune_old_backups removes them; every
+change rewrites the whole file under an flock and renames it into place, so readers (no lock)
+always see a complete catalog. A missing catalog is rebuilt from the files on disk, without
+checksums or row counts; `flask backup-verify` checks every backup and records missing checksums.
+
+Checksums are SHA-256 of the bytes a download delivers: the file itself, or for a .pgdump
+directory the tar stream it is downloaded as (iter_tar), so `sha256sum` of a download can be
+compared with the catalog.
+"""
+import glob
+import hashlib
+import json
+import os
+import tarfile
+from contextlib import contextmanager
+from datetime import datetime
+from ..config import BACKUP_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized
+    fcntl = None
+
+CATALOG = "catalog.json"
+BACKUP_PATTERNS = ("td_backup_*.pgdump", "td_backup_*.sql", "td_backup_*.db")
+
+
+def backup_format(name):
+    return name.rsplit(".", 1)[-1]
+
+
+def _stamp_time(name):
+    """Creation time encoded in td_backup_<YYYYmmdd_HHMMSS>.<ext>, as a Unix timestamp (0 if absent)."""
+    try:
+        return int(datetime.strptime(name[len("td_backup_"):].split(".")[0], "%Y%m%d_%H%M%S").timestamp())
+    except ValueError:
+        return 0
+
+
+# ---- tar stream of .pgdump directories ----
+
+def tar_layout(path):
+    """
+    Parts of the tar stream of a directory archive (bytes, or (file path, size) for file contents)
+    and its total length. Member times come from the backup's name, so the stream, and its
+    checksum, only change when the files do.
+    """
+    name = os.path.basename(path)
+    mtime = _stamp_time(name)
+    info = tarfile.TarInfo(name)
+    info.type, info.mode, info.mtime = tarfile.DIRTYPE, 0o755, mtime
+    parts = [info.tobuf(tarfile.PAX_FORMAT)]
+    for entry in sorted(os.scandir(path), key=lambda e: e.name):
+        if not entry.is_file():
+            continue
+        size = entry.stat().st_size
+        info = tarfile.TarInfo(f"{name}/{entry.name}")
+        info.size, info.mode, info.mtime = size, 0o644, mtime
+        parts.append(info.tobuf(tarfile.PAX_FORMAT))
+        parts.append((entry.path, size))
+        if size % tarfile.BLOCKSIZE:
+            parts.append(tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE))
+    parts.append(tarfile.NUL * (2 * tarfile.BLOCKSIZE))
+    return parts, sum(len(p) if isinstance(p, bytes) else p[1] for p in parts)
+
+
+def iter_tar(path, start=0, stop=None, block=1 << 20):
+    """Bytes start..stop of the tar stream of a directory archive (all of it by default)."""
+    parts, total = tar_layout(path)
+    stop = total if stop is None else min(stop, total)
+    offset = 0
+    for part in parts:
+        length = len(part) if isinstance(part, bytes) else part[1]
+        lo, hi = max(start - offset, 0), min(stop - offset, length)
+        if lo < hi:
+            if isinstance(part, bytes):
+                yield part[lo:hi]
+            else:
+                with open(part[0], "rb") as f:
+                    f.seek(lo)
+                    remaining = hi - lo
+                    while remaining > 0:
+                        chunk = f.read(min(block, remaining))
+                        if not chunk:
+                            raise OSError(f"{part[0]} shrank while streaming")
+                        remaining -= len(chunk)
+                        yield chunk
+        offset += length
+        if offset >= stop:
+            break
+
+
+def download_size(path):
+    """Bytes a download of the backup delivers."""
+    return tar_layout(path)[1] if os.path.isdir(path) else os.path.getsize(path)
+
+
+def _download_chunks(path, block):
+    if os.path.isdir(path):
+        yield from iter_tar(path, block=block)
+    else:
+        with open(path, "rb") as f:
+            yield from iter(lambda: f.read(block), b"")
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def iter_verified(path, expected, block=1 << 20):
+    """
+    Download chunks of a backup, hashed as they are read. The last block is held back until the
+    SHA-256 is known: on a mismatch ChecksumMismatch is raised instead, so the client receives
+    fewer bytes than Content-Length and discards the download.
+    """
+    sha = hashlib.sha256()
+    held = None
+    for chunk in _download_chunks(path, block):
+        sha.update(chunk)
+        if held is not None:
+            yield held
+        held = chunk
+    actual = sha.hexdigest()
+    if actual != expected:
+        raise ChecksumMismatch(f"{os.path.basename(path)}: catalog {expected[:12]}, file {actual[:12]}")
+    if held is not None:
+        yield held
+
+
+def checksum(path, block=1 << 20, progress=None):
+    """SHA-256 of the download of a backup (see module docstring). progress(bytes read) after each block."""
+    sha = hashlib.sha256()
+    done = 0
+    for chunk in _download_chunks(path, block):
+        sha.update(chunk)
+        done += len(chunk)
+        if progress:
+            progress(done)
+    return sha.hexdigest()
+
+
+# ---- catalog file ----
+
+def _catalog_path():
+    return os.path.join(BACKUP_DIR, CATALOG)
+
+
+@contextmanager
+def _write_lock():
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    with open(os.path.join(BACKUP_DIR, ".catalog.lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield  # closing the file releases the lock
+
+
+def _read():
+    try:
+        with open(_catalog_path()) as f:
+            return json.load(f)["backups"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write(entries):
+    path = _catalog_path()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    entries = sorted(entries, key=lambda e: e["created_at"], reverse=True)
+    with open(tmp, "w") as f:
+        json.dump({"version": 1, "backups": entries}, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _scan():
+    """Entries for the backup files on disk (no checksums or row counts)."""
+    entries = []
+    for pattern in BACKUP_PATTERNS:
+        for path in glob.glob(os.path.join(BACKUP_DIR, pattern)):
+            try:
+                mtime = os.path.getmtime(path)
+                size = download_size(path)
+            except OSError:
+                continue
+            name = os.path.basename(path)
+            entries.append({
+                "name": name, "format": backup_format(name),
+                "created_at": datetime.utcfromtimestamp(mtime).isoformat(sep=" ", timespec="seconds"),
+                "size": size, "duration_s": None, "sha256": None, "db_version": None,
+                "schema_version": None, "table_rows": None, "verified_at": None,
+            })
+    return entries
+
+
+def rebuild():
+    """Replace the catalog with entries for the files on disk, keeping what is known about them."""
+    with _write_lock():
+        known = {e["name"]: e for e in (_read() or [])}
+        entries = [known.get(e["name"], e) for e in _scan()]
+        _write(entries)
+    return entries
+
+
+def entries():
+    """Catalog entries, newest first (created_at as datetime). Rebuilt from disk if missing."""
+    data = _read()
+    if data is None:
+        data = rebuild()
+    result = []
+    for entry in data:
+        entry = dict(entry)
+        entry["created_at"] = datetime.fromisoformat(entry["created_at"])
+        entry["path"] = os.path.join(BACKUP_DIR, entry["name"])
+        result.append(entry)
+    return sorted(result, key=lambda e: e["created_at"], reverse=True)
+
+
+def get(name):
+    """Catalog entry of backup name, or None."""
+    return next((e for e in entries() if e["name"] == name), None)
+
+
+def add(entry):
+    with _write_lock():
+        data = [e for e in (_read() or _scan()) if e["name"] != entry["name"]]
+        data.append(entry)
+        _write(data)
+
+
+def remove(names):
+    names = set(names)
+    if not names:
+        return
+    with _write_lock():
+        _write([e for e in (_read() or []) if e["name"] not in names])
+
+
+def update(name, **fields):
+    with _write_lock():
+        data = _read() or []
+        for entry in data:
+            if entry["name"] == name:
+                entry.update(fields)
+        _write(data)
+
+
+def verify(name):
+    """Recompute the checksum of a backup. Returns (ok, message); records it if it was unknown."""
+    entry = get(name)
+    if entry is None:
+        return False, "Not in the backup catalog"
+    try:
+        actual = checksum(entry["path"])
+    except OSError as e:
+        return False, f"Cannot read backup: {e}"
+    now = datetime.utcnow().isoformat(sep=" ", timespec="seconds")
+    if entry["sha256"] is None:
+        update(name, sha256=actual, size=download_size(entry["path"]), verified_at=now)
+        return True, "Checksum recorded"
+    if actual != entry["sha256"]:
+        return False, f"Checksum mismatch: catalog {entry['sha256'][:12]}, file {actual[:12]}"
+    update(name, verified_at=now)
+    return True, "Checksum verified"
@@ -1,15 +1,36 @@
 """
 Database backup and restore. Automatic daily backup; 30-day retention.
-Restore: double confirmation, optional password, maintenance mode, flush Redis.
+Restores run as background jobs (restore_job: maintenance mode, progress, cancellation, session
+flush); restore_from_file only replaces the database and reports progress.
+PostgreSQL backups are pg_dump directory-format archives (.pgdump directories): one compressed
+file per table, dumped with BACKUP_JOBS parallel jobs and restored with parallel pg_restore.
+Legacy plain .sql dumps are still listed and restored through psql. SQLite uses the online backup
+API (.db files), which copies a consistent snapshot while workers keep reading and writing.
 """
 import os
+import re
+import shutil
+import signal
+import sqlite3
 import subprocess
-import glob
+import threading
+import time
+from collections import deque
 from datetime import datetime, timedelta
 from ..extensions import db
-from .maintenance_service import set_maintenance_mode
-from .session_service import flush_all_sessions
-from ..config import BACKUP_DIR, BACKUP_RETENTION_DAYS
+from . import backup_catalog
+from ..config import (
+    BACKUP_COMPRESSION,
+    BACKUP_DIR,
+    BACKUP_JOBS,
+    BACKUP_RESTORE_TIMEOUT_SECONDS,
+    BACKUP_RETENTION_DAYS,
+    BACKUP_TIMEOUT_SECONDS,
+)
+
+
+class RestoreCancelled(Exception):
+    """A restore stopped because its cancelled() hook returned True."""
 
 
 def ensure_backup_dir():
@@ -21,107 +42,330 @@ def get_db_url():
     return current_app.config["SQLALCHEMY_DATABASE_URI"]
 
 
+def _sqlite_copy(src_path, dst_path, progress=None, cancelled=None):
+    """
+    Online page-by-page copy between SQLite files; waits for the writer lock instead of failing.
+    progress(bytes copied, total bytes) is called after every 1024 pages. When cancelled() returns
+    True the copy stops with RestoreCancelled and the destination is left as it was.
+    """
+    from flask import current_app
+    timeout = current_app.config.get("SQLITE_BUSY_TIMEOUT_MS", 10000) / 1000
+    src = sqlite3.connect(src_path, timeout=timeout)
+    dst = sqlite3.connect(dst_path, timeout=timeout)
+
+    def step(status, remaining, total):
+        if cancelled and cancelled():
+            raise RestoreCancelled()
+        if progress:
+            progress((total - remaining) * page_size, total * page_size)
+
+    try:
+        page_size = src.execute("PRAGMA page_size").fetchone()[0]
+        src.backup(dst, pages=1024, progress=step if progress or cancelled else None)
+    finally:
+        src.close()
+        dst.close()
+
+
+def _run_sqlite_backup(url):
+    from .sqlite_tuning import sqlite_path
+    path = sqlite_path(url)
+    if not path:
+        return None
+    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    backup_path = os.path.join(BACKUP_DIR, f"td_backup_{stamp}.db")
+    try:
+        _sqlite_copy(path, backup_path)
+        return backup_path
+    except sqlite3.Error:
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+        return None
+
+
+def _pg_connection(url, dbname=None):
+    """(connection arguments, environment) for pg_dump / pg_restore / psql from a PostgreSQL URL."""
+    from urllib.parse import urlparse
+    parsed = urlparse(url)
+    env = os.environ.copy()
+    if parsed.password:
+        env["PGPASSWORD"] = parsed.password
+    args = [
+        "-h", parsed.hostname or "localhost",
+        "-p", str(parsed.port or 5432),
+        "-U", parsed.username or "postgres",
+        "-d", dbname or parsed.path.lstrip("/") or "td_checklist",
+    ]
+    return args, env
+
+
+def _pg_dump(url, path, jobs=None):
+    """Directory-format dump into path, written to a temporary name and renamed when complete."""
+    args, env = _pg_connection(url)
+    tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    cmd = ["pg_dump", *args, "-F", "d", "-j", str(jobs or BACKUP_JOBS), "-Z", str(BACKUP_COMPRESSION),
+           "-f", tmp_path, "--no-owner", "--no-acl"]
+    try:
+        subprocess.run(cmd, env=env, check=True, capture_output=True, timeout=BACKUP_TIMEOUT_SECONDS)
+        os.rename(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+# pg_restore --verbose reports each object it creates or loads on one of these lines
+_PG_RESTORE_ITEM = re.compile(r"^pg_restore: (creating|processing data for table|executing) ")
+
+
+def _pg_toc_size(path):
+    """Number of objects in the table of contents of a directory archive (pg_restore -l)."""
+    listing = subprocess.run(["pg_restore", "-l", path], check=True, capture_output=True, text=True, timeout=120)
+    return sum(1 for line in listing.stdout.splitlines() if line and not line.startswith(";"))
+
+
+def _kill(proc):
+    """Stop a restore client and the parallel workers it forked (its own process group)."""
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGTERM)
+        else:
+            proc.terminate()
+        proc.wait(timeout=10)
+    except ProcessLookupError:
+        pass
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def _run_restore_client(cmd, env, stdin_path=None, count_line=None, progress=None, cancelled=None, started=None):
+    """
+    Run pg_restore or psql under supervision. started(pid, program) is called once the client runs,
+    progress(units) every half second with the bytes of stdin_path streamed to the client so far, or
+    the stderr lines matching count_line.
+    Raises RestoreCancelled when cancelled() returns True, subprocess.TimeoutExpired after
+    BACKUP_RESTORE_TIMEOUT_SECONDS (the client is killed in both cases) and CalledProcessError,
+    with the end of stderr, if the client fails.
+    """
+    proc = subprocess.Popen(cmd, env=env, stdin=subprocess.PIPE if stdin_path else subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+    if started:
+        started(proc.pid, cmd[0])
+    tail = deque(maxlen=50)
+    done = [0]
+
+    def read_stderr():
+        for raw in proc.stderr:
+            line = raw.decode(errors="replace").rstrip()
+            tail.append(line)
+            if count_line and count_line(line):
+                done[0] += 1
+
+    def feed_stdin():
+        try:
+            with open(stdin_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    proc.stdin.write(chunk)
+                    done[0] += len(chunk)
+        except OSError:
+            pass  # client exited early; its exit status says why
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    threads = [threading.Thread(target=read_stderr, daemon=True)]
+    if stdin_path:
+        threads.append(threading.Thread(target=feed_stdin, daemon=True))
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + BACKUP_RESTORE_TIMEOUT_SECONDS
+    stopped = None
+    while True:
+        try:
+            proc.wait(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        if progress:
+            progress(done[0])
+        if cancelled and cancelled():
+            stopped = RestoreCancelled()
+        elif time.monotonic() > deadline:
+            stopped = subprocess.TimeoutExpired(cmd, BACKUP_RESTORE_TIMEOUT_SECONDS)
+        if stopped:
+            _kill(proc)
+            break
+    for thread in threads:
+        thread.join(timeout=10)
+    if stopped:
+        raise stopped
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr="\n".join(tail))
+    if progress:
+        progress(done[0])
+
+
+def _pg_restore(url, path, dbname=None, jobs=None, progress=None, cancelled=None, started=None):
+    """
+    Restore a .pgdump directory (parallel pg_restore) or a legacy .sql file (psql) into the database.
+    progress(done, total) counts archive objects for pg_restore (approximately: objects restored
+    by parallel workers are reported as they start) and bytes read for psql; started as for
+    _run_restore_client.
+    """
+    args, env = _pg_connection(url, dbname)
+    if os.path.isdir(path):
+        total = _pg_toc_size(path) if progress else 0
+        # --clean drops each object before recreating it, so the restore replaces the current schema
+        cmd = ["pg_restore", *args, "-j", str(jobs or BACKUP_JOBS), "--clean", "--if-exists",
+               "--no-owner", "--no-acl", "--exit-on-error", "--verbose", path]
+        _run_restore_client(cmd, env, count_line=_PG_RESTORE_ITEM.match, cancelled=cancelled, started=started,
+                            progress=progress and (lambda done: progress(min(done, total), total)))
+    else:
+        total = os.path.getsize(path)
+        _run_restore_client(["psql", *args, "-f", "-"], env, stdin_path=path, cancelled=cancelled, started=started,
+                            progress=progress and (lambda done: progress(done, total)))
+
+
+def _table_rows(url, backup_path):
+    """Rows per table: counted in the .db copy itself on SQLite, in the live database right after pg_dump."""
+    tables = [t.name for t in db.metadata.sorted_tables]
+    if url.startswith("sqlite"):
+        conn = sqlite3.connect(f"file:{backup_path}?mode=ro", uri=True)
+        try:
+            return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in tables}
+        finally:
+            conn.close()
+    with db.engine.connect() as conn:
+        return {t: conn.execute(db.text(f"SELECT COUNT(*) FROM {t}")).scalar() for t in tables}
+
+
+def _db_version(url):
+    if url.startswith("sqlite"):
+        return f"SQLite {sqlite3.sqlite_version}"
+    with db.engine.connect() as conn:
+        return "PostgreSQL " + conn.execute(db.text("SHOW server_version")).scalar()
+
+
+def _catalog_backup(url, path, duration):
+    """Record a new backup in the catalog; a backup is kept even if its metadata cannot be collected."""
+    from .migration_service import applied_versions
+    name = os.path.basename(path)
+    entry = {
+        "name": name, "format": backup_catalog.backup_format(name),
+        "created_at": datetime.utcnow().isoformat(sep=" ", timespec="seconds"),
+        "size": backup_catalog.download_size(path), "duration_s": round(duration, 3),
+        "sha256": backup_catalog.checksum(path), "db_version": None, "schema_version": None,
+        "table_rows": None, "verified_at": None,
+    }
+    try:
+        entry["db_version"] = _db_version(url)
+        entry["schema_version"] = max(applied_versions(), default=0)
+        entry["table_rows"] = _table_rows(url, path)
+    except Exception:
+        pass
+    backup_catalog.add(entry)
+
+
 def run_backup():
-    """Create a timestamped PostgreSQL dump. Returns path to backup file or None."""
+    """Create a timestamped database backup and catalog it. Returns path to backup file (or .pgdump directory) or None."""
     ensure_backup_dir()
     url = get_db_url()
-    if not url or url.startswith("sqlite"):
+    if not url:
         return None
-    # pg_dump style: extract connection params from URL
-    try:
-        from urllib.parse import urlparse
-        parsed = urlparse(url)
-        user = parsed.username
-        password = parsed.password
-        host = parsed.hostname or "localhost"
-        port = parsed.port or 5432
-        dbname = parsed.path.lstrip("/") or "td_checklist"
-        env = os.environ.copy()
-        if password:
-            env["PGPASSWORD"] = password
+    started = time.perf_counter()
+    if url.startswith("sqlite"):
+        path = _run_sqlite_backup(url)
+    else:
         stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        path = os.path.join(BACKUP_DIR, f"td_backup_{stamp}.sql")
-        cmd = [
-            "pg_dump",
-            "-h", host,
-            "-p", str(port),
-            "-U", user or "postgres",
-            "-d", dbname,
-            "-f", path,
-            "--no-owner",
-            "--no-acl",
-        ]
-        subprocess.run(cmd, env=env, check=True, capture_output=True, timeout=300)
-        return path
-    except Exception:
-        return None
+        path = os.path.join(BACKUP_DIR, f"td_backup_{stamp}.pgdump")
+        try:
+            _pg_dump(url, path)
+        except Exception:
+            path = None
+    if path:
+        _catalog_backup(url, path, time.perf_counter() - started)
+    return path
+
+
+def _remove_backup(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
 
 
 def prune_old_backups():
-    """Delete backups older than BACKUP_RETENTION_DAYS."""
+    """Delete cataloged backups older than BACKUP_RETENTION_DAYS."""
     ensure_backup_dir()
-    pattern = os.path.join(BACKUP_DIR, "td_backup_*.sql")
     cutoff = datetime.utcnow() - timedelta(days=BACKUP_RETENTION_DAYS)
-    for path in glob.glob(pattern):
+    removed = []
+    for entry in backup_catalog.entries():
+        if entry["created_at"] >= cutoff:
+            continue
         try:
-            if os.path.getmtime(path) < cutoff.timestamp():
-                os.remove(path)
-        except OSError:
+            _remove_backup(entry["path"])
+        except FileNotFoundError:
             pass
+        except OSError:
+            continue
+        removed.append(entry["name"])
+    backup_catalog.remove(removed)
+    return removed
 
 
 def list_backups():
-    """Return list of (filename, full_path, mtime) sorted by mtime desc."""
-    ensure_backup_dir()
-    pattern = os.path.join(BACKUP_DIR, "td_backup_*.sql")
-    files = []
-    for path in glob.glob(pattern):
-        try:
-            mtime = os.path.getmtime(path)
-            files.append((os.path.basename(path), path, datetime.fromtimestamp(mtime)))
-        except OSError:
-            pass
-    files.sort(key=lambda x: x[2], reverse=True)
-    return files
+    """Catalog entries, newest first: name, path, format, created_at, size, sha256, table_rows, ..."""
+    return backup_catalog.entries()
 
 
-def restore_from_file(backup_path, current_user_id, current_username):
+def restore_from_file(backup_path, current_user_id, current_username, progress=None, cancelled=None, started=None):
     """
-    Restore DB from backup. Caller must have confirmed.
-    Enables maintenance, flushes Redis, restores, then caller can disable maintenance.
+    Replace the live database with a backup. Caller must have confirmed and enabled maintenance
+    mode (restore_job runs this in the background and handles sessions afterwards).
+    progress(done, total) reports bytes (.db, .sql) or archive objects (.pgdump); a True
+    cancelled() stops the restore with RestoreCancelled; started(pid, program) reports the
+    PostgreSQL restore client. Returns (success, error message).
     """
-    if not os.path.isfile(backup_path):
+    if not os.path.exists(backup_path):
         return False, "Backup file not found"
-    set_maintenance_mode(True)
-    flush_all_sessions()
     url = get_db_url()
-    if not url or url.startswith("sqlite"):
-        set_maintenance_mode(False)
-        return False, "PostgreSQL required for restore"
+    if not url:
+        return False, "No database configured"
+    if url.startswith("sqlite"):
+        return _restore_sqlite(url, backup_path, progress, cancelled)
+    if not backup_path.endswith((".pgdump", ".sql")):
+        return False, "Not a PostgreSQL backup"
     try:
-        from urllib.parse import urlparse
-        parsed = urlparse(url)
-        user = parsed.username
-        password = parsed.password
-        host = parsed.hostname or "localhost"
-        port = parsed.port or 5432
-        dbname = parsed.path.lstrip("/") or "td_checklist"
-        env = os.environ.copy()
-        if password:
-            env["PGPASSWORD"] = password
-        cmd = [
-            "psql",
-            "-h", host,
-            "-p", str(port),
-            "-U", user or "postgres",
-            "-d", dbname,
-            "-f", backup_path,
-        ]
-        subprocess.run(cmd, env=env, check=True, capture_output=True, timeout=600)
+        db.session.remove()
+        _pg_restore(url, backup_path, progress=progress, cancelled=cancelled, started=started)
         return True, None
     except subprocess.CalledProcessError as e:
-        set_maintenance_mode(False)
-        return False, str(e.stderr or e) if isinstance(e.stderr, str) else "Restore failed"
+        stderr = e.stderr.decode(errors="replace") if isinstance(e.stderr, bytes) else e.stderr
+        return False, stderr.strip()[-500:] if stderr else "Restore failed"
+    except RestoreCancelled:
+        raise
     except Exception as e:
-        set_maintenance_mode(False)
+        return False, str(e)
+
+
+def _restore_sqlite(url, backup_path, progress=None, cancelled=None):
+    """Copy a .db backup over the live SQLite database in place (other workers see it on their next query)."""
+    from .sqlite_tuning import sqlite_path
+    path = sqlite_path(url)
+    if not path or not backup_path.endswith(".db"):
+        return False, "Not a SQLite backup"
+    try:
+        check = sqlite3.connect(f"file:{backup_path}?mode=ro", uri=True)
+        try:
+            result = check.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            check.close()
+        if result != "ok":
+            return False, f"Backup failed integrity check: {result}"
+        db.session.remove()
+        db.engine.dispose()
+        _sqlite_copy(backup_path, path, progress, cancelled)
+        return True, None
+    except sqlite3.Error as e:
         return False, str(e)
@@ -0,0 +1,550 @@
+"""
+Local store used in place of Redis when Redis is unreachable at startup.
+
+One SQLite database in WAL mode (LOCAL_STORE_PATH) shared by every worker on the host, so
+sessions, rate-limit counters and the maintenance flag stay consistent across Gunicorn
+workers without a network round trip. LocalRedis answers the redis-py calls the app makes from
+it, and get_redis() / get_session_redis() return that adapter, so services have one code path.
+Tables:
+  kv        strings with optional expiry (session blobs, cooldown markers, flags, job state)
+  zset      sorted sets (active session index)
+  ring      lists (LPUSH/LTRIM/LRANGE: slow query log, traces) and pub/sub channel backlogs
+  hits      sliding-window timestamps per rate-limit key (see sliding_window_hit)
+  expiry    EXPIRE deadlines of sorted sets and lists
+Expired strings, sorted sets and lists are ignored on read and replaced on write, as in Redis;
+expired rows of every table are deleted every LOCAL_STORE_SWEEP_SECONDS. Lua cannot run on
+SQLite: register_script() returns the native equivalent registered for the script with
+native_script().
+
+LocalRedis is not a redis.Redis: it has exactly the commands the app uses. A command it lacks
+raises AttributeError and is logged as an error, since callers of get_redis() usually swallow
+Redis failures; add the command here when a service starts using it.
+"""
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from flask_session.base import ServerSideSessionInterface
+from flask_session.defaults import Defaults
+from flask_session.redis import RedisSessionInterface
+
+_log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at);
+CREATE TABLE IF NOT EXISTS hits (
+    key TEXT NOT NULL,
+    at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hits_key_at ON hits (key, at);
+CREATE INDEX IF NOT EXISTS hits_expires ON hits (expires_at);
+CREATE TABLE IF NOT EXISTS zset (
+    key TEXT NOT NULL,
+    member TEXT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (key, member)
+);
+CREATE INDEX IF NOT EXISTS zset_key_score ON zset (key, score);
+CREATE TABLE IF NOT EXISTS ring (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    value BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ring_name_seq ON ring (name, seq);
+CREATE TABLE IF NOT EXISTS expiry (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+"""
+
+CHANNEL_PREFIX = "__pubsub__:"  # ring name of a pub/sub channel's backlog
+CHANNEL_BACKLOG = 100  # messages kept per channel for subscribers polling behind
+
+_KEY_TABLES = (("kv", "key"), ("zset", "key"), ("ring", "name"), ("hits", "key"))
+
+
+class LocalStore:
+    """Thread-safe handle to the shared SQLite store; one connection per thread and process."""
+
+    def __init__(self, path, busy_timeout_ms=5000, sweep_seconds=60):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.sweep_seconds = sweep_seconds
+        self._local = threading.local()
+        self._swept_at = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; last commits may be lost on power loss
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _write(self, fn):
+        """Run fn(conn) in a write transaction; BEGIN IMMEDIATE serializes writers across workers."""
+        result = self._transaction(fn)
+        self._maybe_sweep()
+        return result
+
+    def _transaction(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._swept_at < self.sweep_seconds:
+            return
+        self._swept_at = now
+
+        def sweep(conn):
+            conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            conn.execute("DELETE FROM hits WHERE expires_at <= ?", (now,))
+            expired = "SELECT key FROM expiry WHERE expires_at <= ?"
+            conn.execute(f"DELETE FROM zset WHERE key IN ({expired})", (now,))
+            conn.execute(f"DELETE FROM ring WHERE name IN ({expired})", (now,))
+            conn.execute("DELETE FROM expiry WHERE expires_at <= ?", (now,))
+
+        self._transaction(sweep)
+
+    # Rate limiting
+
+    def sliding_window_hit(self, keys, window_seconds, limit, cooldown_seconds, record=True):
+        """
+        Same contract as the Redis sliding-window script: keys is [window_1, blocked_1, ...].
+        Returns (allowed, cooldown_seconds). Runs in one write transaction across workers.
+        """
+        def run(conn):
+            now = time.time()
+            wait = 0
+            for blocked in keys[1::2]:
+                row = conn.execute("SELECT expires_at FROM kv WHERE key = ? AND expires_at > ?", (blocked, now)).fetchone()
+                if row:
+                    wait = max(wait, int(row[0] - now + 0.999))
+            if wait > 0:
+                return False, wait
+            if not record:
+                return True, 0
+            for window_key, blocked in zip(keys[::2], keys[1::2]):
+                conn.execute("DELETE FROM hits WHERE key = ? AND at <= ?", (window_key, now - window_seconds))
+                conn.execute("INSERT INTO hits (key, at, expires_at) VALUES (?, ?, ?)", (window_key, now, now + window_seconds))
+                count = conn.execute("SELECT COUNT(*) FROM hits WHERE key = ?", (window_key,)).fetchone()[0]
+                if count >= limit:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, '1', ?)",
+                        (blocked, now + cooldown_seconds),
+                    )
+                    conn.execute("DELETE FROM hits WHERE key = ?", (window_key,))
+                    wait = cooldown_seconds
+            return True, wait
+
+        if not record:
+            return run(self._conn())  # read-only check needs no write lock
+        return self._write(run)
+
+
+# Native equivalents of Lua scripts: source -> fn(store, keys, args)
+_native_scripts = {}
+
+
+def native_script(lua):
+    """Decorator registering fn(store, keys, args) as what LocalRedis runs for the Lua script lua."""
+    def register(fn):
+        _native_scripts[lua] = fn
+        return fn
+    return register
+
+
+def _command(write):
+    """LocalRedis method fn(self, conn, ...): run at once (in a write transaction if write) or queued on a pipeline."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def call(self, *args, **kwargs):
+            return self._execute(write, lambda conn: fn(self, conn, *args, **kwargs))
+        return call
+    return decorate
+
+
+def _seconds(value):
+    return value.total_seconds() if hasattr(value, "total_seconds") else value
+
+
+def _limit(conn, count_sql, name, start, end):
+    """(LIMIT, OFFSET) of the Redis index range start..end (negative indexes count from the end)."""
+    if start < 0 or end < -1:
+        length = conn.execute(count_sql, (name,)).fetchone()[0]
+        start = max(0, length + start) if start < 0 else start
+        end = length + end if end < 0 else end
+    if end == -1:
+        return -1, start
+    return max(0, end - start + 1), start
+
+
+_RING_COUNT = "SELECT COUNT(*) FROM ring WHERE name = ?"
+_ZSET_COUNT = "SELECT COUNT(*) FROM zset WHERE key = ?"
+
+
+def _expired(conn, name):
+    """True if the sorted set or list name has passed its EXPIRE deadline (reads treat it as empty)."""
+    return conn.execute(
+        "SELECT 1 FROM expiry WHERE key = ? AND expires_at <= ?", (name, time.time())
+    ).fetchone() is not None
+
+
+def _drop_if_expired(conn, name):
+    """Before a write: remove a sorted set or list whose deadline passed, so the write starts a new key."""
+    if _expired(conn, name):
+        conn.execute("DELETE FROM zset WHERE key = ?", (name,))
+        conn.execute("DELETE FROM ring WHERE name = ?", (name,))
+        conn.execute("DELETE FROM expiry WHERE key = ?", (name,))
+
+
+class LocalRedis:
+    """
+    The redis-py client calls the app makes, answered from a LocalStore. Values come back as str
+    with decode_responses (like the app's main client) and as bytes without (session blobs).
+    Flask-Session reaches it through LocalSessionInterface.
+    """
+
+    def __init__(self, store, decode_responses=True):
+        self.store = store
+        self.decode_responses = decode_responses
+
+    def __repr__(self):
+        return f"<LocalRedis({self.store.path!r})>"
+
+    def __getattr__(self, name):
+        # Only reached for names defined nowhere on the class: a Redis command not answered here
+        if name.startswith("_"):
+            raise AttributeError(name)
+        _log.error("LocalRedis does not implement %s; add it to services/local_store.py", name.upper())
+        raise AttributeError(f"LocalRedis does not implement {name.upper()}")
+
+    def _execute(self, write, call):
+        return self.store._write(call) if write else call(self.store._conn())
+
+    def _out(self, value):
+        if value is None:
+            return None
+        if self.decode_responses:
+            return value.decode() if isinstance(value, bytes) else str(value)
+        return value.encode() if isinstance(value, str) else value
+
+    @staticmethod
+    def _in(value):
+        if isinstance(value, (bytes, str)):
+            return value
+        return str(value)
+
+    def ping(self):
+        return True
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self.store, self.decode_responses)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return LocalPubSub(self)
+
+    def register_script(self, script):
+        native = _native_scripts.get(script)
+        if native is None:
+            _log.error("LocalRedis has no native equivalent of a Lua script; register one with native_script")
+            raise NotImplementedError("No native equivalent registered for this Lua script (see native_script)")
+
+        def run(keys=(), args=(), client=None):
+            return native(self.store, list(keys), list(args))
+        return run
+
+    # Keys
+
+    @_command(write=True)
+    def delete(self, conn, *names):
+        removed = 0
+        for name in names:
+            found = False
+            for table, column in _KEY_TABLES:
+                found |= conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (name,)).rowcount > 0
+            conn.execute("DELETE FROM expiry WHERE key = ?", (name,))
+            removed += found
+        return removed
+
+    unlink = delete
+
+    @_command(write=True)
+    def expire(self, conn, name, time_seconds):
+        now = time.time()
+        expires_at = now + _seconds(time_seconds)
+        if conn.execute(
+            "UPDATE kv SET expires_at = ? WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (expires_at, name, now)
+        ).rowcount:
+            return True
+        _drop_if_expired(conn, name)
+        if not conn.execute(
+            "SELECT 1 FROM zset WHERE key = ?1 UNION ALL SELECT 1 FROM ring WHERE name = ?1 LIMIT 1", (name,)
+        ).fetchone():
+            return False
+        conn.execute("INSERT OR REPLACE INTO expiry (key, expires_at) VALUES (?, ?)", (name, expires_at))
+        return True
+
+    def scan_iter(self, match=None, count=None, _type=None):
+        """Keys of every type matching the glob pattern match, fetched count at a time in key order."""
+        batch = count or 100
+        sql = " UNION ".join(
+            f"SELECT {column} FROM {table} WHERE {column} GLOB ?1 AND {column} > ?2"
+            + (" AND (expires_at IS NULL OR expires_at > ?3)" if table == "kv" else "")
+            + (f" AND {column} NOT IN (SELECT key FROM expiry WHERE expires_at <= ?3)" if table in ("zset", "ring") else "")
+            + (" AND name NOT GLOB ?4" if table == "ring" else "")
+            for table, column in _KEY_TABLES
+        ) + " ORDER BY 1 LIMIT ?5"
+        last = ""
+        while True:
+            rows = self.store._conn().execute(sql, (match or "*", last, time.time(), CHANNEL_PREFIX + "*", batch)).fetchall()
+            for (key,) in rows:
+                yield self._out(key)
+            if len(rows) < batch:
+                return
+            last = rows[-1][0]
+
+    # Strings
+
+    @_command(write=False)
+    def get(self, conn, name):
+        row = conn.execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (name, time.time())
+        ).fetchone()
+        return self._out(row[0]) if row else None
+
+    @_command(write=True)
+    def set(self, conn, name, value, ex=None, nx=False):
+        now = time.time()
+        expires_at = now + _seconds(ex) if ex else None
+        row = (name, self._in(value), expires_at)
+        if nx:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (name, now))
+            inserted = conn.execute("INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", row).rowcount
+            return True if inserted else None
+        conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", row)
+        return True
+
+    # Lists (newest first: LPUSH adds at index 0)
+
+    @_command(write=True)
+    def lpush(self, conn, name, *values):
+        _drop_if_expired(conn, name)
+        conn.executemany("INSERT INTO ring (name, value) VALUES (?, ?)", [(name, self._in(v)) for v in values])
+        return conn.execute("SELECT COUNT(*) FROM ring WHERE name = ?", (name,)).fetchone()[0]
+
+    @_command(write=True)
+    def ltrim(self, conn, name, start, end):
+        _drop_if_expired(conn, name)
+        conn.execute(
+            "DELETE FROM ring WHERE name = ?1 AND seq NOT IN "
+            "(SELECT seq FROM ring WHERE name = ?1 ORDER BY seq DESC LIMIT ?2 OFFSET ?3)",
+            (name, *_limit(conn, _RING_COUNT, name, start, end)),
+        )
+        return True
+
+    @_command(write=False)
+    def lrange(self, conn, name, start, end):
+        if _expired(conn, name):
+            return []
+        rows = conn.execute(
+            "SELECT value FROM ring WHERE name = ? ORDER BY seq DESC LIMIT ? OFFSET ?",
+            (name, *_limit(conn, _RING_COUNT, name, start, end)),
+        ).fetchall()
+        return [self._out(row[0]) for row in rows]
+
+    # Pub/sub (see LocalPubSub)
+
+    @_command(write=True)
+    def publish(self, conn, channel, message):
+        name = CHANNEL_PREFIX + channel
+        conn.execute("INSERT INTO ring (name, value) VALUES (?, ?)", (name, self._in(message)))
+        conn.execute(
+            "DELETE FROM ring WHERE name = ?1 AND seq NOT IN "
+            "(SELECT seq FROM ring WHERE name = ?1 ORDER BY seq DESC LIMIT ?2)",
+            (name, CHANNEL_BACKLOG),
+        )
+        return 0  # subscribers are not counted
+
+    # Sorted sets
+
+    @_command(write=True)
+    def zadd(self, conn, name, mapping):
+        _drop_if_expired(conn, name)
+        added = 0
+        for member, score in mapping.items():
+            member = self._in(member)
+            if conn.execute(
+                "INSERT OR IGNORE INTO zset (key, member, score) VALUES (?, ?, ?)", (name, member, score)
+            ).rowcount:
+                added += 1
+            else:
+                conn.execute("UPDATE zset SET score = ? WHERE key = ? AND member = ?", (score, name, member))
+        return added
+
+    @_command(write=True)
+    def zrem(self, conn, name, *members):
+        _drop_if_expired(conn, name)
+        if not members:
+            return 0
+        marks = ",".join("?" * len(members))
+        return conn.execute(
+            f"DELETE FROM zset WHERE key = ? AND member IN ({marks})", (name, *map(self._in, members))
+        ).rowcount
+
+    @_command(write=True)
+    def zremrangebyscore(self, conn, name, min, max):
+        _drop_if_expired(conn, name)
+        return conn.execute(
+            "DELETE FROM zset WHERE key = ? AND score BETWEEN ? AND ?", (name, float(min), float(max))
+        ).rowcount
+
+    @_command(write=False)
+    def zcount(self, conn, name, min, max):
+        if _expired(conn, name):
+            return 0
+        return conn.execute(
+            "SELECT COUNT(*) FROM zset WHERE key = ? AND score BETWEEN ? AND ?", (name, float(min), float(max))
+        ).fetchone()[0]
+
+    @_command(write=False)
+    def zscore(self, conn, name, member):
+        if _expired(conn, name):
+            return None
+        row = conn.execute("SELECT score FROM zset WHERE key = ? AND member = ?", (name, self._in(member))).fetchone()
+        return row[0] if row else None
+
+    @_command(write=False)
+    def zrange(self, conn, name, start, end, desc=False, withscores=False):
+        if _expired(conn, name):
+            return []
+        order = "DESC" if desc else "ASC"
+        rows = conn.execute(
+            f"SELECT member, score FROM zset WHERE key = ? ORDER BY score {order}, member {order} LIMIT ? OFFSET ?",
+            (name, *_limit(conn, _ZSET_COUNT, name, start, end)),
+        ).fetchall()
+        return self._members(rows, withscores)
+
+    @_command(write=False)
+    def zrevrangebyscore(self, conn, name, max, min, start=None, num=None, withscores=False):
+        if _expired(conn, name):
+            return []
+        rows = conn.execute(
+            "SELECT member, score FROM zset WHERE key = ? AND score BETWEEN ? AND ? "
+            "ORDER BY score DESC, member DESC LIMIT ? OFFSET ?",
+            (name, float(min), float(max), -1 if num is None else num, start or 0),
+        ).fetchall()
+        return self._members(rows, withscores)
+
+    def _members(self, rows, withscores):
+        if withscores:
+            return [(self._out(member), score) for member, score in rows]
+        return [self._out(member) for member, _ in rows]
+
+
+class LocalPipeline(LocalRedis):
+    """Queues commands and runs them in one write transaction on execute()."""
+
+    def __init__(self, store, decode_responses=True):
+        super().__init__(store, decode_responses)
+        self._queue = []
+
+    def _execute(self, write, call):
+        self._queue.append(call)
+        return self
+
+    def execute(self):
+        queue, self._queue = self._queue, []
+        if not queue:
+            return []
+        return self.store._write(lambda conn: [call(conn) for call in queue])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._queue = []
+
+
+class LocalPubSub:
+    """
+    SUBSCRIBE for LocalRedis: polls the channel backlogs PUBLISH writes to the ring table every
+    POLL_SECONDS. A subscriber sees messages published after it subscribed, in order, as long
+    as it falls no more than CHANNEL_BACKLOG messages behind.
+    """
+
+    POLL_SECONDS = 0.2
+
+    def __init__(self, client):
+        self.client = client
+        self.channels = {}  # channel -> last seq seen
+
+    def subscribe(self, *channels):
+        head = self.client.store._conn().execute("SELECT COALESCE(MAX(seq), 0) FROM ring").fetchone()[0]
+        for channel in channels:
+            self.channels[channel] = head
+
+    def unsubscribe(self, *channels):
+        for channel in channels or list(self.channels):
+            self.channels.pop(channel, None)
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        deadline = time.monotonic() + (timeout or 0)
+        conn = self.client.store._conn()
+        while True:
+            for channel, last in self.channels.items():
+                row = conn.execute(
+                    "SELECT seq, value FROM ring WHERE name = ? AND seq > ? ORDER BY seq LIMIT 1",
+                    (CHANNEL_PREFIX + channel, last),
+                ).fetchone()
+                if row:
+                    self.channels[channel] = row[0]
+                    return {"type": "message", "pattern": None, "channel": self.client._out(channel),
+                            "data": self.client._out(row[1])}
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(self.POLL_SECONDS, remaining))
+
+    def close(self):
+        self.channels = {}
+
+
+class LocalSessionInterface(RedisSessionInterface):
+    """Flask-Session's Redis session interface over LocalRedis (its constructor only accepts a redis.Redis)."""
+
+    def __init__(self, app, client):
+        self.client = client
+        config = app.config
+        ServerSideSessionInterface.__init__(
+            self,
+            app,
+            key_prefix=config.get("SESSION_KEY_PREFIX", Defaults.SESSION_KEY_PREFIX),
+            use_signer=config.get("SESSION_USE_SIGNER", Defaults.SESSION_USE_SIGNER),
+            permanent=config.get("SESSION_PERMANENT", Defaults.SESSION_PERMANENT),
+            sid_length=config.get("SESSION_ID_LENGTH", Defaults.SESSION_ID_LENGTH),
+            serialization_format=config.get("SESSION_SERIALIZATION_FORMAT", Defaults.SESSION_SERIALIZATION_FORMAT),
+        )
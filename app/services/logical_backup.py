@@ -0,0 +1,385 @@
+"""
+Incremental logical backups (`flask backup-logical`, `flask restore-logical`), on SQLite and PostgreSQL.
+
+A chain is one full base backup followed by incremental deltas. Each backup is a directory in
+LOGICAL_BACKUP_DIR holding one gzip JSON-lines segment per table and a manifest.json with the
+parent backup, watermark, schema version and each segment's rows, bytes and SHA-256. A backup
+is written to a temporary directory and renamed into place, so a listed backup is complete.
+
+A delta carries the rows whose WATERMARKS column (or parent row, for verification items) is at or
+after the parent's start minus LOGICAL_BACKUP_OVERLAP_SECONDS. The overlap catches transactions
+that stamped a row before the parent's snapshot but committed after it; rows seen twice are
+upserted on restore. Master data is soft-deleted and history is append-only, so deltas never
+carry deletions. Tables without a watermark are copied whole into every delta.
+
+All tables are read in one transaction (REPEATABLE READ on PostgreSQL, a WAL read snapshot on
+SQLite). Restore verifies every checksum of the chain first, then empties the tables and replays
+the base and the deltas in one transaction; a backup taken on one dialect restores into the other.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import Date, DateTime, Numeric, bindparam, or_, select
+from ..config import (
+    BACKUP_RETENTION_DAYS,
+    LOGICAL_BACKUP_DIR,
+    LOGICAL_BACKUP_FULL_EVERY,
+    LOGICAL_BACKUP_OVERLAP_SECONDS,
+)
+from ..extensions import db
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+BATCH_ROWS = 5000
+COMPRESSLEVEL = 3  # ~90% of level 9's ratio at a third of the CPU
+
+# Columns whose time marks a row as new or changed since the last backup
+WATERMARKS = {
+    "users": ("updated_at", "created_at"),
+    "lines": ("updated_at", "created_at"),
+    "fg_codes": ("updated_at", "created_at"),
+    "td_items": ("updated_at", "created_at"),
+    "verifications": ("verified_at",),
+    "audit_logs": ("created_at",),
+    "login_attempts": ("created_at",),
+}
+# Rows without a time of their own follow their parent: table -> (fk column, parent table, parent column)
+PARENT_WATERMARKS = {
+    "verification_items": ("verification_id", "verifications", "verified_at"),
+}
+
+
+class BackupChainError(Exception):
+    """A backup chain is incomplete, corrupt or does not match the database schema."""
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (date, Decimal)):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class _HashingWriter:
+    """File wrapper that hashes and counts the compressed bytes as they are written."""
+
+    def __init__(self, f):
+        self.f, self.sha, self.size = f, hashlib.sha256(), 0
+
+    def write(self, data):
+        self.sha.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+
+def _write_segment(path, rows):
+    """Write rows (iterable of tuples) as gzip JSON lines; returns (rows, bytes, sha256)."""
+    count = 0
+    with open(path, "wb") as f:
+        writer = _HashingWriter(f)
+        with gzip.GzipFile(fileobj=writer, mode="wb", compresslevel=COMPRESSLEVEL, mtime=0) as gz:
+            batch = []
+            for row in rows:
+                batch.append(json.dumps(tuple(row), default=_encode, separators=(",", ":")))
+                if len(batch) >= BATCH_ROWS:
+                    gz.write(("\n".join(batch) + "\n").encode())
+                    count += len(batch)
+                    batch = []
+            if batch:
+                gz.write(("\n".join(batch) + "\n").encode())
+                count += len(batch)
+    return count, writer.size, writer.sha.hexdigest()
+
+
+def _file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _schema_version():
+    from .migration_service import applied_versions
+    return max(applied_versions(), default=0)
+
+
+def _tables():
+    return db.metadata.sorted_tables  # parents before children
+
+
+def _changed_query(table, since):
+    """SELECT of the rows of table that a delta since `since` must carry."""
+    columns = WATERMARKS.get(table.name)
+    if columns:
+        if len(columns) == 1:
+            return select(table).where(table.c[columns[0]] >= since)
+        return select(table).where(or_(*(table.c[name] >= since for name in columns)))
+    parent = PARENT_WATERMARKS.get(table.name)
+    if parent:
+        fk, parent_name, column = parent
+        parent_table = db.metadata.tables[parent_name]
+        recent = select(parent_table.c.id).where(parent_table.c[column] >= since)
+        return select(table).where(table.c[fk].in_(recent))
+    return select(table)  # no watermark: whole table
+
+
+# ---- catalog ----
+
+def list_logical_backups():
+    """Manifests of all complete backups, oldest first."""
+    if not os.path.isdir(LOGICAL_BACKUP_DIR):
+        return []
+    manifests = []
+    for name in os.listdir(LOGICAL_BACKUP_DIR):
+        path = os.path.join(LOGICAL_BACKUP_DIR, name, MANIFEST)
+        try:
+            with open(path) as f:
+                manifests.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # temporary or damaged directory
+    return sorted(manifests, key=lambda m: m["started_at"])
+
+
+def backup_chain(backup_id, manifests=None):
+    """Manifests from the base backup up to backup_id. Raises BackupChainError if a link is missing."""
+    by_id = {m["id"]: m for m in (manifests if manifests is not None else list_logical_backups())}
+    chain, current = [], backup_id
+    while current is not None:
+        manifest = by_id.get(current)
+        if manifest is None:
+            raise BackupChainError(f"Backup {current} is missing" if chain else f"No backup {current}")
+        chain.append(manifest)
+        current = manifest["parent"]
+    return chain[::-1]
+
+
+def verify_chain(chain):
+    """Problems found in the segment files of a chain (empty list when every checksum matches)."""
+    problems = []
+    for manifest in chain:
+        for table, segment in manifest["segments"].items():
+            path = os.path.join(LOGICAL_BACKUP_DIR, manifest["id"], segment["file"])
+            try:
+                if os.path.getsize(path) != segment["bytes"] or _file_sha256(path) != segment["sha256"]:
+                    problems.append(f"{manifest['id']}/{segment['file']}: checksum mismatch")
+            except OSError:
+                problems.append(f"{manifest['id']}/{segment['file']}: missing")
+    return problems
+
+
+# ---- backup ----
+
+def run_logical_backup(full=False, progress=None):
+    """
+    Write a delta against the newest backup, or a new base when full=True, when there is none,
+    when its chain already has LOGICAL_BACKUP_FULL_EVERY deltas or when the schema changed.
+    progress(table, rows, seconds) is called after each segment. Returns the manifest.
+    """
+    engine = db.engine
+    dialect = engine.dialect.name
+    schema_version = _schema_version()
+    manifests = list_logical_backups()
+    parent = manifests[-1] if manifests and not full else None
+    if parent is not None:
+        try:
+            deltas = len(backup_chain(parent["id"], manifests)) - 1
+        except BackupChainError:
+            deltas = None  # broken chain: start a new one
+        if deltas is None or deltas >= LOGICAL_BACKUP_FULL_EVERY or parent["schema_version"] != schema_version:
+            parent = None
+    since = None
+    if parent is not None:
+        since = datetime.fromisoformat(parent["started_at"]) - timedelta(seconds=LOGICAL_BACKUP_OVERLAP_SECONDS)
+
+    started = datetime.utcnow()
+    kind = "incremental" if parent else "full"
+    backup_id = f"{started.strftime('%Y%m%d_%H%M%S_%f')}_{kind[:4]}"
+    os.makedirs(LOGICAL_BACKUP_DIR, exist_ok=True)
+    tmp_dir = os.path.join(LOGICAL_BACKUP_DIR, f".tmp_{backup_id}")
+    os.makedirs(tmp_dir)
+    clock = time.perf_counter()
+    segments = {}
+    try:
+        with engine.connect() as conn:
+            if dialect == "postgresql":
+                conn = conn.execution_options(isolation_level="REPEATABLE READ")
+            with conn.begin():  # one snapshot for all tables
+                for table in _tables():
+                    table_started = time.perf_counter()
+                    query = select(table) if since is None else _changed_query(table, since)
+                    result = conn.execution_options(yield_per=BATCH_ROWS).execute(query)
+                    name = f"{table.name}.jsonl.gz"
+                    rows, size, sha256 = _write_segment(os.path.join(tmp_dir, name), result)
+                    segments[table.name] = {"file": name, "rows": rows, "bytes": size, "sha256": sha256,
+                                            "columns": [c.name for c in table.columns]}
+                    if progress:
+                        progress(table.name, rows, time.perf_counter() - table_started)
+        manifest = {
+            "format": FORMAT,
+            "id": backup_id,
+            "kind": kind,
+            "parent": parent["id"] if parent else None,
+            "since": since.isoformat(sep=" ") if since else None,
+            "started_at": started.isoformat(sep=" "),
+            "duration_s": round(time.perf_counter() - clock, 3),
+            "dialect": dialect,
+            "schema_version": schema_version,
+            "segments": segments,
+        }
+        with open(os.path.join(tmp_dir, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_dir, os.path.join(LOGICAL_BACKUP_DIR, backup_id))
+        return manifest
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def prune_logical_backups():
+    """Delete whole chains whose newest backup is older than BACKUP_RETENTION_DAYS (never the current chain)."""
+    manifests = list_logical_backups()
+    if not manifests:
+        return []
+    cutoff = (datetime.utcnow() - timedelta(days=BACKUP_RETENTION_DAYS)).isoformat(sep=" ")
+    newest_by_base, base_of = {}, {}
+    for manifest in manifests:  # oldest first, so parents are seen before their children
+        base = base_of.get(manifest["parent"], manifest["id"]) if manifest["parent"] else manifest["id"]
+        base_of[manifest["id"]] = base
+        newest_by_base[base] = manifest["started_at"]
+    current = base_of[manifests[-1]["id"]]
+    removed = []
+    for manifest in manifests:
+        base = base_of[manifest["id"]]
+        if base != current and newest_by_base[base] < cutoff:
+            shutil.rmtree(os.path.join(LOGICAL_BACKUP_DIR, manifest["id"]), ignore_errors=True)
+            removed.append(manifest["id"])
+    return removed
+
+
+# ---- restore ----
+
+def _converters(table, columns):
+    """Per column: JSON value -> Python value the column type binds (dates and decimals are strings)."""
+    converters = []
+    for name in columns:
+        column = table.c.get(name)
+        if column is None:
+            converters.append(None)
+        elif isinstance(column.type, DateTime):
+            converters.append(datetime.fromisoformat)
+        elif isinstance(column.type, Date):
+            converters.append(date.fromisoformat)
+        elif isinstance(column.type, Numeric) and column.type.asdecimal:
+            converters.append(Decimal)
+        else:
+            converters.append(False)  # as stored
+    return converters
+
+
+def _upsert(conn, table):
+    """INSERT ... ON CONFLICT (primary key) DO UPDATE for rows a delta carries again."""
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table)
+    keys = [c.name for c in table.primary_key.columns]
+    return stmt.on_conflict_do_update(
+        index_elements=keys, set_={c.name: stmt.excluded[c.name] for c in table.columns if c.name not in keys}
+    )
+
+
+def _load_segment(conn, table, path, columns, upsert):
+    """Insert (or upsert) the rows of one segment file; returns the row count."""
+    converters = _converters(table, columns)
+    keep = [i for i, conv in enumerate(converters) if conv is not None]  # columns dropped since the backup
+    # Self references (users.updated_by_id) may point at rows later in the segment: set them afterwards
+    deferred = [columns[i] for i in keep if any(fk.column.table is table for fk in table.c[columns[i]].foreign_keys)]
+    key = table.primary_key.columns.values()[0].name
+    stmt = _upsert(conn, table) if upsert else table.insert()
+    count, batch, patches = 0, [], []
+    with gzip.open(path, "rt") as f:
+        for line in f:
+            values = json.loads(line)
+            row = {}
+            for i in keep:
+                value, conv = values[i], converters[i]
+                row[columns[i]] = conv(value) if conv and value is not None else value
+            for name in deferred:
+                if row[name] is not None:
+                    patches.append({"_key": row[key], "_value": row[name], "_column": name})
+                    row[name] = None
+            batch.append(row)
+            if len(batch) >= BATCH_ROWS:
+                conn.execute(stmt, batch)
+                count += len(batch)
+                batch = []
+    if batch:
+        conn.execute(stmt, batch)
+        count += len(batch)
+    for name in deferred:
+        rows = [{"_key": p["_key"], "_value": p["_value"]} for p in patches if p["_column"] == name]
+        if rows:
+            conn.execute(
+                table.update().where(table.c[key] == bindparam("_key")).values({name: bindparam("_value")}), rows
+            )
+    return count
+
+
+def restore_logical(backup_id, progress=None):
+    """
+    Replace the contents of all tables with the state at backup_id (base plus deltas).
+    The caller handles maintenance mode and sessions. progress(backup_id, table, rows) is called
+    after each segment. Raises BackupChainError before touching the database if the chain is
+    incomplete, fails its checksums or was taken at another schema version. Returns {table: rows}.
+    """
+    chain = backup_chain(backup_id)
+    problems = verify_chain(chain)
+    if problems:
+        raise BackupChainError("; ".join(problems))
+    schema_version = _schema_version()
+    if chain[-1]["schema_version"] != schema_version:
+        raise BackupChainError(
+            f"Backup is at schema version {chain[-1]['schema_version']}, database at {schema_version}"
+        )
+    tables = _tables()
+    engine = db.engine
+    db.session.remove()
+    totals = {}
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(db.text(f"TRUNCATE {', '.join(t.name for t in tables)}"))
+        else:
+            for table in reversed(tables):
+                conn.execute(table.delete())
+        for position, manifest in enumerate(chain):
+            for table in tables:
+                segment = manifest["segments"].get(table.name)
+                if segment is None:
+                    continue
+                path = os.path.join(LOGICAL_BACKUP_DIR, manifest["id"], segment["file"])
+                rows = _load_segment(conn, table, path, segment["columns"], upsert=position > 0)
+                totals[table.name] = totals.get(table.name, 0) + rows
+                if progress:
+                    progress(manifest["id"], table.name, rows)
+        if conn.dialect.name == "postgresql":
+            for table in tables:
+                if "id" not in table.c:
+                    continue
+                conn.execute(db.text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"
+                ))
+    return totals
@@ -1,29 +1,108 @@
 """
 Maintenance mode. Developer-only. Blocks all non-developer access.
+
+The flag is held in process memory in each worker so the before_request check
+never touches Redis. A background listener per worker process subscribes to
+REDIS_MAINTENANCE_CHANNEL for changes and re-reads the key every
+MAINTENANCE_RESYNC_SECONDS as a safety net for missed messages.
+
+Without Redis at startup the same listener runs on the local store's client, whose
+subscriptions poll the shared SQLite file (LocalPubSub), so workers see changes within
+a poll interval.
 """
+import os
+import threading
+import time
+from flask import current_app
 from ..extensions import get_redis
-from ..config import REDIS_MAINTENANCE_KEY
+from ..config import REDIS_MAINTENANCE_KEY, REDIS_MAINTENANCE_CHANNEL, MAINTENANCE_RESYNC_SECONDS
 import redis
 
+_state = {"enabled": False, "synced_at": 0.0}
+_listener = {"pid": None, "thread": None}
+_listener_lock = threading.Lock()
 
-def is_maintenance_mode():
-    r = get_redis()
-    if not r:
-        return False
+
+def _sync_from_redis(r):
+    """Read the flag from Redis into process memory. Leaves it unchanged if Redis fails."""
     try:
-        return r.get(REDIS_MAINTENANCE_KEY) == "1"
+        _state["enabled"] = r.get(REDIS_MAINTENANCE_KEY) == "1"
+        _state["synced_at"] = time.monotonic()
     except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError, Exception):
-        return False
+        pass
+
+
+def _listen():
+    """Apply published changes; resync periodically and after reconnects."""
+    while True:
+        r = get_redis()
+        if not r:
+            time.sleep(MAINTENANCE_RESYNC_SECONDS)
+            continue
+        pubsub = None
+        try:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(REDIS_MAINTENANCE_CHANNEL)
+            _sync_from_redis(r)
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message and message.get("type") == "message":
+                    _state["enabled"] = message.get("data") == "1"
+                    _state["synced_at"] = time.monotonic()
+                if time.monotonic() - _state["synced_at"] >= MAINTENANCE_RESYNC_SECONDS:
+                    _sync_from_redis(r)
+        except Exception:
+            time.sleep(1.0)  # Redis unavailable, retry subscription
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+def _ensure_listener():
+    """Start the listener once per process (Gunicorn forks workers after import)."""
+    pid = os.getpid()
+    if _listener["pid"] == pid:
+        return
+    with _listener_lock:
+        if _listener["pid"] == pid:
+            return
+        r = get_redis()
+        if r:
+            _sync_from_redis(r)
+        thread = threading.Thread(target=_listen, name="maintenance-listener", daemon=True)
+        thread.start()
+        _listener["pid"] = pid
+        _listener["thread"] = thread
+
+
+def is_maintenance_mode():
+    _ensure_listener()  # while the breaker is open the last known flag is kept
+    return _state["enabled"]
 
 
 def set_maintenance_mode(enabled):
+    """
+    Store and publish the flag, then apply it in this worker. Returns False (flag unchanged
+    everywhere) if Redis is unavailable or the write fails, so callers can report it.
+    """
     r = get_redis()
     if not r:
-        return
+        current_app.logger.warning("Maintenance mode not changed: Redis unavailable")
+        return False
     try:
+        pipe = r.pipeline()
         if enabled:
-            r.set(REDIS_MAINTENANCE_KEY, "1")
+            pipe.set(REDIS_MAINTENANCE_KEY, "1")
         else:
-            r.delete(REDIS_MAINTENANCE_KEY)
-    except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError, Exception):
-        pass
+            pipe.delete(REDIS_MAINTENANCE_KEY)
+        pipe.publish(REDIS_MAINTENANCE_CHANNEL, "1" if enabled else "0")
+        pipe.execute()
+    except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError, Exception) as e:
+        current_app.logger.warning("Maintenance mode not changed: %s", e)
+        return False
+    _state["enabled"] = bool(enabled)
+    _state["synced_at"] = time.monotonic()
+    return True
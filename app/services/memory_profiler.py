@@ -0,0 +1,383 @@
+"""
+Worker memory profiling (MEMORY_PROFILING), developer page /developer/memory.
+
+Peak RSS per endpoint: at the start of each request the kernel's peak-RSS counter (VmHWM) is
+reset through /proc/self/clear_refs, and at the end it is read back, so every request gets its own
+peak. Each worker keeps per-endpoint totals; a request whose peak exceeded the RSS it started with
+by MEMORY_RECORD_MIN_MB is also recorded, with a timestamp, in a ring buffer of
+MEMORY_SAMPLE_BUFFER entries shared by all workers (see ring_buffer). Costs two small /proc
+accesses per request. Where clear_refs is unavailable (non-Linux) the process-lifetime peak
+(ru_maxrss) is used, so only requests that raise the worker's high-water mark show growth.
+With threaded workers concurrent requests share one counter.
+
+tracemalloc: developers start tracing in a chosen worker (or all), take snapshots (dumped to
+MEMORY_SNAPSHOT_DIR, newest MEMORY_SNAPSHOTS_KEEP kept) and compare two of them; traces cost
+memory and CPU, so tracing stays off until started. Commands are published on
+REDIS_MEMORY_CONTROL_CHANNEL as {"action", "pid"} (pid null = every worker) and applied by a
+listener thread in each worker, started by its first request. Every worker also reports its
+status (RSS, tracing, result of the last command) every MEMORY_WORKER_REPORT_SECONDS and right
+after a command under REDIS_MEMORY_WORKERS_KEY (sorted set of pids, status JSON in "<key>:<pid>"),
+which lists the workers to choose from. Without Redis or the local store only the serving worker
+can be controlled.
+"""
+import gc
+import glob
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+from flask import g, request
+from ..config import MEMORY_SNAPSHOT_DIR, MEMORY_SNAPSHOTS_KEEP
+from ..extensions import get_redis
+from . import ring_buffer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024 if hasattr(os, "sysconf") else 4
+_HWM = re.compile(rb"VmHWM:\s+(\d+) kB")
+_SNAPSHOT_NAME = re.compile(r"^snapshot_(\d+)_(\d+)\.tracemalloc$")
+# Allocations made by the profiler itself and by imports are noise in a diff
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_lock = threading.Lock()
+_endpoints = {}  # endpoint -> [requests, peak max kB, growth max kB, growth total kB, last at]
+_state = {"resettable": False, "min_growth_kb": 0, "maxlen": 500, "key": "td_memory_samples",
+          "dir": MEMORY_SNAPSHOT_DIR, "keep": MEMORY_SNAPSHOTS_KEEP, "frames": 1,
+          "channel": "td_memory_control", "workers_key": "td_memory_workers", "report_seconds": 10,
+          "last_result": None}
+_listener = {"pid": None}
+_listener_lock = threading.Lock()
+
+ACTIONS = ("start", "stop", "snapshot")
+
+
+def rss_kb():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_KB
+    except (OSError, ValueError, IndexError):
+        return peak_kb()
+
+
+def peak_kb():
+    """Peak RSS since the last reset (or process start)."""
+    try:
+        with open("/proc/self/status", "rb") as f:
+            return int(_HWM.search(f.read()).group(1))
+    except (OSError, AttributeError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+
+
+def reset_peak():
+    """Reset VmHWM to the current RSS. False where the kernel does not support it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def worker_status():
+    traced, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    return {
+        "pid": os.getpid(),
+        "rss_kb": rss_kb(),
+        "lifetime_peak_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        "per_request_peaks": _state["resettable"],
+        "tracing": tracemalloc.is_tracing(),
+        "traced_kb": traced // 1024,
+        "traced_peak_kb": traced_peak // 1024,
+        "last_result": _state["last_result"],
+        "at": time.time(),
+    }
+
+
+def endpoint_stats():
+    """This worker's per-endpoint totals, largest peak growth first."""
+    with _lock:
+        rows = [{"endpoint": endpoint, "requests": n, "peak_kb": peak, "growth_max_kb": growth,
+                 "growth_avg_kb": total / n, "last_at": last}
+                for endpoint, (n, peak, growth, total, last) in _endpoints.items()]
+    return sorted(rows, key=lambda row: row["growth_max_kb"], reverse=True)
+
+
+def _record(endpoint, before, peak, after):
+    growth = max(peak - before, 0)
+    now = time.time()
+    with _lock:
+        row = _endpoints.get(endpoint)
+        if row is None:
+            row = _endpoints[endpoint] = [0, 0, 0, 0, 0.0]
+        row[0] += 1
+        row[1] = max(row[1], peak)
+        row[2] = max(row[2], growth)
+        row[3] += growth
+        row[4] = now
+    if growth >= _state["min_growth_kb"]:
+        try:
+            ring_buffer.push(_state["key"], {"endpoint": endpoint, "pid": os.getpid(), "at": now,
+                                             "rss_before_kb": before, "peak_kb": peak, "rss_after_kb": after},
+                             _state["maxlen"])
+        except Exception:
+            pass  # Redis or local store unavailable; the per-worker totals still have it
+
+
+def samples():
+    """Recorded high-growth requests of all workers, newest first."""
+    return ring_buffer.items(_state["key"])
+
+
+def clear_samples():
+    ring_buffer.clear(_state["key"])
+    with _lock:
+        _endpoints.clear()
+
+
+def summarize(records):
+    """Samples grouped by endpoint, largest peak growth first."""
+    groups = {}
+    for rec in records:
+        growth = max(rec["peak_kb"] - rec["rss_before_kb"], 0)
+        group = groups.setdefault(rec["endpoint"], {"endpoint": rec["endpoint"], "count": 0, "growth_max_kb": 0,
+                                                    "peak_max_kb": 0, "growths": [], "first_at": rec["at"],
+                                                    "last_at": rec["at"], "last_growth_kb": growth})
+        group["count"] += 1
+        group["growth_max_kb"] = max(group["growth_max_kb"], growth)
+        group["peak_max_kb"] = max(group["peak_max_kb"], rec["peak_kb"])
+        group["growths"].append(growth)
+        group["first_at"] = min(group["first_at"], rec["at"])  # records are newest first
+    for group in groups.values():
+        ordered = sorted(group.pop("growths"))
+        group["growth_median_kb"] = ordered[len(ordered) // 2]
+    return sorted(groups.values(), key=lambda grp: grp["growth_max_kb"], reverse=True)
+
+
+# ---- tracemalloc ----
+
+def start_tracing():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(_state["frames"])
+
+
+def stop_tracing():
+    tracemalloc.stop()
+
+
+def take_snapshot():
+    """Dump a snapshot of this worker's traced allocations; returns its file name."""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not tracing in this worker")
+    gc.collect()  # unreachable cycles (openpyxl cells, ORM state) would otherwise look like leaks
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    os.makedirs(_state["dir"], exist_ok=True)
+    name = f"snapshot_{os.getpid()}_{int(time.time() * 1000)}.tracemalloc"
+    snapshot.dump(os.path.join(_state["dir"], name))
+    for old in list_snapshots()[_state["keep"]:]:
+        try:
+            os.remove(os.path.join(_state["dir"], old["name"]))
+        except OSError:
+            pass
+    return name
+
+
+# ---- control of all workers ----
+
+def apply(action):
+    """Run a tracemalloc action in this worker; returns a one-line result."""
+    try:
+        if action == "start":
+            start_tracing()
+            result = "tracing started"
+        elif action == "stop":
+            stop_tracing()
+            result = "tracing stopped"
+        elif action == "snapshot":
+            result = f"snapshot {take_snapshot()}"
+        else:
+            raise ValueError(f"unknown action {action!r}")
+    except (RuntimeError, OSError, ValueError) as e:
+        result = f"{action} failed: {e}"
+    _state["last_result"] = result
+    return result
+
+
+def send(action, pid=None):
+    """
+    Ask worker pid (None: every worker) to apply action. Returns False if it cannot be delivered
+    (no Redis or local store, and pid is not the serving worker).
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"unknown action {action!r}")
+    r = get_redis()
+    if not r:
+        if pid not in (None, os.getpid()):
+            return False
+        apply(action)
+        return True
+    r.publish(_state["channel"], json.dumps({"action": action, "pid": pid}))
+    return True
+
+
+def _report(r):
+    """Publish this worker's status for the workers list; entries expire after three missed reports."""
+    now = time.time()
+    stale = 3 * _state["report_seconds"]
+    pid = os.getpid()
+    pipe = r.pipeline(transaction=False)
+    pipe.set(f"{_state['workers_key']}:{pid}", json.dumps(worker_status()), ex=int(stale))
+    pipe.zadd(_state["workers_key"], {str(pid): now})
+    pipe.zremrangebyscore(_state["workers_key"], "-inf", now - stale)
+    pipe.execute()
+
+
+def workers():
+    """Status of every worker that reported recently (this one always included), by pid."""
+    own = worker_status()
+    rows = {own["pid"]: own}
+    r = get_redis()
+    if r:
+        try:
+            key = _state["workers_key"]
+            pids = r.zrevrangebyscore(key, "+inf", time.time() - 3 * _state["report_seconds"])
+            pipe = r.pipeline(transaction=False)
+            for pid in pids:
+                pipe.get(f"{key}:{pid}")
+            for raw in pipe.execute() if pids else []:
+                if raw:
+                    row = json.loads(raw)
+                    rows.setdefault(row["pid"], row)
+        except Exception:
+            pass  # Redis unavailable: this worker only
+    return [rows[pid] for pid in sorted(rows)]
+
+
+def _handle(data):
+    try:
+        command = json.loads(data)
+    except (TypeError, ValueError):
+        return False
+    if command.get("pid") not in (None, os.getpid()):
+        return False
+    apply(command.get("action"))
+    return True
+
+
+def _listen():
+    """Apply commands addressed to this worker; report status periodically and after each command."""
+    while True:
+        r = get_redis()
+        if not r:
+            time.sleep(_state["report_seconds"])
+            continue
+        pubsub = None
+        try:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_state["channel"])
+            reported = 0.0
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message and message.get("type") == "message" and _handle(message.get("data")):
+                    reported = 0.0
+                if time.monotonic() - reported >= _state["report_seconds"]:
+                    _report(r)
+                    reported = time.monotonic()
+        except Exception:
+            time.sleep(1.0)  # Redis unavailable, retry subscription
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+def _ensure_listener():
+    """Start the control listener once per process (Gunicorn forks workers after create_app)."""
+    pid = os.getpid()
+    if _listener["pid"] == pid:
+        return
+    with _listener_lock:
+        if _listener["pid"] == pid:
+            return
+        threading.Thread(target=_listen, name="memory-control", daemon=True).start()
+        _listener["pid"] = pid
+
+
+def list_snapshots():
+    """Snapshots of all workers, newest first: name, pid, at, size."""
+    rows = []
+    for path in glob.glob(os.path.join(_state["dir"], "snapshot_*.tracemalloc")):
+        match = _SNAPSHOT_NAME.match(os.path.basename(path))
+        if match:
+            rows.append({"name": match.group(0), "pid": int(match.group(1)), "at": int(match.group(2)) / 1000,
+                         "size": os.path.getsize(path)})
+    return sorted(rows, key=lambda row: row["at"], reverse=True)
+
+
+def _load(name):
+    if not _SNAPSHOT_NAME.match(name or ""):
+        raise ValueError(f"Not a snapshot: {name}")
+    return tracemalloc.Snapshot.load(os.path.join(_state["dir"], name))
+
+
+def _site(traceback):
+    frame = traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def top_sites(name, limit=25):
+    """Largest allocation sites (file:line) of one snapshot."""
+    stats = _load(name).statistics("lineno")
+    return [{"site": _site(s.traceback), "size_kb": s.size / 1024, "count": s.count} for s in stats[:limit]]
+
+
+def compare(old_name, new_name, limit=25):
+    """Allocation sites that grew most from old_name to new_name."""
+    stats = _load(new_name).compare_to(_load(old_name), "lineno")
+    return [{"site": _site(s.traceback), "size_kb": s.size / 1024, "size_diff_kb": s.size_diff / 1024,
+             "count": s.count, "count_diff": s.count_diff} for s in stats[:limit]]
+
+
+def install(app):
+    """Measure peak RSS per request and accept tracemalloc commands. Call from create_app."""
+    _state.update(
+        resettable=reset_peak(),
+        min_growth_kb=app.config["MEMORY_RECORD_MIN_MB"] * 1024,
+        maxlen=app.config["MEMORY_SAMPLE_BUFFER"],
+        key=app.config["REDIS_MEMORY_SAMPLES_KEY"],
+        dir=app.config["MEMORY_SNAPSHOT_DIR"],
+        keep=app.config["MEMORY_SNAPSHOTS_KEEP"],
+        frames=app.config["MEMORY_TRACEMALLOC_FRAMES"],
+        channel=app.config["REDIS_MEMORY_CONTROL_CHANNEL"],
+        workers_key=app.config["REDIS_MEMORY_WORKERS_KEY"],
+        report_seconds=app.config["MEMORY_WORKER_REPORT_SECONDS"],
+    )
+
+    @app.before_request
+    def _start_memory_sample():
+        _ensure_listener()
+        if request.endpoint == "static":
+            return
+        if _state["resettable"]:
+            g.memory_rss_before = rss_kb()
+            reset_peak()
+        else:
+            g.memory_rss_before = peak_kb()  # growth is then the rise of the lifetime peak
+
+    @app.teardown_request
+    def _finish_memory_sample(exc):
+        before = g.pop("memory_rss_before", None)
+        if before is not None:
+            _record(request.endpoint or "unmatched", before, peak_kb(), rss_kb())
@@ -0,0 +1,260 @@
+"""
+Prometheus metrics (METRICS_ENABLED), served at /metrics in the text exposition format.
+
+Each worker aggregates in memory and writes a snapshot to METRICS_DIR at most every
+METRICS_FLUSH_SECONDS (and at exit). /metrics sums the snapshots of all workers, so a scrape that
+lands on any of the Gunicorn workers sees the totals of all of them. As with prometheus_client's
+multiprocess mode, the Gunicorn master (gunicorn.conf.py) empties METRICS_DIR when it starts and
+folds the snapshot of each exited worker into metrics_archive.json, so counters never go
+backwards while the master runs and the directory holds one file per live worker. Archiving holds
+an exclusive flock on METRICS_DIR/.lock and scrapes a shared one, so no scrape counts a worker
+twice or not at all. Recording a value is a dict update under a lock; when metrics are disabled
+the record functions return at once.
+
+Access: a logged-in developer, or `Authorization: Bearer <METRICS_TOKEN>` for the scraper.
+"""
+import atexit
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: archiving is not serialized with scrapes
+    fcntl = None
+
+# name: (type, help, label names)
+METRICS = {
+    "td_http_request_duration_seconds": ("histogram", "Request latency", ("endpoint", "method", "status")),
+    "td_request_db_seconds": ("histogram", "Database time per request", ("endpoint",)),
+    "td_request_redis_seconds": ("histogram", "Redis time per request", ("endpoint",)),
+    "td_audit_writes_total": ("counter", "Audit log entries written", ("action",)),
+    "td_rate_limit_blocks_total": ("counter", "Requests refused by a rate limiter", ("scope",)),
+    "td_verification_submits_total": ("counter", "Checklist submits", ("line",)),
+}
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ARCHIVE = "metrics_archive.json"  # summed values of exited workers; matches the snapshot glob
+
+_lock = threading.Lock()
+_values = {}  # (name, label values) -> float (counter) or [bucket counts..., sum, count] (histogram)
+_state = {"enabled": False, "dir": None, "flush_seconds": 5, "flushed_at": 0.0, "pid": None, "file": None}
+
+
+def enabled():
+    return _state["enabled"]
+
+
+def inc(name, *labels, value=1):
+    if not _state["enabled"]:
+        return
+    key = (name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+
+
+def observe(name, seconds, *labels):
+    if not _state["enabled"]:
+        return
+    key = (name, labels)
+    with _lock:
+        row = _values.get(key)
+        if row is None:
+            row = _values[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                row[i] += 1
+                break
+        row[-2] += seconds
+        row[-1] += 1
+
+
+def _after_fork():
+    # A forked worker starts empty and writes its own snapshot; the parent's values stay in the parent's file
+    _values.clear()
+    _state.update(pid=None, file=None, flushed_at=0.0)
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _snapshot_path():
+    if _state["file"] is None:
+        _state["pid"] = os.getpid()
+        _state["file"] = os.path.join(_state["dir"], f"metrics_{_state['pid']}_{uuid.uuid4().hex[:8]}.json")
+    return _state["file"]
+
+
+def flush():
+    """Write this worker's values to its snapshot file (atomic replace)."""
+    if not _state["enabled"]:
+        return
+    with _lock:
+        data = [[name, list(labels), value] for (name, labels), value in _values.items()]
+        _state["flushed_at"] = time.monotonic()
+    path = _snapshot_path()
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def maybe_flush():
+    if time.monotonic() - _state["flushed_at"] >= _state["flush_seconds"]:
+        flush()
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []  # removed or replaced while reading
+
+
+def _merge(totals, data):
+    for name, labels, value in data:
+        key = (name, tuple(labels))
+        if isinstance(value, list):
+            row = totals.setdefault(key, [0] * len(value))
+            for i, v in enumerate(value):
+                row[i] += v
+        else:
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _dir_lock(directory, mode):
+    """Open METRICS_DIR/.lock holding flock mode until the returned file is closed."""
+    lock = open(os.path.join(directory, ".lock"), "a")
+    if fcntl:
+        fcntl.flock(lock, mode)
+    return lock
+
+
+def collect():
+    """{(name, labels): value} summed over every worker's snapshot and the archive of exited workers."""
+    flush()
+    totals = {}
+    with _dir_lock(_state["dir"], fcntl.LOCK_SH if fcntl else None):
+        for path in glob.glob(os.path.join(_state["dir"], "metrics_*.json")):
+            _merge(totals, _read(path))
+    return totals
+
+
+def archive_worker(directory, pid):
+    """
+    Fold the snapshots of exited worker pid into the archive and remove them. Called by the
+    Gunicorn master from child_exit, after the worker's exit flush.
+    """
+    paths = glob.glob(os.path.join(directory, f"metrics_{pid}_*.json"))
+    if not paths:
+        return
+    archive = os.path.join(directory, ARCHIVE)
+    with _dir_lock(directory, fcntl.LOCK_EX if fcntl else None):
+        totals = _merge({}, _read(archive))
+        for path in paths:
+            _merge(totals, _read(path))
+        tmp = archive + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump([[name, list(labels), value] for (name, labels), value in totals.items()], f)
+        os.replace(tmp, archive)
+        for path in paths:
+            os.remove(path)
+
+
+def reset_dir(directory):
+    """Remove every snapshot and the archive: counters restart from zero with the master."""
+    for path in glob.glob(os.path.join(directory, "metrics_*.json*")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render():
+    """Prometheus text format (version 0.0.4)."""
+    totals = collect()
+    lines = []
+    for name, (kind, help_text, label_names) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, labels), value in sorted(totals.items()):
+            if metric != name:
+                continue
+            if kind == "counter":
+                lines.append(f"{name}{_labels(label_names, labels)} {value:g}")
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, value):
+                cumulative += count
+                le = 'le="%g"' % bound
+                lines.append(f"{name}_bucket{_labels(label_names, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{_labels(label_names, labels, le)} {value[-1]}")
+            lines.append(f"{name}_sum{_labels(label_names, labels)} {value[-2]:.6f}")
+            lines.append(f"{name}_count{_labels(label_names, labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def add_redis_time(seconds):
+    """Called by the Redis client wrapper for every command / pipeline."""
+    from flask import g, has_app_context
+    if has_app_context():
+        g.redis_seconds = g.get("redis_seconds", 0.0) + seconds
+
+
+def install(app):
+    """Enable recording, time every request and register /metrics. Call after db.init_app."""
+    from flask import Response, abort, g, request
+    from .sql_profiler import current_stats, track
+    _state.update(
+        enabled=True,
+        dir=app.config["METRICS_DIR"],
+        flush_seconds=app.config["METRICS_FLUSH_SECONDS"],
+    )
+    os.makedirs(_state["dir"], exist_ok=True)
+    atexit.register(flush)
+    track(app)
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get("request_started")
+        if started is None or request.endpoint == "static":
+            return response
+        endpoint = request.endpoint or "unmatched"
+        observe("td_http_request_duration_seconds", time.perf_counter() - started, endpoint, request.method, str(response.status_code))
+        stats = current_stats()
+        if stats is not None:
+            observe("td_request_db_seconds", stats.seconds, endpoint)
+        observe("td_request_redis_seconds", g.get("redis_seconds", 0.0), endpoint)
+        maybe_flush()
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        from flask_login import current_user
+        token = app.config.get("METRICS_TOKEN")
+        header = request.headers.get("Authorization", "")
+        by_token = bool(token) and hmac.compare_digest(header, f"Bearer {token}")
+        if not by_token and not (current_user.is_authenticated and current_user.role == "developer"):
+            abort(403)
+        return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,117 @@
+"""
+Versioned schema migrations: `flask db-upgrade` applies pending steps, `flask db-status` lists them.
+
+db.create_all() only creates missing tables, so changes to existing tables ship here as numbered
+migrations recorded in schema_migrations. Every step is idempotent (IF NOT EXISTS), so a run that
+stopped part-way is simply repeated, and on a fresh database created from the models it only
+records the version.
+
+On PostgreSQL indexes are built with CREATE INDEX CONCURRENTLY so reads and writes continue during
+the build. CONCURRENTLY cannot run in a transaction, so migrations run on an autocommit
+connection; a failed concurrent build leaves an INVALID index, which is dropped and rebuilt.
+"""
+from datetime import datetime
+from ..extensions import db
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Register fn(conn) as migration <version>. Versions are applied in ascending order."""
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def create_index(conn, name, table, columns, where=None):
+    """CREATE INDEX (CONCURRENTLY on PostgreSQL) if missing. where is a partial-index predicate per dialect."""
+    dialect = conn.dialect.name
+    predicate = (where or {}).get(dialect)
+    suffix = f" WHERE {predicate}" if predicate else ""
+    if dialect == "postgresql":
+        valid = conn.execute(
+            db.text(
+                "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+            ),
+            {"name": name},
+        ).scalar()
+        if valid is False:
+            conn.execute(db.text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.execute(db.text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns}){suffix}"))
+    else:
+        conn.execute(db.text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns}){suffix}"))
+
+
+def drop_index(conn, name):
+    if conn.dialect.name == "postgresql":
+        conn.execute(db.text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    else:
+        conn.execute(db.text(f"DROP INDEX IF EXISTS {name}"))
+
+
+# Booleans are compared as literals (is_active = 1 on SQLite, is_active = true on PostgreSQL);
+# SQLite only uses a partial index whose predicate matches the query term exactly.
+ACTIVE_ONLY = {"postgresql": "is_active", "sqlite": "is_active = 1"}
+
+
+@migration(1, "Indexes on hot foreign keys and timestamps")
+def _hot_path_indexes(conn):
+    create_index(conn, "ix_verification_items_verification_id", "verification_items", "verification_id")
+    create_index(conn, "ix_verification_items_td_item_id", "verification_items", "td_item_id")
+    create_index(conn, "ix_verifications_verified_at", "verifications", "verified_at")
+    create_index(conn, "ix_verifications_fg_verified_at", "verifications", "fg_id, verified_at")
+    create_index(conn, "ix_verifications_operator_verified_at", "verifications", "operator_id, verified_at")
+    create_index(conn, "ix_audit_logs_created_at", "audit_logs", "created_at")
+    create_index(conn, "ix_login_attempts_created_at", "login_attempts", "created_at")
+
+
+@migration(2, "Partial indexes for active FG codes and TD items")
+def _active_partial_indexes(conn):
+    # fg_codes.line_id and td_items.fg_id are already leading columns of uq_fg_line_code and
+    # uq_fg_item_code; these smaller indexes cover only the active rows the verification flow reads.
+    create_index(conn, "ix_fg_codes_line_active", "fg_codes", "line_id, code", where=ACTIVE_ONLY)
+    create_index(conn, "ix_td_items_fg_active", "td_items", "fg_id, item_code", where=ACTIVE_ONLY)
+
+
+def _ensure_version_table(conn):
+    conn.execute(db.text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def applied_versions():
+    """{version: applied_at} of migrations recorded in the database."""
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        _ensure_version_table(conn)
+        return dict(conn.execute(db.text("SELECT version, applied_at FROM schema_migrations")).fetchall())
+
+
+def migration_status():
+    """[(version, name, applied_at or None)] for every known migration."""
+    applied = applied_versions()
+    return [(version, name, applied.get(version)) for version, name, _ in MIGRATIONS]
+
+
+def upgrade(target=None, progress=None):
+    """
+    Apply pending migrations up to target (default: all). progress(version, name) is called before
+    each one. Returns the list of versions applied.
+    """
+    done = []
+    applied = applied_versions()
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for version, name, fn in MIGRATIONS:
+            if version in applied or (target is not None and version > target):
+                continue
+            if progress:
+                progress(version, name)
+            fn(conn)
+            conn.execute(
+                db.text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow()},
+            )
+            done.append(version)
+    return done
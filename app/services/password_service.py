@@ -0,0 +1,208 @@
+"""
+bcrypt hashing and verification off the request thread.
+
+Each worker process runs hashes on a small executor (PASSWORD_HASH_WORKERS threads) and, on
+POSIX hosts, takes one of PASSWORD_HASH_SLOTS file-lock slots shared by all workers, so a
+login storm cannot put every worker or core into bcrypt at once. The request thread waits for
+its turn instead of failing: within a worker, jobs start in submission order (the executor's
+queue); across workers a freed slot goes to whichever executor thread polls first (no global
+order). Only the executor threads poll, with backoff up to SLOT_POLL_MAX_SECONDS, on slot files
+opened once per process. Jobs waiting longer than PASSWORD_HASH_QUEUE_TIMEOUT (or beyond
+PASSWORD_HASH_MAX_PENDING queued) raise PasswordHasherBusy. Waiting ties up one gthread request
+thread, not the whole worker.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+from ..config import (
+    BCRYPT_LOG_ROUNDS,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_SLOTS,
+    PASSWORD_HASH_SLOT_DIR,
+    PASSWORD_HASH_MAX_PENDING,
+    PASSWORD_HASH_QUEUE_TIMEOUT,
+)
+from .tracing import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: executor limit only
+    fcntl = None
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when a hash cannot start within PASSWORD_HASH_QUEUE_TIMEOUT."""
+
+
+SLOT_POLL_MIN_SECONDS = 0.002
+SLOT_POLL_MAX_SECONDS = 0.025
+
+_pool = {"pid": None, "executor": None, "pending": None, "slots": None}
+_pool_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_metrics = {
+    "completed": 0,
+    "rejected": 0,
+    "queue_wait_total": 0.0,
+    "queue_wait_max": 0.0,
+    "hash_time_total": 0.0,
+}
+
+
+def _get_pool():
+    """Executor and pending-job semaphore for this process (recreated after fork)."""
+    pid = os.getpid()
+    if _pool["pid"] != pid:
+        with _pool_lock:
+            if _pool["pid"] != pid:
+                _pool["executor"] = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+                _pool["pending"] = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+                _pool["slots"] = None
+                _pool["pid"] = pid
+    return _pool["executor"], _pool["pending"]
+
+
+def _slot_files():
+    """[(thread lock, open slot file)] of this process. flock is per open file, so the thread lock
+    keeps two executor threads of one process out of the same slot."""
+    if _pool["slots"] is None:
+        with _pool_lock:
+            if _pool["slots"] is None:
+                os.makedirs(PASSWORD_HASH_SLOT_DIR, exist_ok=True)
+                _pool["slots"] = [
+                    (threading.Lock(), open(os.path.join(PASSWORD_HASH_SLOT_DIR, f"slot{i}.lock"), "a"))
+                    for i in range(PASSWORD_HASH_SLOTS)
+                ]
+    return _pool["slots"]
+
+
+def _acquire_slot(deadline):
+    """Take a host-wide hashing slot. Returns it for _release_slot, or None if not supported."""
+    if fcntl is None or PASSWORD_HASH_SLOTS <= 0:
+        return None
+    delay = SLOT_POLL_MIN_SECONDS
+    while True:
+        for slot in _slot_files():
+            held, f = slot
+            if held.acquire(blocking=False):
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return slot
+                except OSError:
+                    held.release()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise PasswordHasherBusy()
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, SLOT_POLL_MAX_SECONDS)
+
+
+def _release_slot(slot):
+    held, f = slot
+    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    held.release()
+
+
+def _record(queue_wait, hash_time):
+    with _metrics_lock:
+        _metrics["completed"] += 1
+        _metrics["queue_wait_total"] += queue_wait
+        _metrics["queue_wait_max"] = max(_metrics["queue_wait_max"], queue_wait)
+        _metrics["hash_time_total"] += hash_time
+
+
+def _reject():
+    with _metrics_lock:
+        _metrics["rejected"] += 1
+    raise PasswordHasherBusy()
+
+
+def _run(fn, *args):
+    executor, pending = _get_pool()
+    if not pending.acquire(blocking=False):
+        _reject()
+    submitted = time.monotonic()
+    deadline = submitted + PASSWORD_HASH_QUEUE_TIMEOUT
+    started = {}
+
+    def job():
+        try:
+            if time.monotonic() >= deadline:
+                raise PasswordHasherBusy()
+            slot = _acquire_slot(deadline)
+            try:
+                started["at"] = time.monotonic()
+                result = fn(*args)
+            finally:
+                if slot is not None:
+                    _release_slot(slot)
+            _record(started["at"] - submitted, time.monotonic() - started["at"])
+            return result
+        finally:
+            pending.release()
+
+    future = executor.submit(job)
+    try:
+        return future.result(timeout=PASSWORD_HASH_QUEUE_TIMEOUT)
+    except FutureTimeoutError:
+        if future.cancel():  # never started
+            pending.release()
+            _reject()
+        try:
+            return future.result()  # hashing or about to give up on its slot deadline
+        except PasswordHasherBusy:
+            _reject()
+    except PasswordHasherBusy:
+        _reject()
+
+
+def _configured_rounds():
+    try:
+        from flask import current_app
+        return int(current_app.config.get("BCRYPT_LOG_ROUNDS", BCRYPT_LOG_ROUNDS))
+    except RuntimeError:  # outside app context (scripts)
+        return BCRYPT_LOG_ROUNDS
+
+
+def hash_password(raw_password):
+    """bcrypt hash with the configured BCRYPT_LOG_ROUNDS."""
+    salt = bcrypt.gensalt(rounds=_configured_rounds())
+    with span("bcrypt.hashpw", "bcrypt"):
+        return _run(bcrypt.hashpw, raw_password.encode("utf-8"), salt).decode("utf-8")
+
+
+def verify_password(raw_password, password_hash):
+    """True if raw_password matches. Raises PasswordHasherBusy when hashing capacity is exhausted."""
+    try:
+        with span("bcrypt.checkpw", "bcrypt"):
+            return _run(bcrypt.checkpw, raw_password.encode("utf-8"), password_hash.encode("utf-8"))
+    except ValueError:  # malformed hash
+        return False
+
+
+def hash_cost(password_hash):
+    """Cost factor encoded in a bcrypt hash ($2b$12$...), or None."""
+    try:
+        return int(password_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash):
+    return hash_cost(password_hash) != _configured_rounds()
+
+
+def get_hash_metrics():
+    """Counters for this worker process: completed, rejected, queue wait avg/max (ms), hash time avg (ms)."""
+    with _metrics_lock:
+        m = dict(_metrics)
+    n = m["completed"] or 1
+    return {
+        "completed": m["completed"],
+        "rejected": m["rejected"],
+        "queue_wait_avg_ms": round(m["queue_wait_total"] / n * 1000, 1),
+        "queue_wait_max_ms": round(m["queue_wait_max"] * 1000, 1),
+        "hash_time_avg_ms": round(m["hash_time_total"] / n * 1000, 1),
+    }
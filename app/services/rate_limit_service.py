@@ -0,0 +1,189 @@
+"""
+Rate limiting via Redis: sliding-window counters checked and updated by one Lua script.
+
+Login: MAX_LOGIN_ATTEMPTS failures within LOGIN_ATTEMPT_WINDOW_SECONDS → LOGIN_COOLDOWN_SECONDS cooldown,
+tracked for the client IP and the username together. The same limiter backs the rate_limit decorator.
+
+Per identifier the script uses two keys:
+  td_ratelimit:<scope>:<id>          sorted set of hit timestamps (ms) inside the window
+  td_ratelimit:<scope>:<id>:blocked  cooldown marker; its TTL is the remaining cooldown
+Checking and recording for all identifiers happens atomically in a single round trip, so
+concurrent failures cannot overshoot the limit. Without Redis at startup the local store's
+client runs the native equivalent registered below, in one SQLite transaction (see local_store).
+"""
+import time
+import uuid
+from ..extensions import get_redis
+from ..config import (
+    REDIS_RATE_LIMIT_PREFIX,
+    MAX_LOGIN_ATTEMPTS,
+    LOGIN_ATTEMPT_WINDOW_SECONDS,
+    LOGIN_COOLDOWN_SECONDS,
+    SESSION_FLUSH_BATCH_SIZE,
+)
+from .local_store import native_script
+from .metrics_service import inc
+from .session_service import unlink_batch
+
+LOGIN_SCOPE = "login"
+
+# KEYS: window_1, blocked_1, window_2, blocked_2, ...
+# ARGV: now_ms, window_ms, limit, cooldown_s, record (0/1), member
+# Returns {allowed, cooldown}: allowed is 1 if no identifier was cooling down before this call;
+# cooldown is the remaining cooldown in seconds afterwards (set when this hit reached the limit).
+_SLIDING_WINDOW_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local cooldown = tonumber(ARGV[4])
+local record = ARGV[5] == '1'
+local wait = 0
+for i = 2, #KEYS, 2 do
+  local ttl = redis.call('TTL', KEYS[i])
+  if ttl > wait then wait = ttl end
+end
+if wait > 0 then
+  return {0, wait}
+end
+if not record then
+  return {1, 0}
+end
+for i = 1, #KEYS, 2 do
+  redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now - window)
+  redis.call('ZADD', KEYS[i], now, ARGV[6])
+  redis.call('PEXPIRE', KEYS[i], window)
+  if redis.call('ZCARD', KEYS[i]) >= limit then
+    redis.call('SET', KEYS[i + 1], '1', 'EX', cooldown)
+    redis.call('DEL', KEYS[i])
+    wait = cooldown
+  end
+end
+return {1, wait}
+"""
+
+
+@native_script(_SLIDING_WINDOW_LUA)
+def _sliding_window_local(store, keys, args):
+    """The script on the local store: same keys and result, timestamps kept in its hits table."""
+    _, window_ms, limit, cooldown, record, _ = args
+    allowed, wait = store.sliding_window_hit(keys, window_ms / 1000, limit, cooldown, record == 1)
+    return [int(allowed), wait]
+
+
+_scripts = {}
+
+
+def _script(r):
+    """Registered script per client; redis-py loads it with EVALSHA and falls back to EVAL."""
+    script = _scripts.get(id(r))
+    if script is None:
+        script = _scripts[id(r)] = r.register_script(_SLIDING_WINDOW_LUA)
+    return script
+
+
+def get_rate_limit_key(identifier, scope=LOGIN_SCOPE):
+    return f"{REDIS_RATE_LIMIT_PREFIX}{scope}:{identifier}"
+
+
+def _keys(identifiers, scope):
+    keys = []
+    for identifier in identifiers:
+        key = get_rate_limit_key(identifier, scope)
+        keys += [key, f"{key}:blocked"]
+    return keys
+
+
+def hit(identifiers, limit, window_seconds, cooldown_seconds, scope, record=True):
+    """
+    Check the identifiers and, if none is cooling down and record is True, count one hit for each.
+    Returns (allowed, cooldown_seconds); cooldown is non-zero if an identifier is blocked after
+    this call. Fails open if Redis is unavailable.
+    """
+    allowed, wait = _hit(identifiers, limit, window_seconds, cooldown_seconds, scope, record)
+    if not allowed:
+        inc("td_rate_limit_blocks_total", scope)
+    return allowed, wait
+
+
+def _hit(identifiers, limit, window_seconds, cooldown_seconds, scope, record):
+    r = get_redis()
+    if not r or not identifiers:
+        return True, 0
+    try:
+        allowed, wait = _script(r)(
+            keys=_keys(identifiers, scope),
+            args=[
+                int(time.time() * 1000),
+                int(window_seconds * 1000),
+                limit,
+                cooldown_seconds,
+                1 if record else 0,
+                uuid.uuid4().hex,
+            ],
+        )
+        return bool(allowed), max(0, int(wait))
+    except Exception:
+        return True, 0  # Redis unavailable, allow
+
+
+def clear(identifiers, scope):
+    r = get_redis()
+    if not identifiers:
+        return
+    if r:
+        try:
+            r.delete(*_keys(identifiers, scope))
+        except Exception:
+            pass  # Redis unavailable
+
+
+def clear_all():
+    """
+    Drop every counter and cooldown (all scopes), e.g. after a restore replaced the users.
+    Keys are streamed from SCAN and unlinked in batches of SESSION_FLUSH_BATCH_SIZE, as in flush_all_sessions.
+    """
+    r = get_redis()
+    if not r:
+        return
+    state = {"unlink": True}
+    try:
+        batch = []
+        for key in r.scan_iter(match=f"{REDIS_RATE_LIMIT_PREFIX}*", count=SESSION_FLUSH_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= SESSION_FLUSH_BATCH_SIZE:
+                unlink_batch(r, batch, state)
+                batch = []
+        if batch:
+            unlink_batch(r, batch, state)
+    except Exception:
+        pass  # Redis unavailable
+
+
+def login_cooldown(*identifiers):
+    """Remaining login cooldown in seconds across all identifiers (0 = allowed). One round trip."""
+    _, wait = hit(identifiers, MAX_LOGIN_ATTEMPTS, LOGIN_ATTEMPT_WINDOW_SECONDS, LOGIN_COOLDOWN_SECONDS, LOGIN_SCOPE, record=False)
+    return wait
+
+
+def is_rate_limited(identifier):
+    """Check if identifier is currently rate limited"""
+    return login_cooldown(identifier) > 0
+
+
+def get_remaining_cooldown(identifier):
+    """Return seconds remaining in cooldown, or 0."""
+    return login_cooldown(identifier)
+
+
+def record_failed_attempts(*identifiers):
+    """
+    Record a failed login against several identifiers (e.g. client IP and username) in one
+    atomic round trip. Returns True if any identifier is now blocked.
+    """
+    _, wait = hit(identifiers, MAX_LOGIN_ATTEMPTS, LOGIN_ATTEMPT_WINDOW_SECONDS, LOGIN_COOLDOWN_SECONDS, LOGIN_SCOPE)
+    return wait > 0
+
+
+def clear_rate_limit(*identifiers):
+    """Clear rate limit for one or more identifiers (e.g. after successful login) in one DEL."""
+    clear(identifiers, LOGIN_SCOPE)
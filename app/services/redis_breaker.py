@@ -0,0 +1,140 @@
+"""
+Circuit breaker shared by every Redis client in the process.
+
+After REDIS_BREAKER_FAILURE_THRESHOLD consecutive connection/timeout errors the breaker opens:
+get_redis() returns None (services take their no-Redis path) and direct client calls, such as
+Flask-Session's, fail immediately instead of waiting for socket timeouts. A background thread
+pings Redis every REDIS_BREAKER_PROBE_SECONDS and closes the breaker on the first success.
+"""
+import os
+import threading
+import time
+import redis
+from redis.client import Pipeline
+from .metrics_service import add_redis_time, enabled as metrics_enabled
+from .tracing import current_trace, record_span
+
+CLOSED = "closed"
+OPEN = "open"
+
+_FAILURES = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, probe_seconds):
+        self.failure_threshold = failure_threshold
+        self.probe_seconds = probe_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+        self.last_error = None
+        self.probe = None  # callable raising on failure; set by init_redis
+        self._lock = threading.Lock()
+        self._probe_pid = None
+
+    def allow(self):
+        if self.state == CLOSED:
+            return True
+        if self._probe_pid != os.getpid():
+            self._start_probe()  # forked while open: this process has no probe thread yet
+        return False
+
+    def record_success(self):
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+
+    def record_failure(self, exc):
+        with self._lock:
+            self.failures += 1
+            self.last_error = f"{type(exc).__name__}: {exc}"
+            if self.state == CLOSED and self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.time()
+                self.trips += 1
+                self._start_probe()
+
+    def _start_probe(self):
+        self._probe_pid = os.getpid()
+        threading.Thread(target=self._probe_loop, name="redis-breaker-probe", daemon=True).start()
+
+    def _probe_loop(self):
+        while self.state == OPEN:
+            time.sleep(self.probe_seconds)
+            try:
+                self.probe()
+            except Exception as exc:
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                continue
+            with self._lock:
+                self.state = CLOSED
+                self.failures = 0
+                self.opened_at = None
+
+    def snapshot(self):
+        """State for the developer dashboard."""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "opened_at": self.opened_at,
+            "last_error": self.last_error,
+        }
+
+
+class BreakerPipeline(Pipeline):
+    breaker = None
+
+    def execute(self, raise_on_error=True):
+        if not self.breaker.allow():
+            self.reset()
+            raise redis.exceptions.ConnectionError("Redis circuit open")
+        stack = self.command_stack  # execute() resets it to a new list
+        started = time.perf_counter()
+        try:
+            result = super().execute(raise_on_error)
+        except _FAILURES as exc:
+            self.breaker.record_failure(exc)
+            raise
+        finally:
+            if metrics_enabled():
+                add_redis_time(time.perf_counter() - started)
+            if current_trace() is not None:
+                record_span("pipeline", "redis", started, " ".join(str(args[0]) for args, _ in stack)[:200])
+        self.breaker.record_success()
+        return result
+
+
+class BreakerRedis(redis.Redis):
+    """redis.Redis that reports to (and is short-circuited by) a CircuitBreaker."""
+
+    breaker = None
+
+    def execute_command(self, *args, **options):
+        if not self.breaker.allow():
+            raise redis.exceptions.ConnectionError("Redis circuit open")
+        started = time.perf_counter()
+        try:
+            result = super().execute_command(*args, **options)
+        except _FAILURES as exc:
+            self.breaker.record_failure(exc)
+            raise
+        finally:
+            if metrics_enabled():
+                add_redis_time(time.perf_counter() - started)
+            if current_trace() is not None:
+                record_span(str(args[0]), "redis", started)
+        self.breaker.record_success()
+        return result
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = BreakerPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.breaker = self.breaker
+        return pipe
+
+
+def make_client(breaker, pool):
+    client = BreakerRedis(connection_pool=pool)
+    client.breaker = breaker
+    return client
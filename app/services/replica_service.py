@@ -0,0 +1,93 @@
+"""
+Read-replica routing (DATABASE_REPLICA_URL).
+
+Views decorated with @replica_reads run their ORM SELECTs on the "replica" bind; everything else,
+including flushes, raw SQL and reads right after a write (verification.result), stays on the
+primary. The replica is used only while it is reachable, streaming WAL from the primary and its
+replication lag is at most REPLICA_MAX_LAG_SECONDS; lag is measured at most every REPLICA_LAG_CHECK_SECONDS per worker, and
+when the guard trips reads go back to the primary until a later check passes.
+"""
+import threading
+import time
+from flask import current_app, g, has_app_context
+from ..extensions import db
+
+REPLICA_BIND = "replica"
+
+# (standby?, WAL receiver streaming?, seconds since the last replayed transaction or 0 when the
+# standby has replayed everything it received). Received == replayed also holds for a standby that
+# lost its primary, so lag is only trusted while the receiver streams. Without pg_read_all_stats the
+# status column reads NULL; a receiver process (a row) then counts as streaming.
+_PG_LAG_SQL = (
+    "SELECT pg_is_in_recovery(), "
+    "EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE COALESCE(status, 'streaming') = 'streaming'), "
+    "CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+_lock = threading.Lock()
+_state = {"checked_at": 0.0, "usable": False, "lag": None, "error": None}
+
+
+def replica_configured():
+    return has_app_context() and REPLICA_BIND in (current_app.config.get("SQLALCHEMY_BINDS") or {})
+
+
+class ReplicaDisconnected(Exception):
+    """The standby's WAL receiver is not streaming from the primary, so its lag is unknown."""
+
+
+def measure_lag(engine):
+    """
+    Replication lag of the replica in seconds. Only PostgreSQL standbys report it; others count as 0.
+    Raises ReplicaDisconnected for a standby that is not streaming (archive-only standbys included).
+    """
+    with engine.connect() as conn:
+        if conn.dialect.name != "postgresql":
+            conn.execute(db.text("SELECT 1"))
+            return 0.0
+        in_recovery, streaming, lag = conn.execute(db.text(_PG_LAG_SQL)).one()
+        if not in_recovery:
+            return 0.0
+        if not streaming:
+            raise ReplicaDisconnected("WAL receiver not streaming from the primary")
+        return float(lag or 0)
+
+
+def _check(engine):
+    max_lag = current_app.config["REPLICA_MAX_LAG_SECONDS"]
+    try:
+        lag = measure_lag(engine)
+        error = None if lag <= max_lag else f"lag {lag:.1f}s over {max_lag}s"
+    except Exception as e:
+        lag, error = None, str(e)
+    if error and error != _state["error"]:
+        current_app.logger.warning("Read replica not used: %s", error)
+    elif not error and _state["error"]:
+        current_app.logger.info("Read replica back in use (lag %.1fs)", lag)
+    _state.update(checked_at=time.monotonic(), usable=error is None, lag=lag, error=error)
+
+
+def replica_engine():
+    """Engine for replica reads, or None if no replica is configured or the lag guard tripped."""
+    if not replica_configured():
+        return None
+    engine = db.engines[REPLICA_BIND]
+    if time.monotonic() - _state["checked_at"] >= current_app.config["REPLICA_LAG_CHECK_SECONDS"]:
+        with _lock:
+            if time.monotonic() - _state["checked_at"] >= current_app.config["REPLICA_LAG_CHECK_SECONDS"]:
+                _check(engine)
+    return engine if _state["usable"] else None
+
+
+def use_replica():
+    """True inside a @replica_reads view."""
+    return has_app_context() and g.get("db_replica_reads", False)
+
+
+def replica_status():
+    """{usable, lag, error} for the developer dashboard (None if no replica)."""
+    if not replica_configured():
+        return None
+    replica_engine()
+    return {"usable": _state["usable"], "lag": _state["lag"], "error": _state["error"]}
@@ -0,0 +1,383 @@
+"""
+Database restores as background jobs, started from the developer backup page.
+
+A restore runs in a daemon thread of the worker that accepted the request, so no request (and no
+proxy timeout) waits for it. Its state is one JSON document under REDIS_RESTORE_JOB_KEY in Redis
+(the local store's client without Redis at startup), so any worker can report progress and accept a
+cancel. Without either no restore starts, and a job that cannot save its state for half of
+RESTORE_JOB_STALE_SECONDS aborts before other workers take it for dead:
+
+  id, backup, format, started_by, started_at, updated_at, finished_at
+  phase   verifying | restoring | finishing | done | failed | cancelled
+  done, total, unit   progress of the current phase: bytes (checksum, .db and .sql restores),
+                      archive objects (.pgdump restores) or sessions (finishing)
+  message, maintenance (True while the job holds or left maintenance mode on)
+  host, pid, child    the worker running the job and its pg_restore/psql client ({pid, name})
+
+The progress page polls with a signed token (progress_token) instead of the login session, since
+the restore ends by logging everyone out and a PostgreSQL restore drops the users table while it
+runs; the token names one job, expires after RESTORE_PROGRESS_TOKEN_SECONDS and only reveals the
+phase and progress numbers (progress_for_token).
+
+One restore runs at a time: start() claims REDIS_RESTORE_JOB_KEY:lock with SET NX. The job writes
+its state at least every half second while it runs, refreshing the lock; when the worker dies the
+lock expires after RESTORE_JOB_STALE_SECONDS, the job is reported as failed and a new restore can
+start. The restore client runs in its own session and survives its worker, so each worker starting
+on the same host stops it (recover) and marks the job failed.
+
+Sequence: check the backup's checksum against the catalog, enable maintenance mode (developers
+stay logged in to watch and cancel), restore with progress, then flush all sessions and rate-limit
+counters, drop pooled connections, audit the restore in the restored database and leave
+maintenance mode (unless it was on before the restore). A job cancelled or failing before the
+database is touched, or during a SQLite restore (the online backup copy is rolled back), leaves the
+database as it was. A PostgreSQL restore stopped part-way leaves the database incomplete, so
+sessions are flushed and maintenance mode stays on until a developer restores again.
+"""
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from ..extensions import db, get_redis
+from ..config import (
+    REDIS_RESTORE_JOB_KEY,
+    RESTORE_JOB_KEEP_SECONDS,
+    RESTORE_JOB_STALE_SECONDS,
+    RESTORE_PROGRESS_TOKEN_SECONDS,
+)
+from . import backup_catalog
+from .audit_service import log_restore_db
+from .backup_service import RestoreCancelled, get_db_url, restore_from_file
+from .maintenance_service import is_maintenance_mode, set_maintenance_mode
+from .rate_limit_service import clear_all as clear_rate_limits
+from .session_service import flush_all_sessions
+
+LOCK_KEY = f"{REDIS_RESTORE_JOB_KEY}:lock"
+CANCEL_KEY = f"{REDIS_RESTORE_JOB_KEY}:cancel"
+RUNNING = ("verifying", "restoring", "finishing")
+SAVE_SECONDS = 0.5  # state writes and cancel checks at most this often
+
+HOST = socket.gethostname()
+
+
+class RestoreFailed(Exception):
+    pass
+
+
+class StateUnavailable(Exception):
+    """Neither Redis nor the local store is reachable, so workers cannot share the job state."""
+
+
+# ---- shared state ----
+
+def _store():
+    r = get_redis()
+    if r is None:
+        raise StateUnavailable("Redis is unavailable")
+    return r
+
+
+def _get(key):
+    return _store().get(key)
+
+
+def _set(key, value, ttl=None, only_new=False):
+    """Store value, expiring after ttl seconds. With only_new only if key is absent. Returns True if stored."""
+    return bool(_store().set(key, value, ex=ttl, nx=only_new))
+
+
+def _delete(key):
+    _store().delete(key)
+
+
+def _now():
+    return datetime.utcnow().isoformat(sep=" ", timespec="seconds")
+
+
+class _Job:
+    """The running job: throttled state writes, which also refresh the lock, and cancel checks."""
+
+    def __init__(self, state):
+        self.state = state
+        self._saved_at = 0.0
+        self._stored_at = time.monotonic()
+        self._checked_at = 0.0
+        self._cancelled = False
+
+    def update(self, force=False, **fields):
+        self.state.update(fields)
+        now = time.monotonic()
+        if not force and now - self._saved_at < SAVE_SECONDS:
+            return
+        self._saved_at = now
+        self.state["heartbeat"] = time.time()
+        self.state["updated_at"] = _now()
+        running = self.state["phase"] in RUNNING
+        try:
+            _set(REDIS_RESTORE_JOB_KEY, json.dumps(self.state), ttl=None if running else RESTORE_JOB_KEEP_SECONDS)
+            if running:
+                _set(LOCK_KEY, self.state["id"], ttl=RESTORE_JOB_STALE_SECONDS)
+            elif _get(LOCK_KEY) == self.state["id"]:
+                _delete(LOCK_KEY)
+            self._stored_at = now
+        except Exception:
+            current_app.logger.warning("Could not save restore job state", exc_info=True)
+
+    def lost(self):
+        """
+        True once the state could not be saved for half of RESTORE_JOB_STALE_SECONDS: other workers
+        are about to see the job as dead and could start another restore, so this one must stop.
+        """
+        return time.monotonic() - self._stored_at > RESTORE_JOB_STALE_SECONDS / 2
+
+    def child_started(self, pid, name):
+        """Record the restore client so a worker started after this one dies can stop it (recover)."""
+        self.update(force=True, child={"pid": pid, "name": name})
+
+    def progress(self, done, total=None):
+        self.update(done=done, total=self.state["total"] if total is None else total)
+
+    def cancelled(self):
+        if self.lost():
+            return True
+        now = time.monotonic()
+        if now - self._checked_at >= SAVE_SECONDS:
+            self._checked_at = now
+            try:
+                self._cancelled = _get(CANCEL_KEY) == self.state["id"]
+            except Exception:
+                pass
+        return self._cancelled
+
+
+# ---- public API ----
+
+def current():
+    """
+    State of the running or last restore job, or None. A job whose worker stopped writing its
+    state (restarted or killed) is returned as failed.
+    """
+    try:
+        raw = _get(REDIS_RESTORE_JOB_KEY)
+    except StateUnavailable:
+        return None
+    if not raw:
+        return None
+    job = json.loads(raw)
+    if job["phase"] in RUNNING and time.time() - job["heartbeat"] > RESTORE_JOB_STALE_SECONDS:
+        job.update(phase="failed", message=(
+            "The worker running the restore stopped responding. The database may be incomplete: "
+            "check it, or restore again, before leaving maintenance mode."))
+    job["running"] = job["phase"] in RUNNING
+    return job
+
+
+def start(backup_name, user_id, username):
+    """Restore a cataloged backup in the background. Returns (job state, None) or (None, error message)."""
+    entry = backup_catalog.get(os.path.basename(backup_name or ""))
+    if entry is None or not os.path.exists(entry["path"]):
+        return None, "Invalid backup file."
+    url = get_db_url()
+    if not url:
+        return None, "No database configured."
+    if not entry["name"].endswith((".db",) if url.startswith("sqlite") else (".pgdump", ".sql")):
+        return None, f"{entry['name']} is not a backup of this database type."
+    job_id = uuid.uuid4().hex
+    try:
+        recover()
+        if not _set(LOCK_KEY, job_id, ttl=RESTORE_JOB_STALE_SECONDS, only_new=True):
+            return None, "Another restore is in progress."
+        _delete(CANCEL_KEY)
+    except StateUnavailable:
+        return None, "Restores need Redis to coordinate workers and it is unavailable. Try again shortly."
+    state = {
+        "id": job_id, "backup": entry["name"], "format": entry["format"], "host": HOST, "pid": os.getpid(),
+        "child": None, "user_id": user_id, "started_by": username, "started_at": _now(), "updated_at": None,
+        "finished_at": None, "heartbeat": time.time(), "phase": "verifying", "done": 0, "total": 0,
+        "unit": "bytes", "message": "Starting", "maintenance": False,
+    }
+    job = _Job(state)
+    job.update(force=True)
+    thread = threading.Thread(
+        target=_run, args=(current_app._get_current_object(), job, entry), name="restore-job", daemon=True
+    )
+    thread.start()
+    return dict(state, running=True), None
+
+
+def cancel(job_id):
+    """Ask a running job to stop; it stops at its next progress step. Returns False if it is not running."""
+    job = current()
+    if not job or job["id"] != job_id or not job["running"]:
+        return False
+    _set(CANCEL_KEY, job_id, ttl=RESTORE_JOB_STALE_SECONDS)
+    return True
+
+
+def _worker_alive(pid):
+    if pid == os.getpid():
+        return False  # this process just started: the pid was reused
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _is_restore_client(pid, name):
+    """True if pid is still the restore client that was recorded (not a reused pid)."""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return os.path.basename(f.read().split(b"\0")[0].decode(errors="replace")) == name
+    except FileNotFoundError:
+        return False
+    except OSError:  # no /proc: a session leader (start_new_session) with that pid is taken as the client
+        try:
+            return os.getpgid(pid) == pid
+        except ProcessLookupError:
+            return False
+
+
+def recover():
+    """
+    Stop the restore client of a job whose worker on this host died (restart or crash); pg_restore
+    runs in its own session and outlives it. The job is marked failed, its lock released and
+    maintenance mode left on: the database is incomplete. Called when each worker starts and
+    before a restore starts. Jobs of other hosts are only reported failed once stale (current()).
+    """
+    raw = _get(REDIS_RESTORE_JOB_KEY)
+    if not raw:
+        return
+    state = json.loads(raw)
+    if state["phase"] not in RUNNING or state.get("host") != HOST or _worker_alive(state.get("pid", 0)):
+        return
+    child = state.get("child")
+    if child and _is_restore_client(child["pid"], child["name"]):
+        try:
+            os.killpg(child["pid"], signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        current_app.logger.warning("Stopped %s (pid %s) left by a restore whose worker died",
+                                   child["name"], child["pid"])
+    job = _Job(state)
+    job.update(force=True, phase="failed", finished_at=_now(), maintenance=True, child=None, message=(
+        "The worker running the restore stopped; its restore client was stopped. The database may be "
+        "incomplete: check it, or restore again, before leaving maintenance mode."))
+
+
+def _token_serializer():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt="restore-progress")
+
+
+def progress_token(job_id):
+    """Signed, expiring token that lets the progress page poll job_id without a session."""
+    return _token_serializer().dumps(job_id)
+
+
+def progress_for_token(token):
+    """Phase and progress numbers of the job the token names, or None (bad, expired or other job)."""
+    try:
+        job_id = _token_serializer().loads(token or "", max_age=RESTORE_PROGRESS_TOKEN_SECONDS)
+    except BadSignature:  # includes SignatureExpired
+        return None
+    job = current()
+    if not job or job["id"] != job_id:
+        return None
+    return {field: job[field] for field in ("phase", "running", "done", "total", "unit")}
+
+
+# ---- the job ----
+
+def _verify(job, entry):
+    """Check the backup against its catalog checksum before anything is changed."""
+    if not entry["sha256"]:
+        job.update(force=True, message="No checksum in the catalog; backup not verified")
+        return
+    job.update(force=True, phase="verifying", done=0, total=backup_catalog.download_size(entry["path"]),
+               unit="bytes", message=f"Verifying checksum of {entry['name']}")
+
+    def progress(done):
+        if job.cancelled():
+            raise RestoreCancelled()
+        job.progress(done)
+
+    if backup_catalog.checksum(entry["path"], progress=progress) != entry["sha256"]:
+        raise RestoreFailed(f"{entry['name']} does not match its catalog checksum; nothing was restored.")
+
+
+def _invalidate(job):
+    """Forget everything that refers to the replaced database: sessions, login counters, pooled connections."""
+    job.update(force=True, phase="finishing", done=0, total=0, unit="sessions", message="Logging out all users")
+    removed = flush_all_sessions(progress=job.progress)
+    clear_rate_limits()
+    db.session.remove()
+    for engine in db.engines.values():
+        engine.dispose()
+    return removed
+
+
+def _run(app, job, entry):
+    with app.app_context():
+        state = job.state
+        started = time.monotonic()
+        was_maintenance = is_maintenance_mode()
+        touched = False  # the live database may have been changed
+        entered = False  # this job turned maintenance mode on
+        try:
+            _verify(job, entry)
+            if not set_maintenance_mode(True):
+                raise RestoreFailed("Restore refused: maintenance mode could not be turned on (Redis unavailable).")
+            entered = True
+            pg_archive = entry["name"].endswith(".pgdump")
+            job.update(force=True, phase="restoring", done=0, total=0, maintenance=True,
+                       unit="objects" if pg_archive else "bytes", message=f"Restoring {entry['name']}")
+            touched = not entry["name"].endswith(".db")  # a cancelled or failed SQLite copy is rolled back
+            ok, error = restore_from_file(entry["path"], state["user_id"], state["started_by"],
+                                          progress=job.progress, cancelled=job.cancelled,
+                                          started=job.child_started)
+            if not ok:
+                raise RestoreFailed(f"Restore failed: {error or 'unknown'}")
+            touched = True
+            removed = _invalidate(job)
+            try:
+                log_restore_db(None, state["started_by"], f"{entry['name']} (restored in {time.monotonic() - started:.0f} s)")
+            except Exception:
+                db.session.rollback()
+            still_on = was_maintenance or not set_maintenance_mode(False)
+            job.update(force=True, phase="done", maintenance=still_on, finished_at=_now(), message=(
+                f"Restored {entry['name']} in {time.monotonic() - started:.0f} s. {removed} session(s) logged out; "
+                + ("maintenance mode was on before the restore and is still on." if was_maintenance
+                   else "maintenance mode is still on (Redis unavailable); turn it off from the maintenance page."
+                   if still_on else "maintenance mode is off.")))
+        except Exception as e:
+            cancelled = isinstance(e, RestoreCancelled)
+            if cancelled and job.lost():
+                cancelled = False
+                message = "Restore aborted: its state could not be saved (Redis unavailable)."
+            elif cancelled:
+                message = "Cancelled."
+            elif isinstance(e, RestoreFailed):
+                message = str(e)
+            else:
+                app.logger.exception("Restore of %s failed", entry["name"])
+                message = f"Restore failed: {e}"
+            if touched:
+                try:
+                    _invalidate(job)
+                except Exception:
+                    app.logger.exception("Could not invalidate sessions after a failed restore")
+                message += " The database may be incomplete; maintenance mode stays on until it is restored."
+            still_on = touched or was_maintenance
+            if not still_on:
+                still_on = entered and not set_maintenance_mode(False)
+                message += " The database was not changed." + (
+                    " Maintenance mode is still on (Redis unavailable)." if still_on else "")
+            job.update(force=True, phase="cancelled" if cancelled else "failed", finished_at=_now(), message=message,
+                       maintenance=still_on)
@@ -0,0 +1,50 @@
+"""
+Bounded lists of recent JSON records shared by all workers (slow query log, memory samples).
+
+Backed by a Redis list capped with LPUSH + LTRIM (the local store's client when Redis was
+unavailable at startup); without either by a per-process deque.
+"""
+import collections
+import json
+import threading
+
+_fallback = {}
+_fallback_lock = threading.Lock()
+
+
+def push(key, record, maxlen):
+    from ..extensions import get_redis
+    value = json.dumps(record)
+    r = get_redis()
+    if r:
+        pipe = r.pipeline(transaction=False)
+        pipe.lpush(key, value)
+        pipe.ltrim(key, 0, maxlen - 1)
+        pipe.execute()
+        return
+    with _fallback_lock:
+        ring = _fallback.get(key)
+        if ring is None or ring.maxlen != maxlen:
+            ring = _fallback[key] = collections.deque(ring or (), maxlen=maxlen)
+        ring.appendleft(value)
+
+
+def items(key):
+    """Records of key, newest first."""
+    from ..extensions import get_redis
+    r = get_redis()
+    if r:
+        values = r.lrange(key, 0, -1)
+    else:
+        with _fallback_lock:
+            values = list(_fallback.get(key, ()))
+    return [json.loads(v) for v in values]
+
+
+def clear(key):
+    from ..extensions import get_redis
+    r = get_redis()
+    if r:
+        r.delete(key)
+    with _fallback_lock:
+        _fallback.pop(key, None)
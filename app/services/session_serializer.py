@@ -0,0 +1,149 @@
+"""
+Compact, signed session serializer for Flask-Session (SESSION_SERIALIZER = "compact").
+
+Stored format:  version (1 byte) | 16-byte keyed BLAKE2b MAC of version + body | msgpack body
+The body is a map keyed by small integers for the keys this app writes (Flask-Login, CSRF,
+flashes, activity); any other key is kept as a string. Hex tokens (_id, csrf_token) are stored as
+raw bytes and numeric user ids as integers, each restored to the exact original string.
+
+Blobs written before this format (plain msgpack or JSON from Flask-Session) carry no signature.
+They are read only while SESSION_ACCEPT_LEGACY is on and before SESSION_ACCEPT_LEGACY_UNTIL (by
+default one PERMANENT_SESSION_LIFETIME after the first worker started, kept in Redis), so sessions open across the
+upgrade stay valid and are rewritten in the compact format on their next save. After one session
+lifetime every legacy blob has expired from Redis: _decode_legacy and the two settings are to be
+removed in the release after the compact format ships.
+Pickle is never used; a blob that fails the signature check or cannot be decoded is treated
+as no session.
+"""
+import hashlib
+import hmac
+import time
+from datetime import datetime, timezone
+import msgspec
+from flask_session.base import Serializer
+
+from ..extensions import get_redis
+
+VERSION = 1
+_PREFIX = bytes([VERSION])
+_MAC_BYTES = 16
+
+# Field tags are part of the stored format: never reuse or renumber, only append
+_FIELDS = {
+    "_user_id": 1,
+    "_fresh": 2,
+    "_id": 3,
+    "csrf_token": 4,
+    "last_activity": 5,
+    "_permanent": 6,
+    "_flashes": 7,
+    "_remember": 8,
+    "_remember_seconds": 9,
+}
+_NAMES = {tag: name for name, tag in _FIELDS.items()}
+
+
+def _pack_value(value):
+    """Shrink strings that have an exact compact form; the msgpack type marks which form was used."""
+    if isinstance(value, str) and value:
+        if value.isascii() and value.isdigit() and str(int(value)) == value:
+            return int(value)
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            return value
+        if raw.hex() == value:  # lowercase hex without separators only
+            return raw
+    return value
+
+
+def _unpack_value(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+_PACKED = {"_user_id", "_id", "csrf_token"}
+
+
+def _legacy_cutoff(app):
+    """
+    Epoch seconds until which legacy blobs are read (0: never). Without SESSION_ACCEPT_LEGACY_UNTIL
+    the cutoff is one session lifetime after the first worker started, stored once in Redis (SET NX)
+    so later restarts reuse it instead of reopening the window. No store to keep it in: never.
+    """
+    config = app.config
+    if not config.get("SESSION_ACCEPT_LEGACY", True):
+        return 0.0
+    until = config.get("SESSION_ACCEPT_LEGACY_UNTIL")
+    if until:
+        return datetime.fromisoformat(until).replace(tzinfo=timezone.utc).timestamp()
+    key = config["REDIS_SESSION_LEGACY_UNTIL_KEY"]
+    cutoff = time.time() + config["PERMANENT_SESSION_LIFETIME"].total_seconds()
+    r = get_redis()
+    try:
+        if r is None:
+            raise ConnectionError("no Redis or local store")
+        r.set(key, str(cutoff), nx=True)
+        return float(r.get(key))
+    except Exception as e:
+        app.logger.warning(
+            "Legacy sessions not accepted: cutoff could not be stored in %s (%s); "
+            "set SESSION_ACCEPT_LEGACY_UNTIL to read them", key, e,
+        )
+        return 0.0
+
+
+class CompactSessionSerializer(Serializer):
+    def __init__(self, app):
+        self.app = app
+        self.key = hashlib.sha256(b"td-session-serializer:" + app.secret_key.encode()).digest()
+        self.encoder = msgspec.msgpack.Encoder()
+        self.decoder = msgspec.msgpack.Decoder()
+        self.json_decoder = msgspec.json.Decoder()
+        self.legacy_until = _legacy_cutoff(app)
+
+    def _mac(self, body):
+        return hashlib.blake2b(_PREFIX + body, key=self.key, digest_size=_MAC_BYTES).digest()
+
+    def encode(self, session):
+        data = {}
+        for name, value in dict(session).items():
+            if name in _PACKED:
+                value = _pack_value(value)
+            data[_FIELDS.get(name, name)] = value
+        body = self.encoder.encode(data)
+        return _PREFIX + self._mac(body) + body
+
+    def decode(self, serialized_data):
+        if serialized_data[:1] == _PREFIX:
+            mac, body = serialized_data[1:1 + _MAC_BYTES], serialized_data[1 + _MAC_BYTES:]
+            if not hmac.compare_digest(mac, self._mac(body)):
+                self.app.logger.warning("Session signature mismatch; discarding session")
+                return None
+            data = self.decoder.decode(body)
+            session = {}
+            for key, value in data.items():
+                name = _NAMES.get(key, key)
+                session[name] = _unpack_value(value) if name in _PACKED else value
+            return session
+        return self._decode_legacy(serialized_data)
+
+    def _decode_legacy(self, serialized_data):
+        """Sessions stored by Flask-Session's own serializer (msgpack, or JSON), until the cutoff."""
+        if time.time() >= self.legacy_until:
+            self.app.logger.warning("Unsigned legacy session after SESSION_ACCEPT_LEGACY cutoff; discarding session")
+            return None
+        for decoder in (self.decoder, self.json_decoder):
+            try:
+                data = decoder.decode(serialized_data)
+            except msgspec.DecodeError:
+                continue
+            if isinstance(data, dict):
+                return data
+        self.app.logger.warning("Undecodable session data; discarding session")
+        return None
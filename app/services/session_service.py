@@ -1,9 +1,23 @@
 """
 Redis-backed session: touch on each request (inactivity timeout), flush all (logout all), active session tracking.
+Activity is recorded at most once per SESSION_TOUCH_INTERVAL_SECONDS so the session blob is not rewritten on every request.
+
+Active sessions are indexed in sorted sets scored by last activity:
+  REDIS_ACTIVE_SESSIONS_KEY            members "user_id:sid" (all users)
+  REDIS_USER_SESSIONS_PREFIX<user_id>  members "sid" (one user)
+Entries older than PERMANENT_SESSION_LIFETIME are pruned by score range on each touch.
 """
 from flask import session
 from ..extensions import get_redis
-from ..config import REDIS_SESSION_PREFIX, REDIS_ACTIVE_SESSIONS_KEY, PERMANENT_SESSION_LIFETIME
+from ..config import (
+    REDIS_SESSION_PREFIX,
+    REDIS_ACTIVE_SESSIONS_KEY,
+    REDIS_USER_SESSIONS_PREFIX,
+    PERMANENT_SESSION_LIFETIME,
+    SESSION_TOUCH_INTERVAL_SECONDS,
+    SESSION_FLUSH_BATCH_SIZE,
+)
+import redis
 import time
 
 
@@ -11,50 +25,195 @@ def _session_key(sid):
     return f"{REDIS_SESSION_PREFIX}{sid}"
 
 
+def _user_sessions_key(user_id):
+    return f"{REDIS_USER_SESSIONS_PREFIX}{user_id}"
+
+
+def _active_cutoff(now=None):
+    return (now or time.time()) - PERMANENT_SESSION_LIFETIME.total_seconds()
+
+
 def touch_session(user_id):
-    """Refresh session activity so Redis TTL is extended when session is saved at end of request."""
-    session["last_activity"] = time.time()
-    session.modified = True
+    """
+    Refresh session activity so Redis TTL is extended when session is saved at end of request.
+    Skipped while the last touch is younger than SESSION_TOUCH_INTERVAL_SECONDS; otherwise the
+    session is marked modified (one session write) and active tracking is sent as one pipeline.
+    Requests in between are not recorded, so last_activity and the Redis TTL trail the real last
+    request by up to SESSION_TOUCH_INTERVAL_SECONDS: an idle session ends between
+    PERMANENT_SESSION_LIFETIME - SESSION_TOUCH_INTERVAL_SECONDS and PERMANENT_SESSION_LIFETIME
+    after its last request. Returns True if activity was written.
+    """
+    now = time.time()
+    last = session.get("last_activity")
+    if last is not None and now - last < SESSION_TOUCH_INTERVAL_SECONDS:
+        return False
+    session["last_activity"] = now
     r = get_redis()
     if r:
         try:
-            sid = session.get("_sid")
+            sid = getattr(session, "sid", None)
             if sid:
-                r.sadd(REDIS_ACTIVE_SESSIONS_KEY, f"{user_id}:{sid}")
-            r.expire(REDIS_ACTIVE_SESSIONS_KEY, 86400)
+                ttl = int(PERMANENT_SESSION_LIFETIME.total_seconds())
+                user_key = _user_sessions_key(user_id)
+                pipe = r.pipeline(transaction=False)
+                pipe.zadd(REDIS_ACTIVE_SESSIONS_KEY, {f"{user_id}:{sid}": now})
+                pipe.zremrangebyscore(REDIS_ACTIVE_SESSIONS_KEY, "-inf", _active_cutoff(now))
+                pipe.expire(REDIS_ACTIVE_SESSIONS_KEY, ttl)
+                pipe.zadd(user_key, {sid: now})
+                pipe.zremrangebyscore(user_key, "-inf", _active_cutoff(now))
+                pipe.expire(user_key, ttl)
+                pipe.execute()
         except Exception:
             pass  # Redis unavailable, continue without tracking
+    return True
+
+
+def untrack_session(user_id):
+    """Remove the current session from the active index (on logout or inactivity expiry)."""
+    sid = getattr(session, "sid", None)
+    r = get_redis()
+    if not r or not sid:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.zrem(REDIS_ACTIVE_SESSIONS_KEY, f"{user_id}:{sid}")
+        pipe.zrem(_user_sessions_key(user_id), sid)
+        pipe.execute()
+    except Exception:
+        pass  # Redis unavailable
 
 
 def get_active_sessions_count():
-    """Count of distinct session IDs in active set (approximate)."""
+    """Count of sessions active within PERMANENT_SESSION_LIFETIME."""
     r = get_redis()
     if not r:
         return 0
     try:
-        return r.scard(REDIS_ACTIVE_SESSIONS_KEY)
+        return r.zcount(REDIS_ACTIVE_SESSIONS_KEY, _active_cutoff(), "+inf")
+    except Exception:
+        return 0
+
+
+def list_active_sessions():
+    """
+    Active sessions grouped by user: {user_id: [(sid, last_activity), ...]}, newest first.
+    """
+    r = get_redis()
+    if not r:
+        return {}
+    try:
+        entries = r.zrevrangebyscore(REDIS_ACTIVE_SESSIONS_KEY, "+inf", _active_cutoff(), withscores=True)
+    except Exception:
+        return {}
+    by_user = {}
+    for member, score in entries:
+        user_id, _, sid = member.partition(":")
+        if not user_id.isdigit() or not sid:
+            continue
+        by_user.setdefault(int(user_id), []).append((sid, score))
+    return by_user
+
+
+def get_user_sessions(user_id):
+    """Active session IDs for one user as [(sid, last_activity), ...], newest first."""
+    r = get_redis()
+    if not r:
+        return []
+    try:
+        return r.zrevrangebyscore(_user_sessions_key(user_id), "+inf", _active_cutoff(), withscores=True)
     except Exception:
+        return []
+
+
+def revoke_user_sessions(user_id, sid=None):
+    """
+    Log out one user's sessions (or a single session if sid is given) by deleting the
+    session keys and index entries. Returns number of sessions revoked.
+    """
+    r = get_redis()
+    if not r:
         return 0
+    user_key = _user_sessions_key(user_id)
+    try:
+        if sid:
+            sids = [sid] if r.zscore(user_key, sid) is not None else []
+        else:
+            sids = r.zrange(user_key, 0, -1)
+        if not sids:
+            return 0
+        pipe = r.pipeline(transaction=False)
+        pipe.delete(*[_session_key(s) for s in sids])
+        pipe.zrem(REDIS_ACTIVE_SESSIONS_KEY, *[f"{user_id}:{s}" for s in sids])
+        if sid:
+            pipe.zrem(user_key, sid)
+        else:
+            pipe.delete(user_key)
+        pipe.execute()
+        return len(sids)
+    except Exception:
+        return 0  # Redis unavailable
 
 
 def is_session_expired():
-    """True if last_activity is older than PERMANENT_SESSION_LIFETIME."""
+    """
+    True if last_activity is older than PERMANENT_SESSION_LIFETIME.
+    last_activity and the Redis session TTL are both refreshed by the same touch, so they expire together,
+    up to SESSION_TOUCH_INTERVAL_SECONDS before the lifetime has passed since the last request (touch_session).
+    """
     last = session.get("last_activity")
     if last is None:
         return False
     return (time.time() - last) > PERMANENT_SESSION_LIFETIME.total_seconds()
 
 
-def flush_all_sessions():
-    """Logout all users: delete all session keys and active set."""
+def unlink_batch(r, keys, state):
+    """Remove keys in one pipelined round trip; UNLINK reclaims memory off the main thread."""
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        if state["unlink"]:
+            pipe.unlink(key)
+        else:
+            pipe.delete(key)
+    try:
+        return sum(pipe.execute())
+    except redis.exceptions.ResponseError:
+        if not state["unlink"]:
+            raise
+        state["unlink"] = False  # Redis < 4.0 has no UNLINK
+        return unlink_batch(r, keys, state)
+
+
+def flush_all_sessions(progress=None):
+    """
+    Logout all users: delete all session keys and the active session index.
+    Keys are streamed from SCAN and removed in batches of SESSION_FLUSH_BATCH_SIZE, so neither
+    the key list nor any single command grows with the number of sessions.
+    progress(sessions_removed) is called after each batch. Returns number of sessions removed.
+    """
     r = get_redis()
     if not r:
-        return
+        return 0
+    state = {"unlink": True}
+    removed = 0
     try:
-        prefix = REDIS_SESSION_PREFIX
-        keys = list(r.scan_iter(match=f"{prefix}*", count=1000))
-        if keys:
-            r.delete(*keys)
-        r.delete(REDIS_ACTIVE_SESSIONS_KEY)
+        for pattern, counts in ((f"{REDIS_SESSION_PREFIX}*", True), (f"{REDIS_USER_SESSIONS_PREFIX}*", False)):
+            batch = []
+            for key in r.scan_iter(match=pattern, count=SESSION_FLUSH_BATCH_SIZE):
+                batch.append(key)
+                if len(batch) >= SESSION_FLUSH_BATCH_SIZE:
+                    n = unlink_batch(r, batch, state)
+                    batch = []
+                    if counts:
+                        removed += n
+                        if progress:
+                            progress(removed)
+            if batch:
+                n = unlink_batch(r, batch, state)
+                if counts:
+                    removed += n
+                    if progress:
+                        progress(removed)
+        unlink_batch(r, [REDIS_ACTIVE_SESSIONS_KEY], state)
     except Exception:
         pass  # Redis unavailable
+    return removed
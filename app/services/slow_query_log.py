@@ -0,0 +1,113 @@
+"""
+Slow query log (SLOW_QUERY_LOG), shown to developers at /developer/slow-queries.
+
+Every statement is timed; one that takes at least SLOW_QUERY_MS is recorded with its normalized
+SQL, duration, endpoint, user role and the line in app/ that issued it. Records go to a ring
+buffer of SLOW_QUERY_BUFFER entries shared by all workers (see ring_buffer).
+
+Statements are timed by the shared hook of sql_profiler (on_statement); fast ones only pay for the
+timing and a comparison, and the calling line is looked up (traceback) only for recorded ones. Off by
+default like SQL_PROFILING: with SLOW_QUERY_LOG=0 no hook is installed.
+Recording never raises: a failed write loses the record, not the request.
+"""
+import collections
+import hashlib
+import os
+import re
+import time
+import traceback
+from flask import g, has_request_context, request
+from . import ring_buffer, sql_profiler
+from .sql_profiler import on_statement, statement_shape
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_HOOK_FILES = (os.path.abspath(__file__), os.path.abspath(sql_profiler.__file__))
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+
+_state = {"threshold": 0.2, "maxlen": 500, "key": "td_slow_queries"}
+
+
+def fingerprint(statement):
+    """(fingerprint, normalized SQL): literals and parameter lists collapsed, whitespace folded."""
+    normalized = statement_shape(_NUMBER_LITERAL.sub("?", _STRING_LITERAL.sub("?", statement)))
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+def _location():
+    """'routes/admin.py:120 in export_verifications' for the innermost app frame outside the timing hook."""
+    for frame in reversed(traceback.extract_stack()):
+        path = os.path.abspath(frame.filename)
+        if path.startswith(_APP_DIR) and path not in _HOOK_FILES:
+            return f"{os.path.relpath(path, _APP_DIR)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+def _request_info():
+    if not has_request_context():
+        return "cli", None
+    # Flask-Login caches the loaded user on g. Read the role from the instance dict: attribute
+    # access on a user expired by a commit would run a refresh query from inside this hook.
+    user = g.get("_login_user")
+    return request.endpoint or "unmatched", vars(user).get("role") if user is not None else None
+
+
+def record(statement, seconds):
+    try:
+        fp, sql = fingerprint(statement)
+        endpoint, role = _request_info()
+        ring_buffer.push(_state["key"], {
+            "fp": fp,
+            "sql": sql[:4000],
+            "ms": round(seconds * 1000, 1),
+            "endpoint": endpoint,
+            "role": role or "anonymous",
+            "location": _location(),
+            "at": time.time(),
+        }, _state["maxlen"])
+    except Exception:
+        pass  # Redis or local store unavailable; drop the record
+
+
+def entries():
+    """Recorded slow statements, newest first."""
+    return ring_buffer.items(_state["key"])
+
+
+def clear():
+    ring_buffer.clear(_state["key"])
+
+
+def top_offenders(records):
+    """Records grouped by fingerprint, largest total time first."""
+    groups = {}
+    for rec in records:
+        group = groups.get(rec["fp"])
+        if group is None:
+            group = groups[rec["fp"]] = {
+                "fp": rec["fp"], "sql": rec["sql"], "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "last_at": 0.0, "location": rec["location"],
+                "endpoints": collections.Counter(), "roles": collections.Counter(),
+            }
+        group["count"] += 1
+        group["total_ms"] += rec["ms"]
+        if rec["ms"] > group["max_ms"]:
+            group["max_ms"], group["location"] = rec["ms"], rec["location"]
+        group["last_at"] = max(group["last_at"], rec["at"])
+        group["endpoints"][rec["endpoint"]] += 1
+        group["roles"][rec["role"]] += 1
+    for group in groups.values():
+        group["avg_ms"] = group["total_ms"] / group["count"]
+    return sorted(groups.values(), key=lambda grp: grp["total_ms"], reverse=True)
+
+
+def _on_statement(statement, started, elapsed):
+    if elapsed >= _state["threshold"]:
+        record(statement, elapsed)
+
+
+def install(app):
+    """Check every statement on every engine against SLOW_QUERY_MS. Call after db.init_app."""
+    _state.update(threshold=app.config["SLOW_QUERY_MS"] / 1000.0, maxlen=app.config["SLOW_QUERY_BUFFER"],
+                  key=app.config["REDIS_SLOW_QUERY_KEY"])
+    on_statement(app, _on_statement)
@@ -0,0 +1,147 @@
+"""
+Per-request SQL statement counter and N+1 detector (SQL_PROFILING).
+
+Counts the statements each request runs and the time spent in the database. Developers see the
+totals in X-SQL-Queries / X-SQL-Time-Ms response headers and in the page footer. When one
+statement shape runs more than SQL_N_PLUS_ONE_THRESHOLD times in a request (typically a lazy
+load in a loop, e.g. vi.td_item per row), a warning names the endpoint and the statement; with
+SQL_N_PLUS_ONE_RAISE (for tests) NPlusOneDetected is raised instead.
+
+When SQL_PROFILING is off nothing is installed, so there is no per-statement cost.
+
+on_statement() is the one cursor-execute timing hook per engine: the statement counter here, the
+slow query log and tracing subscribe to it instead of timing every statement again.
+"""
+import re
+import time
+import weakref
+from flask import current_app, g, has_app_context, request
+
+_TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+# Expanded IN lists vary in length per call: "IN (?, ?, ?)" / "IN (%(id_1_1)s, %(id_1_2)s)"
+_PARAM_LIST = re.compile(r"(?:\?|%\(\w+\)s)(?:\s*,\s*(?:\?|%\(\w+\)s))+")
+_subscribers = weakref.WeakKeyDictionary()  # engine -> [fn(statement, started, elapsed)]
+
+
+class NPlusOneDetected(Exception):
+    """A statement shape ran more than SQL_N_PLUS_ONE_THRESHOLD times in one request."""
+
+
+class RequestSqlStats:
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = {}
+
+    def repeated(self, threshold):
+        """[(count, shape)] of statement shapes run more than threshold times, most frequent first."""
+        shapes = {}
+        for statement, n in self.statements.items():
+            shape = statement_shape(statement)
+            shapes[shape] = shapes.get(shape, 0) + n
+        return sorted(((n, shape) for shape, n in shapes.items() if n > threshold), reverse=True)
+
+
+def statement_shape(statement):
+    return _PARAM_LIST.sub("?, ...", " ".join(statement.split()))
+
+
+def current_stats():
+    """RequestSqlStats of the current request (None outside requests or when profiling is off)."""
+    return g.get("sql_stats") if has_app_context() else None
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sql_profiler_start", []).append(time.perf_counter())
+
+
+def _on_error(context):
+    starts = context.connection.info.get("sql_profiler_start") if context.connection is not None else None
+    if starts:
+        starts.pop()  # after_cursor_execute does not run for failed statements
+
+
+def _hook(engine):
+    """Time each statement on engine once and pass it to the engine's subscribers."""
+    from sqlalchemy import event
+    subscribers = _subscribers[engine] = []
+
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["sql_profiler_start"].pop()
+        elapsed = time.perf_counter() - started
+        for fn in subscribers:
+            fn(statement, started, elapsed)
+
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", after_execute)
+    event.listen(engine, "handle_error", _on_error)
+    return subscribers
+
+
+def on_statement(app, fn):
+    """
+    Call fn(statement, started, elapsed) after every statement on the app's engines; started is the
+    perf_counter() value it began at. Idempotent per fn; call after db.init_app.
+    """
+    from ..extensions import db
+    with app.app_context():
+        for engine in db.engines.values():
+            subscribers = _subscribers.get(engine)
+            if subscribers is None:
+                subscribers = _hook(engine)
+            if fn not in subscribers:
+                subscribers.append(fn)
+
+
+def _count(statement, started, elapsed):
+    stats = current_stats()
+    if stats is None or statement.lstrip().upper().startswith(_TRANSACTION_CONTROL):
+        return
+    stats.count += 1
+    stats.seconds += elapsed
+    stats.statements[statement] = stats.statements.get(statement, 0) + 1
+
+
+def _is_developer():
+    from flask_login import current_user
+    return current_user.is_authenticated and current_user.role == "developer"
+
+
+def track(app):
+    """Count statements and DB time per request (current_stats()). Idempotent; call after db.init_app."""
+    if app.extensions.get("sql_profiler"):
+        return
+    app.extensions["sql_profiler"] = True
+    on_statement(app, _count)
+
+    @app.before_request
+    def _start_sql_stats():
+        g.sql_stats = RequestSqlStats()
+
+
+def install(app):
+    """track() plus developer headers, footer and N+1 warnings."""
+    track(app)
+
+    @app.after_request
+    def _report_sql_stats(response):
+        stats = current_stats()
+        if stats is None:
+            return response
+        if app.debug or _is_developer():
+            response.headers["X-SQL-Queries"] = str(stats.count)
+            response.headers["X-SQL-Time-Ms"] = f"{stats.seconds * 1000:.1f}"
+        threshold = current_app.config["SQL_N_PLUS_ONE_THRESHOLD"]
+        repeated = stats.repeated(threshold)
+        for n, shape in repeated:
+            current_app.logger.warning("Possible N+1 on %s: %d x %s", request.endpoint, n, shape[:300])
+        if repeated and current_app.config["SQL_N_PLUS_ONE_RAISE"]:
+            n, shape = repeated[0]
+            raise NPlusOneDetected(f"{request.endpoint}: {n} x {shape[:300]}")
+        return response
+
+    @app.context_processor
+    def _sql_stats_footer():
+        return {"sql_stats": current_stats() if _is_developer() else None}
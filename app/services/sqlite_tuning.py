@@ -0,0 +1,85 @@
+"""
+Hardened SQLite mode for single-box deployments without PostgreSQL (SQLITE_TUNING = True).
+
+Every connection gets WAL journaling, a busy timeout, synchronous=NORMAL (fsync at checkpoints,
+not per commit; safe against corruption, may lose the last commits on power loss) and a memory
+map for reads.
+
+Write serialization: in WAL mode a transaction that has read and then tries to write fails at
+once with "database is locked" if another worker committed in between; the busy timeout does not
+apply. Transactions therefore start DEFERRED (readers never block each other) and are restarted
+as BEGIN IMMEDIATE right before their first write, which waits up to the busy timeout for the
+single writer lock and then writes on a fresh snapshot. The reads before the first write and the
+writes are thus two transactions: another worker may commit between them, as under PostgreSQL's
+default READ COMMITTED, which the app already relies on. A view whose write depends on what it
+read (a count it checks, say) calls begin_write() before reading, so the check and the write share
+one snapshot and the writer lock.
+"""
+from sqlalchemy import event
+
+_WRITE_VERBS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def configure_engine(engine, config):
+    """Install pragmas and IMMEDIATE-on-write transactions on a SQLite engine."""
+    pragmas = [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_KB'])}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy's begin event issue BEGIN instead of pysqlite's implicit transactions
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        if conn.get_execution_options().get("isolation_level") == "AUTOCOMMIT":
+            conn.info["sqlite_writing"] = True  # statements commit one by one
+            return
+        # Resetting the isolation level on pool return turns pysqlite's implicit BEGIN back on
+        conn.connection.driver_connection.isolation_level = None
+        conn.exec_driver_sql("BEGIN")
+        conn.info["sqlite_writing"] = False
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get("sqlite_writing", True) or not statement.lstrip().upper().startswith(_WRITE_VERBS):
+            return
+        # Nothing written yet in this transaction: restart it holding the writer lock
+        _take_writer_lock(conn, cursor.execute)
+
+
+def _take_writer_lock(conn, execute):
+    conn.info["sqlite_writing"] = True
+    if conn.in_nested_transaction():
+        return  # SAVEPOINTs cannot be restarted; keep the deferred transaction
+    execute("COMMIT")
+    execute("BEGIN IMMEDIATE")
+
+
+def begin_write(session):
+    """
+    Declare that the session's transaction will write based on what it reads next: on a tuned
+    SQLite engine the transaction restarts as BEGIN IMMEDIATE now (waiting for the writer lock)
+    instead of before its first write. Objects loaded earlier keep their old values. No effect on
+    other databases or once the transaction has written.
+    """
+    conn = session.connection()
+    if not conn.info.get("sqlite_writing", True):
+        _take_writer_lock(conn, conn.exec_driver_sql)
+
+
+def sqlite_path(url):
+    """Filesystem path of a sqlite:/// URL (None for in-memory databases)."""
+    from sqlalchemy.engine import make_url
+    database = make_url(url).database
+    return database if database and database != ":memory:" else None
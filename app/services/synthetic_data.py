@@ -0,0 +1,226 @@
+"""
+Synthetic plant data (`flask seed-synthetic`) for reproducing scaling problems at production volume.
+
+Generates operators, lines, FG codes, TD items, verifications with one verification item per
+active TD item of their FG, and audit log rows (a login and a verification_submit per
+verification). Everything is derived from one random.Random(seed), so the same options produce
+the same rows (timestamps are relative to now). Distributions are skewed like a real plant:
+items per FG follow a Pareto distribution (most FGs have tens of items, about 0.4% have 1,000+)
+and verifications concentrate on a minority of popular FGs (Zipf-like weights over a shuffled
+FG order).
+
+Rows bypass the ORM: they are generated as tuples with explicit ids above the current maximum and
+loaded in batches of BATCH_ROWS, through COPY on PostgreSQL (psycopg2 or psycopg 3) and through
+executemany inside one transaction per table on SQLite. Id sequences are moved past the new rows
+afterwards. Codes carry the seed (S<seed>-...), so the same seed cannot be loaded twice.
+"""
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta
+
+BATCH_ROWS = 50000
+UNUSABLE_PASSWORD = "!"  # not a bcrypt hash: verify_password() returns False, nobody can log in
+
+_TS = "%Y-%m-%d %H:%M:%S.%f"
+_UNITS = ("pcs", "pcs", "pcs", "pcs", "set", "kg", "m", "l")
+
+
+def _item_quantity(item_id):
+    """Expected quantity of a TD item; derived from the id so verification items need no lookup."""
+    return (item_id * 2654435761 >> 7) % 12 + 1
+
+
+def _item_active(item_id):
+    return (item_id * 40503 >> 3) % 20 != 0  # 5% soft-deleted
+
+
+def _items_per_fg(rng, max_items):
+    """Pareto(1.2) from 10: median ~18, mean ~43 after the cap; P(>= 1,000) ~ 0.4%."""
+    return min(int(10 * rng.paretovariate(1.2)), max_items)
+
+
+class _Loader:
+    """Batched bulk insert into one table over a raw DBAPI connection."""
+
+    def __init__(self, raw, dialect):
+        self.raw, self.dialect = raw, dialect
+
+    def load(self, table, columns, rows):
+        """Insert all rows (an iterable of tuples); returns the row count."""
+        count, batch = 0, []
+        cursor = self.raw.cursor()
+        try:
+            if self.dialect == "sqlite":
+                cursor.execute("BEGIN IMMEDIATE")  # tuned connections are in autocommit mode
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= BATCH_ROWS:
+                    self._flush(cursor, table, columns, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self._flush(cursor, table, columns, batch)
+                count += len(batch)
+            self.raw.commit()
+        except Exception:
+            self.raw.rollback()
+            raise
+        finally:
+            cursor.close()
+        return count
+
+    def _flush(self, cursor, table, columns, batch):
+        if self.dialect == "postgresql":
+            buf = io.StringIO()
+            csv.writer(buf, lineterminator="\n").writerows(batch)  # None -> empty field -> NULL
+            sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+            if hasattr(cursor, "copy_expert"):  # psycopg2
+                buf.seek(0)
+                cursor.copy_expert(sql, buf)
+            else:  # psycopg 3
+                with cursor.copy(sql) as copy:
+                    copy.write(buf.getvalue())
+        else:
+            placeholders = ", ".join("?" for _ in columns)
+            cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", batch)
+
+
+def _max_ids(conn, tables):
+    from ..extensions import db
+    return {t: conn.execute(db.text(f"SELECT COALESCE(MAX(id), 0) FROM {t}")).scalar() for t in tables}
+
+
+def generate(lines=200, fg_codes=20000, verifications=50000, operators=100, audit_per_verification=2,
+             max_items=2000, days=365, seed=1, progress=None):
+    """
+    Load a synthetic dataset into the app's database; returns {table: rows inserted}.
+    progress(table, rows, seconds) is called after each table. Raises ValueError if this seed
+    was already loaded.
+    """
+    from ..extensions import db
+    rng = random.Random(seed)
+    prefix = f"S{seed}-"
+    engine = db.engine
+    dialect = engine.dialect.name
+    tables = ("users", "lines", "fg_codes", "td_items", "verifications", "verification_items", "audit_logs")
+    with engine.connect() as conn:
+        if conn.execute(db.text("SELECT 1 FROM lines WHERE code = :code"), {"code": f"{prefix}L0001"}).first():
+            raise ValueError(f"Synthetic data with seed {seed} is already loaded (line {prefix}L0001 exists)")
+        base = _max_ids(conn, tables)
+
+    now = datetime.utcnow()
+    start = now - timedelta(days=days)
+    created = start.strftime(_TS)
+    op_ids = list(range(base["users"] + 1, base["users"] + operators + 1))
+    line_ids = list(range(base["lines"] + 1, base["lines"] + lines + 1))
+    fg_ids = list(range(base["fg_codes"] + 1, base["fg_codes"] + fg_codes + 1))
+
+    # FG -> (first TD item id, item count), assigned up front so verifications can reference items
+    fg_items, next_item = {}, base["td_items"] + 1
+    for fg_id in fg_ids:
+        n = _items_per_fg(rng, max_items)
+        fg_items[fg_id] = (next_item, n)
+        next_item += n
+
+    def users():
+        for n, user_id in enumerate(op_ids, 1):
+            yield (user_id, f"s{seed}_op{n:04d}", UNUSABLE_PASSWORD, f"Synthetic Operator {n}", "operator",
+                   True, False, created, created)
+
+    def line_rows():
+        for n, line_id in enumerate(line_ids, 1):
+            yield (line_id, f"{prefix}L{n:04d}", f"Synthetic line {n}", rng.random() > 0.02, created, created)
+
+    def fg_rows():
+        for n, fg_id in enumerate(fg_ids, 1):
+            yield (fg_id, line_ids[(n - 1) % lines], f"{prefix}FG{n:06d}", f"Synthetic FG {n}",
+                   rng.random() > 0.05, created, created)
+
+    def item_rows():
+        for fg_id in fg_ids:
+            first, n = fg_items[fg_id]
+            for k in range(n):
+                item_id = first + k
+                consumable = rng.random() < 0.15
+                yield (item_id, fg_id, f"{'C' if consumable else 'P'}{k + 1:05d}", f"Part {item_id}",
+                       "consumable" if consumable else "child_part", _item_quantity(item_id),
+                       rng.choice(_UNITS), _item_active(item_id), created, created)
+
+    # Popular FGs: weight 1/rank^0.8 over a shuffled order, so popularity is independent of size
+    ranked = fg_ids[:]
+    rng.shuffle(ranked)
+    cum, total = [], 0.0
+    for rank in range(1, len(ranked) + 1):
+        total += rank ** -0.8
+        cum.append(total)
+    picks = rng.choices(ranked, cum_weights=cum, k=verifications)
+    operator_of = [rng.choice(op_ids) for _ in range(verifications)]
+    # Verification times increase with the id, as they do in production
+    step = days * 86400 / max(verifications, 1)
+    verified = [(start + timedelta(seconds=i * step + rng.random() * step)).strftime(_TS) for i in range(verifications)]
+    vid_base = base["verifications"]
+
+    def verification_rows():
+        for i, fg_id in enumerate(picks):
+            yield (vid_base + i + 1, fg_id, operator_of[i], verified[i], None)
+
+    def verification_item_rows():
+        item_id = base["verification_items"]
+        for i, fg_id in enumerate(picks):
+            first, n = fg_items[fg_id]
+            for td_item_id in range(first, first + n):
+                if not _item_active(td_item_id):
+                    continue
+                expected = _item_quantity(td_item_id)
+                actual = expected if rng.random() > 0.03 else max(expected - rng.randrange(1, 3), 0)
+                item_id += 1
+                yield (item_id, vid_base + i + 1, td_item_id, expected, actual, "pcs")
+
+    usernames = {user_id: f"s{seed}_op{n:04d}" for n, user_id in enumerate(op_ids, 1)}
+    fg_code_of = {fg_id: f"{prefix}FG{n:06d}" for n, fg_id in enumerate(fg_ids, 1)}
+
+    def audit_rows():
+        audit_id = base["audit_logs"]
+        for i, fg_id in enumerate(picks):
+            user_id = operator_of[i]
+            for k in range(audit_per_verification):
+                audit_id += 1
+                if k == audit_per_verification - 1:
+                    yield (audit_id, user_id, usernames[user_id], "verification_submit", "verification",
+                           str(vid_base + i + 1), fg_code_of[fg_id], verified[i])
+                else:
+                    yield (audit_id, user_id, usernames[user_id], "login_success", "auth", None, None, verified[i])
+
+    plan = (
+        ("users", ("id", "username", "password_hash", "full_name", "role", "is_active", "must_change_password",
+                   "created_at", "updated_at"), users()),
+        ("lines", ("id", "code", "name", "is_active", "created_at", "updated_at"), line_rows()),
+        ("fg_codes", ("id", "line_id", "code", "name", "is_active", "created_at", "updated_at"), fg_rows()),
+        ("td_items", ("id", "fg_id", "item_code", "item_name", "item_type", "quantity", "unit", "is_active",
+                      "created_at", "updated_at"), item_rows()),
+        ("verifications", ("id", "fg_id", "operator_id", "verified_at", "notes"), verification_rows()),
+        ("verification_items", ("id", "verification_id", "td_item_id", "expected_quantity", "actual_quantity",
+                                "unit"), verification_item_rows()),
+        ("audit_logs", ("id", "user_id", "username", "action", "resource", "resource_id", "details", "created_at"),
+         audit_rows()),
+    )
+    counts = {}
+    raw = engine.raw_connection()
+    try:
+        loader = _Loader(raw, dialect)
+        for table, columns, rows in plan:
+            started = time.perf_counter()
+            counts[table] = loader.load(table, columns, rows)
+            if progress:
+                progress(table, counts[table], time.perf_counter() - started)
+    finally:
+        raw.close()
+    if dialect == "postgresql":
+        with engine.begin() as conn:
+            for table in tables:
+                conn.execute(db.text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+                ))
+    return counts
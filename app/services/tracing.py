@@ -0,0 +1,239 @@
+"""
+Request tracing (TRACING): span timelines for individual requests.
+
+A sampled request (TRACE_SAMPLE_RATE, or a developer sending `X-Trace: 1` / `?trace=1`) collects
+spans for every SQL statement, Redis command or pipeline, template render, bcrypt call and
+spreadsheet save, then appends one JSON line to TRACE_FILE and returns its id in X-Trace-Id.
+/developer/traces lists recent traces and renders any of them as a waterfall.
+
+Spans are stored flat as [name, category, start_ms, duration_ms, detail], start relative to the
+request start; nesting is recovered from the intervals when rendering. A trace keeps at most
+TRACE_MAX_SPANS SQL and Redis spans and counts the rest as dropped; the few coarse spans
+(templates, bcrypt, exports) are always kept.
+
+The sampled trace lives in a context variable, so at a span site an unsampled request pays one
+ContextVar.get() and builds nothing (span details such as pipeline command lists are only made for
+traced requests); per request it pays one random() draw. When TRACING is off nothing is installed.
+
+Workers append whole lines under an flock on TRACE_FILE.lock, so rotation (os.replace to
+TRACE_FILE.1 past TRACE_FILE_MAX_BYTES) happens once even when several workers cross the size
+together, and no line is written to a file another worker is renaming.
+"""
+import contextlib
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from flask import request
+from ..config import TRACE_FILE, TRACE_FILE_MAX_BYTES, TRACE_MAX_SPANS
+from .sql_profiler import on_statement, statement_shape
+
+try:
+    import fcntl
+except ImportError:  # Windows: rotation is only serialized within the process
+    fcntl = None
+
+_NOOP = contextlib.nullcontext()
+_CAPPED = ("sql", "redis")  # one span per statement / command; unbounded in loops
+_write_lock = threading.Lock()
+_state = {"file": TRACE_FILE, "max_bytes": TRACE_FILE_MAX_BYTES, "max_spans": TRACE_MAX_SPANS}
+_current = contextvars.ContextVar("trace", default=None)
+
+
+def current_trace():
+    """The trace of the current request, or None when it is not sampled."""
+    return _current.get()
+
+
+def record_span(name, category, started, detail=None):
+    """Add a finished span that began at perf_counter() value started."""
+    trace = current_trace()
+    if trace is None:
+        return
+    if category in _CAPPED:
+        if trace["capped"] >= _state["max_spans"]:
+            trace["dropped"] += 1
+            return
+        trace["capped"] += 1
+    now = time.perf_counter()
+    trace["spans"].append([name, category, round((started - trace["started"]) * 1000, 3),
+                           round((now - started) * 1000, 3), detail])
+
+
+class _Span:
+    __slots__ = ("name", "category", "detail", "started")
+
+    def __init__(self, name, category, detail):
+        self.name, self.category, self.detail = name, category, detail
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_span(self.name, self.category, self.started, self.detail)
+        return False
+
+
+def span(name, category="app", detail=None):
+    """Context manager timing a block as a span of the current trace (no-op when not sampled)."""
+    return _Span(name, category, detail) if current_trace() is not None else _NOOP
+
+
+def _write(trace):
+    line = json.dumps(trace, separators=(",", ":")) + "\n"
+    path = _state["file"]
+    with _write_lock, open(path + ".lock", "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # released when the lock file is closed
+        try:
+            if os.path.getsize(path) > _state["max_bytes"]:
+                os.replace(path, path + ".1")
+        except OSError:
+            pass  # no trace file yet
+        with open(path, "a") as f:
+            f.write(line)
+
+
+def _tail_lines(path, limit, block=1 << 16):
+    """Up to limit last lines of path, newest first."""
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return []
+    with f:
+        f.seek(0, os.SEEK_END)
+        pos, data = f.tell(), b""
+        while pos > 0 and data.count(b"\n") <= limit:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    if pos > 0:
+        lines = lines[1:]  # first line is partial
+    return [line.decode() for line in reversed(lines[-limit:])]
+
+
+def recent(limit=100):
+    """Summaries of the newest traces: id, at, method, path, endpoint, status, duration_ms, spans."""
+    summaries = []
+    for line in _tail_lines(_state["file"], limit):
+        try:
+            trace = json.loads(line)
+        except ValueError:
+            continue
+        spans = trace.pop("spans")
+        trace["span_count"] = len(spans)
+        summaries.append(trace)
+    return summaries
+
+
+def find(trace_id):
+    """Full trace by id from the current or the rotated trace file, or None."""
+    prefix = '{"id":"%s"' % trace_id
+    for path in (_state["file"], _state["file"] + ".1"):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(prefix):
+                        return json.loads(line)
+        except OSError:
+            continue
+    return None
+
+
+def waterfall(trace):
+    """Spans in start order with their depth, offset and width (% of the request)."""
+    total = max(trace["duration_ms"], 0.001)
+    rows, open_ends = [], []
+    for name, category, start, duration, detail in sorted(trace["spans"], key=lambda s: (s[2], -s[3])):
+        end = start + duration
+        while open_ends and open_ends[-1] < end:
+            open_ends.pop()
+        rows.append({
+            "name": name, "category": category, "start_ms": start, "duration_ms": duration, "detail": detail,
+            "depth": len(open_ends), "left": 100.0 * start / total, "width": max(100.0 * duration / total, 0.2),
+        })
+        open_ends.append(end)
+    return rows
+
+
+def _sql_span(statement, started, elapsed):
+    if current_trace() is not None:
+        record_span("sql", "sql", started, statement_shape(statement)[:500])
+
+
+def _sampled(rate):
+    if request.endpoint == "static":
+        return False
+    if random.random() < rate:
+        return True
+    if request.headers.get("X-Trace") == "1" or (b"trace=" in request.query_string and request.args.get("trace") == "1"):
+        from flask_login import current_user
+        return current_user.is_authenticated and current_user.role == "developer"
+    return False
+
+
+def install(app):
+    """Sample requests, record their spans and write traces. Call after db.init_app."""
+    from flask import before_render_template, template_rendered
+    _state.update(file=app.config["TRACE_FILE"], max_bytes=app.config["TRACE_FILE_MAX_BYTES"],
+                  max_spans=app.config["TRACE_MAX_SPANS"])
+    rate = app.config["TRACE_SAMPLE_RATE"]
+    os.makedirs(os.path.dirname(_state["file"]) or ".", exist_ok=True)
+    on_statement(app, _sql_span)  # statements are timed by the shared sql_profiler hook
+
+    def _template_started(sender, template, context, **extra):
+        trace = current_trace()
+        if trace is not None:
+            trace["templates"].append(time.perf_counter())
+
+    def _template_done(sender, template, context, **extra):
+        trace = current_trace()
+        if trace is not None and trace["templates"]:
+            record_span(template.name or "template", "template", trace["templates"].pop())
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_done, app, weak=False)
+
+    @app.before_request
+    def _start_trace():
+        trace = None
+        if _sampled(rate):
+            trace = {"id": uuid.uuid4().hex[:16], "started": time.perf_counter(), "spans": [],
+                     "capped": 0, "dropped": 0, "templates": []}
+        _current.set(trace)  # also clears one a failed teardown left in this thread's context
+
+    @app.after_request
+    def _trace_header(response):
+        trace = current_trace()
+        if trace is not None:
+            trace["status"] = response.status_code
+            response.headers["X-Trace-Id"] = trace["id"]
+        return response
+
+    @app.teardown_request
+    def _finish_trace(exc):
+        trace = _current.get()
+        if trace is None:
+            return
+        _current.set(None)
+        duration = (time.perf_counter() - trace["started"]) * 1000
+        try:
+            _write({
+                "id": trace["id"],
+                "at": time.time() - duration / 1000,
+                "method": request.method,
+                "path": request.full_path.rstrip("?"),
+                "endpoint": request.endpoint,
+                "status": trace.get("status", 500),
+                "duration_ms": round(duration, 3),
+                "dropped": trace["dropped"],
+                "spans": trace["spans"],
+            })
+        except OSError:
+            app.logger.warning("Could not write trace %s to %s", trace["id"], _state["file"])
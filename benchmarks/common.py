@@ -0,0 +1,286 @@
+"""
+Shared helpers for benchmark scripts. Not used by the application.
+
+Benchmarks run the real app factory against an in-memory SQLite database and either
+a real Redis (BENCH_REDIS_URL) or an in-process fakeredis TCP server.
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+BENCH_PASSWORD = "Bench-pass-123!"
+
+
+_fake_redis = {}
+
+
+def start_fake_redis():
+    """Start an in-process fakeredis TCP server on a free port; returns (url, server)."""
+    import socket
+    from fakeredis import TcpFakeServer
+
+    class NoDelayServer(TcpFakeServer):
+        # Replies are flushed one by one; without TCP_NODELAY pipelined replies stall on delayed ACKs
+        def get_request(self):
+            conn, addr = super().get_request()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return conn, addr
+
+    server = NoDelayServer(("127.0.0.1", 0))
+    server.daemon_threads = True  # open client connections must not keep the benchmark alive at exit
+    threading.Thread(target=server.serve_forever, name="fake-redis", daemon=True).start()
+    host, port = server.server_address[:2]
+    url = f"redis://{host}:{port}/0"
+    # fakeredis' TCP server drops the connection on SCRIPT LOAD, which redis-py issues after a
+    # NOSCRIPT reply; an EVAL caches the script so the app's EVALSHA calls succeed directly.
+    import redis
+    from app.services.rate_limit_service import _SLIDING_WINDOW_LUA
+    redis.Redis.from_url(url).eval(_SLIDING_WINDOW_LUA, 0, 0, 0, 0, 0, 0, "")
+    return url, server
+
+
+def redis_url():
+    """BENCH_REDIS_URL, or a shared in-process fakeredis TCP server started on first use."""
+    if os.environ.get("BENCH_REDIS_URL"):
+        return os.environ["BENCH_REDIS_URL"]
+    if "url" not in _fake_redis:
+        _fake_redis["url"], _fake_redis["server"] = start_fake_redis()
+    return _fake_redis["url"]
+
+
+def make_app(overrides=None):
+    """Create the app for benchmarking. Caller must push an app context for DB work."""
+    from app import create_app
+    config = {
+        "SQLALCHEMY_DATABASE_URI": os.environ.get("BENCH_DATABASE_URL", "sqlite://"),
+        "REDIS_URL": redis_url(),
+        "WTF_CSRF_ENABLED": False,
+        "SESSION_COOKIE_SECURE": False,
+    }
+    config.update(overrides or {})
+    return create_app(config)
+
+
+def create_user(username, role="operator", password=BENCH_PASSWORD):
+    from app.extensions import db
+    from app.models import User
+    user = User(username=username, full_name=username, role=role, is_active=True, must_change_password=False)
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, username, password=BENCH_PASSWORD):
+    resp = client.post("/auth/login", data={"username": username, "password": password})
+    if resp.status_code != 302:
+        raise RuntimeError(f"Login failed for {username}: HTTP {resp.status_code}")
+    return resp
+
+
+class RedisCommandCounter:
+    """
+    Count Redis commands and round trips issued from the current thread.
+    A pipeline execute is one round trip carrying len(stack) commands.
+    """
+
+    def __init__(self):
+        self.commands = 0
+        self.round_trips = 0
+        self._thread_id = threading.get_ident()
+
+    def reset(self):
+        self.commands = 0
+        self.round_trips = 0
+
+    @contextmanager
+    def installed(self):
+        import redis.client
+        counter = self
+        orig_execute_command = redis.client.Redis.execute_command
+        orig_pipeline_execute = redis.client.Pipeline.execute
+
+        def execute_command(self, *args, **kwargs):
+            if threading.get_ident() == counter._thread_id:
+                counter.commands += 1
+                counter.round_trips += 1
+            return orig_execute_command(self, *args, **kwargs)
+
+        def pipeline_execute(self, *args, **kwargs):
+            if threading.get_ident() == counter._thread_id and self.command_stack:
+                counter.commands += len(self.command_stack)
+                counter.round_trips += 1
+            return orig_pipeline_execute(self, *args, **kwargs)
+
+        redis.client.Redis.execute_command = execute_command
+        redis.client.Pipeline.execute = pipeline_execute
+        try:
+            yield self
+        finally:
+            redis.client.Redis.execute_command = orig_execute_command
+            redis.client.Pipeline.execute = orig_pipeline_execute
+
+
+def timed(fn, *args, **kwargs):
+    """Return (result, seconds)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+_TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+def is_query(statement):
+    """False for transaction control (SQLite mode issues BEGIN / BEGIN IMMEDIATE itself)."""
+    return not statement.lstrip().upper().startswith(_TRANSACTION_CONTROL)
+
+
+def temp_sqlite_url(name):
+    """File-backed SQLite URL in the temp dir (in-memory SQLite cannot be shared across threads)."""
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(prefix="td_bench_"), f"{name}.db")
+    return "sqlite:///" + path.replace("\\", "/")
+
+
+BULK_CHUNK = 10000
+
+
+def insert_rows(table, rows):
+    """Bulk insert in chunks of BULK_CHUNK rows (executemany)."""
+    from app.extensions import db
+    for start in range(0, len(rows), BULK_CHUNK):
+        db.session.execute(table.insert(), rows[start:start + BULK_CHUNK])
+    db.session.commit()
+
+
+def seed_dataset(n_verifications, rng):
+    """
+    Synthetic production-shaped data: 50 operators, 20 lines, 1000 FG codes, 20000 TD items (10% inactive),
+    n_verifications with 5 items each, and 2 audit log rows and 2 login attempts per verification.
+    """
+    from app.models import AuditLog, FGCode, Line, LoginAttempt, TDItem, User, Verification, VerificationItem
+    now = datetime.utcnow()
+    span = 365 * 24 * 3600
+
+    def at():
+        return now - timedelta(seconds=rng.randrange(span))
+
+    insert_rows(User.__table__, [
+        dict(id=i, username=f"op{i}", password_hash="x", full_name=f"Operator {i}", role="operator",
+             is_active=True, must_change_password=False, created_at=now, updated_at=now)
+        for i in range(1, 51)
+    ])
+    insert_rows(Line.__table__, [dict(id=i, code=f"L{i:02d}", name=f"Line {i}", is_active=True) for i in range(1, 21)])
+    insert_rows(FGCode.__table__, [
+        dict(id=i, line_id=(i - 1) // 50 + 1, code=f"FG{i:05d}", name=f"FG {i}", is_active=rng.random() > 0.1)
+        for i in range(1, 1001)
+    ])
+    insert_rows(TDItem.__table__, [
+        dict(id=i, fg_id=(i - 1) // 20 + 1, item_code=f"IT{i:06d}", item_name=f"Item {i}",
+             item_type="child_part", quantity=1, unit="pcs", is_active=rng.random() > 0.1)
+        for i in range(1, 20001)
+    ])
+    verifications, items = [], []
+    for vid in range(1, n_verifications + 1):
+        fg_id = rng.randrange(1, 1001)
+        verifications.append(dict(id=vid, fg_id=fg_id, operator_id=rng.randrange(1, 51), verified_at=at()))
+        for k in range(5):
+            items.append(dict(verification_id=vid, td_item_id=(fg_id - 1) * 20 + k + 1,
+                              expected_quantity=1, actual_quantity=1, unit="pcs"))
+    insert_rows(Verification.__table__, verifications)
+    insert_rows(VerificationItem.__table__, items)
+    insert_rows(AuditLog.__table__, [
+        dict(user_id=rng.randrange(1, 51), username="op", action="verification_submit", created_at=at())
+        for _ in range(n_verifications * 2)
+    ])
+    insert_rows(LoginAttempt.__table__, [
+        dict(username=f"op{rng.randrange(1, 51)}", success=True, created_at=at())
+        for _ in range(n_verifications * 2)
+    ])
+    _reset_sequences([User, Line, FGCode, TDItem, Verification])
+
+
+def _reset_sequences(models):
+    """Rows above were inserted with explicit ids; move PostgreSQL id sequences past them."""
+    from app.extensions import db
+    if db.engine.dialect.name != "postgresql":
+        return
+    for model in models:
+        table = model.__tablename__
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+        ))
+    db.session.commit()
+
+
+class FaultProxy:
+    """
+    TCP proxy in front of Redis for fault injection.
+    mode "pass" forwards traffic, "blackhole" swallows it (clients hit socket timeouts),
+    stop() closes every connection and the listener (clients get connection refused).
+    """
+
+    def __init__(self, upstream_url):
+        import socket
+        from urllib.parse import urlparse
+        parsed = urlparse(upstream_url)
+        self.upstream = (parsed.hostname, parsed.port or 6379)
+        self.mode = "pass"
+        self._conns = []
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen(64)
+        self.port = self._listener.getsockname()[1]
+        self.url = f"redis://127.0.0.1:{self.port}/0"
+        self._running = True
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        import socket
+        while self._running:
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(self.upstream)
+            self._conns += [client, upstream]
+            threading.Thread(target=self._pump, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=self._pump, args=(upstream, client), daemon=True).start()
+
+    def _pump(self, src, dst):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                if self.mode == "pass":
+                    dst.sendall(data)
+        except OSError:
+            pass
+
+    def stop(self):
+        self._running = False
+        for sock in [self._listener] + self._conns:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._conns = []
@@ -0,0 +1,84 @@
+"""
+Logout-all at scale: old scan-into-list + single DEL versus batched UNLINK pipelines.
+
+Usage:
+  python benchmarks/flush_sessions.py [--sessions 100000]
+
+A probe thread pings Redis every millisecond during each flush; its worst latency shows how
+long other clients (rate limiter, session loads) were stalled. Use BENCH_REDIS_URL for numbers
+that reflect a real server; fakeredis serializes commands under a lock, which approximates it.
+"""
+import argparse
+import threading
+import time
+import tracemalloc
+
+from common import make_app
+
+SESSION_BLOB = b"\x85\xa1u\xa11\xa1f\xc3\xa1a\xcbA\xd9\x00\x00\x00\x00\x00\x00\xa1c\xd9(" + b"x" * 40
+
+
+def populate(r, prefix, n):
+    pipe = r.pipeline(transaction=False)
+    for i in range(n):
+        pipe.set(f"{prefix}{i:08d}", SESSION_BLOB, ex=1800)
+        if i % 5000 == 4999:
+            pipe.execute()
+    pipe.execute()
+
+
+def legacy_flush(r, prefix):
+    keys = list(r.scan_iter(match=f"{prefix}*", count=1000))
+    if keys:
+        r.delete(*keys)
+    return len(keys)
+
+
+def run_with_probe(r, fn):
+    stop = threading.Event()
+    worst = [0.0]
+
+    def probe():
+        while not stop.is_set():
+            start = time.perf_counter()
+            r.ping()
+            worst[0] = max(worst[0], time.perf_counter() - start)
+            time.sleep(0.001)
+
+    t = threading.Thread(target=probe, daemon=True)
+    t.start()
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stop.set()
+    t.join()
+    return count, elapsed, peak, worst[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    args = parser.parse_args()
+
+    app = make_app()
+    from app.config import REDIS_SESSION_PREFIX
+    from app.extensions import get_redis
+    from app.services.session_service import flush_all_sessions
+    r = get_redis()
+
+    populate(r, REDIS_SESSION_PREFIX, args.sessions)
+    legacy = run_with_probe(r, lambda: legacy_flush(r, REDIS_SESSION_PREFIX))
+    populate(r, REDIS_SESSION_PREFIX, args.sessions)
+    with app.app_context():
+        batched = run_with_probe(r, flush_all_sessions)
+
+    print(f"{'':24}{'removed':>10}{'seconds':>10}{'peak MiB':>10}{'worst ping ms':>15}")
+    for name, (count, elapsed, peak, worst) in (("scan list + DEL", legacy), ("batched UNLINK", batched)):
+        print(f"{name:24}{count:>10}{elapsed:>10.2f}{peak / 2**20:>10.1f}{worst * 1000:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
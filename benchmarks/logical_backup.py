@@ -0,0 +1,151 @@
+"""
+Nightly backup time as history grows: incremental logical backups against full ones.
+
+Loads a synthetic plant (services/synthetic_data.py) and takes the base backup, then simulates
+--days nights: each day appends --per-day verifications with their items and audit rows, and the
+night takes an incremental logical backup, a full logical backup and the file-level backup
+`flask backup-create` takes (SQLite online copy; pg_dump on PostgreSQL when it is installed).
+Finally restores the chain into the same database and compares every table's row count and
+content hash with the state before the restore.
+
+Simulated days are seconds apart, so LOGICAL_BACKUP_OVERLAP_SECONDS is set to 0 here; in
+production the overlap only adds rows stamped in the minutes before the previous backup.
+
+Usage:
+  python benchmarks/logical_backup.py [--fg-codes 4000] [--verifications 20000] [--days 7] [--per-day 3000]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+BACKUP_ROOT = tempfile.mkdtemp(prefix="td_bench_backup_")
+os.environ["BACKUP_DIR"] = BACKUP_ROOT
+os.environ["LOGICAL_BACKUP_DIR"] = os.path.join(BACKUP_ROOT, "logical")
+
+from common import insert_rows, make_app, temp_sqlite_url  # noqa: E402  (after the env overrides)
+
+
+def add_day(n, rng):
+    """Append n verifications of random FGs, one item row per active TD item, and 2 audit rows each."""
+    from app.extensions import db
+    from app.models import AuditLog, TDItem, Verification, VerificationItem
+    fg_ids = [row[0] for row in db.session.query(TDItem.fg_id).distinct().limit(2000)]
+    items = {}
+    for fg_id, item_id, quantity in db.session.query(TDItem.fg_id, TDItem.id, TDItem.quantity).filter(
+            TDItem.fg_id.in_(fg_ids), TDItem.is_active.is_(True)):
+        items.setdefault(fg_id, []).append((item_id, quantity))
+    fg_ids = list(items)
+    next_id = (db.session.query(db.func.max(Verification.id)).scalar() or 0) + 1
+    now = datetime.utcnow()
+    verifications, verification_items, audit = [], [], []
+    for vid in range(next_id, next_id + n):
+        fg_id = rng.choice(fg_ids)
+        verifications.append(dict(id=vid, fg_id=fg_id, operator_id=1, verified_at=now))
+        verification_items.extend(dict(verification_id=vid, td_item_id=item_id, expected_quantity=quantity,
+                                       actual_quantity=quantity, unit="pcs") for item_id, quantity in items[fg_id])
+        audit.append(dict(user_id=1, username="op", action="login_success", resource="auth", created_at=now))
+        audit.append(dict(user_id=1, username="op", action="verification_submit", resource="verification",
+                          resource_id=str(vid), created_at=now))
+    insert_rows(Verification.__table__, verifications)
+    insert_rows(VerificationItem.__table__, verification_items)
+    insert_rows(AuditLog.__table__, audit)
+    return len(verifications) + len(verification_items) + len(audit)
+
+
+def fingerprint():
+    """{table: (rows, sha256 of all rows in primary key order)}."""
+    from app.extensions import db
+    from app.services.logical_backup import _encode
+    result = {}
+    with db.engine.connect() as conn:
+        for table in db.metadata.sorted_tables:
+            sha, count = hashlib.sha256(), 0
+            for row in conn.execute(db.select(table).order_by(*table.primary_key.columns)):
+                sha.update(json.dumps(list(row), default=_encode).encode())
+                count += 1
+            result[table.name] = (count, sha.hexdigest())
+    return result
+
+
+def timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - start
+
+
+def backup_size(manifest):
+    return sum(segment["bytes"] for segment in manifest["segments"].values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fg-codes", type=int, default=4000)
+    parser.add_argument("--verifications", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--per-day", type=int, default=3000, help="Verifications appended per simulated day.")
+    args = parser.parse_args()
+
+    url = os.environ.get("BENCH_DATABASE_URL") or temp_sqlite_url("logical_backup")
+    app = make_app({"SQLALCHEMY_DATABASE_URI": url})
+    rng = random.Random(1)
+    with app.app_context():
+        from app.extensions import db
+        from app.services import logical_backup
+        from app.services.backup_service import run_backup
+        from app.services.migration_service import upgrade
+        from app.services.synthetic_data import generate
+        db.create_all()
+        upgrade()
+        generate(lines=40, fg_codes=args.fg_codes, verifications=args.verifications, operators=20, seed=1)
+        logical_backup.LOGICAL_BACKUP_OVERLAP_SECONDS = 0
+        logical_backup.LOGICAL_BACKUP_FULL_EVERY = args.days  # one chain for the whole run
+        chain_dir = logical_backup.LOGICAL_BACKUP_DIR
+        scratch_dir = os.path.join(BACKUP_ROOT, "scratch")
+
+        base, seconds = timed(logical_backup.run_logical_backup)
+        history = sum(s["rows"] for s in base["segments"].values())
+        print(f"base: {history:,} rows, {backup_size(base) / 1048576:.1f} MB in {seconds:.2f} s\n")
+        print(f"{'day':>3}{'history rows':>14}{'delta rows':>12}{'incr s':>8}{'incr MB':>9}"
+              f"{'full s':>8}{'full MB':>9}{'file s':>8}{'file MB':>9}")
+        for day in range(1, args.days + 1):
+            history += add_day(args.per_day, rng)
+            time.sleep(0.01)  # the next delta starts strictly after this day's rows
+            delta, incr_s = timed(logical_backup.run_logical_backup)
+            # The full logical backup goes to a scratch directory so the chain stays intact
+            logical_backup.LOGICAL_BACKUP_DIR = scratch_dir
+            try:
+                full, full_s = timed(lambda: logical_backup.run_logical_backup(full=True))
+            finally:
+                logical_backup.LOGICAL_BACKUP_DIR = chain_dir
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+            path, file_s = timed(run_backup)
+            file_mb = os.path.getsize(path) / 1048576 if path else float("nan")
+            if path:
+                os.remove(path)
+            print(f"{day:>3}{history:>14,}{sum(s['rows'] for s in delta['segments'].values()):>12,}"
+                  f"{incr_s:>8.2f}{backup_size(delta) / 1048576:>9.2f}{full_s:>8.2f}{backup_size(full) / 1048576:>9.2f}"
+                  f"{file_s:>8.2f}{file_mb:>9.2f}")
+
+        before = fingerprint()
+        totals, restore_s = timed(lambda: logical_backup.restore_logical(delta["id"]))
+        after = fingerprint()
+        chain_length = len(logical_backup.backup_chain(delta["id"]))
+        print(f"\nrestore of a {chain_length}-backup chain: {sum(totals.values()):,} rows replayed in {restore_s:.2f} s")
+        mismatched = [name for name in before if before[name] != after[name]]
+        for name in mismatched:
+            print(f"  MISMATCH {name}: {before[name][0]:,} rows before, {after[name][0]:,} after restore")
+    shutil.rmtree(BACKUP_ROOT, ignore_errors=True)
+    if mismatched:
+        print("FAIL")
+        raise SystemExit(1)
+    print("restored database matches the original")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Per-login operation counts: DB transactions, SQL statements and Redis round trips for a
+failed login, a login to a deactivated account and a successful login. Exits with status 1 if any count exceeds its budget, so it
+can run in CI to keep the login path from regressing.
+
+Usage:
+  python benchmarks/login_ops.py
+"""
+import sys
+
+from common import BENCH_PASSWORD, RedisCommandCounter, create_user, is_query, make_app
+
+# (commits, statements, redis round trips) per login, including the session save
+# Redis: cooldown check, then record (failed, inactive) or clear (success), then the session save
+BUDGETS = {
+    "failed": (1, 3, 3),
+    "inactive": (1, 3, 3),
+    "success": (1, 4, 3),
+}
+
+
+class SqlCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.commits = 0
+        self.statements = 0
+        event.listen(engine, "commit", self._on_commit)
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += is_query(statement)
+
+    def reset(self):
+        self.commits = 0
+        self.statements = 0
+
+
+def main():
+    app = make_app()
+    with app.app_context():
+        from app.extensions import db
+        db.create_all()
+        create_user("ops_user")
+        create_user("ops_inactive").is_active = False
+        db.session.commit()
+        sql = SqlCounter(db.engine)
+
+    # Warm up per-process state (maintenance flag sync, rate-limit script load)
+    app.test_client().post("/auth/login", data={"username": "warmup", "password": "x"})
+    redis_counter = RedisCommandCounter()
+    results = {}
+    with redis_counter.installed():
+        for name, username, password in (("failed", "ops_user", "wrong-password-1!"),
+                                         ("inactive", "ops_inactive", BENCH_PASSWORD),
+                                         ("success", "ops_user", BENCH_PASSWORD)):
+            client = app.test_client()
+            sql.reset()
+            redis_counter.reset()
+            client.post("/auth/login", data={"username": username, "password": password})
+            results[name] = (sql.commits, sql.statements, redis_counter.round_trips)
+
+    failed = False
+    print(f"{'login':10}{'commits':>10}{'statements':>12}{'redis RTT':>11}")
+    for name, counts in results.items():
+        budget = BUDGETS[name]
+        over = [c > b for c, b in zip(counts, budget)]
+        failed = failed or any(over)
+        cells = "".join(f"{c:>{w}}{'!' if o else ' '}" for c, o, w in zip(counts, over, (9, 11, 10)))
+        print(f"{name:10}{cells}")
+    if failed:
+        print("Over budget (marked !):", BUDGETS)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
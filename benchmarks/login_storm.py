@@ -0,0 +1,91 @@
+"""
+Shift-change login storm: N operators sign in at once while another operator keeps using
+the verification pages. Reports login latency, busy rejections, and verification latency.
+
+Usage:
+  python benchmarks/login_storm.py [--logins 40] [--unbounded]
+
+--unbounded approximates the old behaviour (every login hashes immediately, no slot limit).
+"""
+import argparse
+import threading
+import time
+
+from common import BENCH_PASSWORD, create_user, login, make_app, percentile, temp_sqlite_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--unbounded", action="store_true")
+    args = parser.parse_args()
+
+    import app.services.password_service as password_service
+    if args.unbounded:
+        password_service.PASSWORD_HASH_WORKERS = args.logins
+        password_service.PASSWORD_HASH_SLOTS = 0
+        password_service.PASSWORD_HASH_MAX_PENDING = args.logins * 2
+        password_service.PASSWORD_HASH_QUEUE_TIMEOUT = 600
+
+    # The in-process fake Redis shares the GIL with the storm threads: slow, but not down
+    app = make_app({"SQLALCHEMY_DATABASE_URI": temp_sqlite_url("login_storm"),
+                    **{key: 30 for key in ("REDIS_CONNECT_TIMEOUT", "REDIS_SOCKET_TIMEOUT", "REDIS_POOL_TIMEOUT")}})
+    with app.app_context():
+        from app.extensions import db
+        from app.models import User
+        db.create_all()
+        create_user("floor_op")
+        shared_hash = User.query.filter_by(username="floor_op").one().password_hash
+        for i in range(args.logins):
+            db.session.add(User(username=f"op{i:03d}", full_name=f"Operator {i}", role="operator",
+                                password_hash=shared_hash, must_change_password=False))
+        db.session.commit()
+
+    floor = app.test_client()
+    login(floor, "floor_op")
+    floor.get("/verify/")
+
+    login_times, statuses = [], []
+    probe_times = []
+    stop = threading.Event()
+    barrier = threading.Barrier(args.logins + 1)
+
+    def storm(i):
+        client = app.test_client()
+        barrier.wait()
+        start = time.perf_counter()
+        resp = client.post("/auth/login", data={"username": f"op{i:03d}", "password": BENCH_PASSWORD})
+        login_times.append(time.perf_counter() - start)
+        statuses.append(resp.status_code)
+
+    def probe():
+        while not stop.is_set():
+            start = time.perf_counter()
+            floor.get("/verify/")
+            probe_times.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=storm, args=(i,)) for i in range(args.logins)]
+    for t in threads:
+        t.start()
+    probe_thread = threading.Thread(target=probe)
+    probe_thread.start()
+    storm_start = time.perf_counter()
+    barrier.wait()
+    for t in threads:
+        t.join()
+    storm_seconds = time.perf_counter() - storm_start
+    stop.set()
+    probe_thread.join()
+
+    ok = sum(1 for s in statuses if s == 302)
+    busy = sum(1 for s in statuses if s == 503)
+    print(f"mode:                 {'unbounded' if args.unbounded else 'bounded executor'}")
+    print(f"logins:               {args.logins} ({ok} ok, {busy} busy) in {storm_seconds:.2f}s")
+    print(f"login latency ms:     p50 {percentile(login_times, 50) * 1000:.0f}  p95 {percentile(login_times, 95) * 1000:.0f}  max {max(login_times) * 1000:.0f}")
+    print(f"verify latency ms:    p50 {percentile(probe_times, 50) * 1000:.0f}  p95 {percentile(probe_times, 95) * 1000:.0f}  max {max(probe_times or [0]) * 1000:.0f}")
+    print(f"hash metrics:         {password_service.get_hash_metrics()}")
+
+
+if __name__ == "__main__":
+    main()
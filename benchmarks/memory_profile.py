@@ -0,0 +1,159 @@
+"""
+Worker memory profiling (MEMORY_PROFILING): per-endpoint peak RSS, tracemalloc flow, overhead.
+
+Runs the verifications and TD exports next to checklist loads and prints the per-endpoint peak
+RSS growth the developer page shows; the exports must be recorded above MEMORY_RECORD_MIN_MB and
+the checklist must not. Then drives the tracemalloc actions of /developer/memory (start, snapshot,
+export, snapshot, compare) in the serving worker and prints the top growing allocation sites, and
+starts, snapshots and stops tracing in a second worker process chosen by pid (over the control
+channel), which must show up in the workers list. Finally times a checklist page with the
+profiler off and on.
+
+Usage:
+  python benchmarks/memory_profile.py [--verifications 5000] [--requests 300]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import create_user, login, make_app, percentile, redis_url, seed_dataset, temp_sqlite_url
+
+MIN_MB = 4
+
+# A second worker on the same Redis: its first request starts the control listener
+WORKER = """
+import sys, time
+sys.path.insert(0, {benchmarks!r})
+from common import make_app
+make_app({config!r}).test_client().get("/auth/login")
+time.sleep(60)
+"""
+
+
+def wait_for(condition, seconds=10.0):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def remote_tracemalloc(developer, config):
+    """Start, snapshot and stop tracemalloc in another worker process by pid; True if all took effect."""
+    from app.services import memory_profiler
+    worker = subprocess.Popen(
+        [sys.executable, "-c", WORKER.format(benchmarks=os.path.dirname(os.path.abspath(__file__)), config=config)],
+        env=dict(os.environ, BENCH_REDIS_URL=redis_url()), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    status = lambda: next((w for w in memory_profiler.workers() if w["pid"] == worker.pid), None)  # noqa: E731
+    post = lambda action: developer.post(  # noqa: E731
+        "/developer/memory/tracemalloc", data={"action": action, "pid": worker.pid}).status_code
+    before = len(memory_profiler.list_snapshots())
+    try:
+        steps = {"listed": wait_for(lambda: status() is not None, 30)}
+        steps["start"] = post("start") == 302 and wait_for(lambda: status()["tracing"])
+        steps["only that worker"] = not memory_profiler.worker_status()["tracing"]
+        steps["snapshot"] = post("snapshot") == 302 and wait_for(
+            lambda: any(s["pid"] == worker.pid for s in memory_profiler.list_snapshots()))
+        steps["stop"] = post("stop") == 302 and wait_for(lambda: not status()["tracing"])
+        steps["page"] = str(worker.pid).encode() in developer.get("/developer/memory").data
+    finally:
+        worker.kill()
+        worker.wait()
+    print(f"\nworker {worker.pid} by pid: " + ", ".join(f"{step} {'ok' if done else 'FAILED'}" for step, done in steps.items())
+          + f"; {len(memory_profiler.list_snapshots()) - before} snapshot(s)")
+    return all(steps.values())
+
+
+def time_requests(app, url, n):
+    client = app.test_client()
+    login(client, "mem_operator")
+    client.get(url)
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client.get(url)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verifications", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    url = temp_sqlite_url("memory")
+    config = {"SQLALCHEMY_DATABASE_URI": url, "MEMORY_PROFILING": True, "MEMORY_RECORD_MIN_MB": MIN_MB,
+              "MEMORY_SNAPSHOT_DIR": tempfile.mkdtemp(prefix="td_bench_memory_")}
+    app = make_app(config)
+    with app.app_context():
+        from app.extensions import db
+        from app.models import FGCode, TDItem
+        db.create_all()
+        seed_dataset(args.verifications, random.Random(1))
+        create_user("mem_developer", role="developer")
+        create_user("mem_operator")
+        fg = FGCode.query.filter(FGCode.is_active.is_(True), FGCode.td_items.any(TDItem.is_active.is_(True))).first()
+        fg_id = fg.id
+
+    from app.services import memory_profiler
+    developer, operator = app.test_client(), app.test_client()
+    login(developer, "mem_developer")
+    login(operator, "mem_operator")
+    with app.app_context():
+        memory_profiler.clear_samples()
+    for _ in range(3):
+        for _ in range(10):
+            operator.get(f"/verify/fg/{fg_id}")
+        developer.get("/admin/export/verifications")
+        developer.get(f"/admin/export/td/{fg_id}")
+    with app.app_context():
+        groups = memory_profiler.summarize(memory_profiler.samples())
+    print(f"requests with peak RSS growth >= {MIN_MB} MB (per-request peaks: {memory_profiler.worker_status()['per_request_peaks']}):")
+    print(f"  {'endpoint':34}{'n':>3}{'max MB':>8}{'median MB':>11}{'peak MB':>9}")
+    for group in groups:
+        print(f"  {group['endpoint']:34}{group['count']:>3}{group['growth_max_kb'] / 1024:>8.1f}"
+              f"{group['growth_median_kb'] / 1024:>11.1f}{group['peak_max_kb'] / 1024:>9.1f}")
+    print("this worker, all requests:")
+    for row in memory_profiler.endpoint_stats():
+        print(f"  {row['endpoint']:34}{row['requests']:>3}{row['growth_max_kb'] / 1024:>8.1f}{row['growth_avg_kb'] / 1024:>11.1f}")
+    recorded = {group["endpoint"] for group in groups}
+    ok = "admin.export_verifications" in recorded and "verification.load_checklist" not in recorded
+
+    post = lambda action: developer.post(  # noqa: E731
+        "/developer/memory/tracemalloc", data={"action": action, "pid": os.getpid()}).status_code
+    statuses = [post("start"), post("snapshot")]
+    for _ in range(3):
+        developer.get("/admin/export/verifications")
+    statuses += [post("snapshot"), post("stop")]
+    snapshots = memory_profiler.list_snapshots()
+    page = developer.get(f"/developer/memory?old={snapshots[1]['name']}&new={snapshots[0]['name']}") if len(snapshots) >= 2 else None
+    print(f"\ntracemalloc actions HTTP {statuses}, {len(snapshots)} snapshots, compare page HTTP {page.status_code if page else '-'}")
+    if len(snapshots) >= 2:
+        for row in memory_profiler.compare(snapshots[1]["name"], snapshots[0]["name"], limit=5):
+            print(f"  {row['size_diff_kb']:>+9.1f} KB {row['count_diff']:>+7d} blocks  {row['site']}")
+    ok &= statuses == [302] * 4 and len(snapshots) == 2 and page.status_code == 200
+    ok &= developer.get("/developer/memory").status_code == 200
+    ok &= remote_tracemalloc(developer, config)
+
+    checklist = f"/verify/fg/{fg_id}"
+    modes = (("off", make_app(dict(config, MEMORY_PROFILING=False))), ("on", make_app(config)))
+    results = {}
+    for _ in range(2):
+        for name, instance in modes:
+            results.setdefault(name, []).extend(time_requests(instance, checklist, args.requests // 2))
+    p50_off, p50_on = percentile(results["off"], 50) * 1000, percentile(results["on"], 50) * 1000
+    print(f"\n{checklist} p50: memory profiling off {p50_off:.3f} ms, on {p50_on:.3f} ms ({p50_on - p50_off:+.3f} ms)")
+    if not ok:
+        print("FAIL")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
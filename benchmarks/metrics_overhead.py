@@ -0,0 +1,119 @@
+"""
+/metrics: instrumentation overhead and aggregation across worker processes.
+
+Times a checklist page with METRICS_ENABLED off and on, then forks --workers processes (like
+Gunicorn workers) sharing one METRICS_DIR. Each loads the checklist --requests times and submits
+once. A scrape from the parent must report the sum over all workers.
+
+Usage:
+  python benchmarks/metrics_overhead.py [--workers 4] [--requests 200]
+"""
+import argparse
+import multiprocessing
+import random
+import re
+import tempfile
+import time
+
+from common import create_user, login, make_app, percentile, redis_url, seed_dataset, temp_sqlite_url
+
+TOKEN = "bench-metrics-token"
+
+
+def time_requests(app, url, n):
+    client = app.test_client()
+    login(client, "metrics_operator")
+    client.get(url)
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client.get(url)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _worker(config, fg_id, form, n):
+    from app.services import metrics_service
+    app = make_app(config)
+    client = app.test_client()
+    login(client, "metrics_operator")
+    for _ in range(n):
+        client.get(f"/verify/fg/{fg_id}")
+    client.post(f"/verify/fg/{fg_id}/submit", data=form)
+    metrics_service.flush()  # Gunicorn workers flush at exit; multiprocessing skips atexit
+
+
+def sample(text, name, **labels):
+    """Sum of the samples of name whose labels include the given ones."""
+    total = 0.0
+    for line in text.splitlines():
+        match = re.match(r"^(\w+)(?:\{(.*)\})? (\S+)$", line)
+        if not match or match.group(1) != name:
+            continue
+        have = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or ""))
+        if all(have.get(k) == v for k, v in labels.items()):
+            total += float(match.group(3))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    redis_url()  # shared fake Redis, started before forking
+    url = temp_sqlite_url("metrics")
+    config = {"SQLALCHEMY_DATABASE_URI": url, "METRICS_ENABLED": True, "METRICS_TOKEN": TOKEN,
+              "METRICS_DIR": tempfile.mkdtemp(prefix="td_bench_metrics_")}
+    app = make_app(config)
+    with app.app_context():
+        from app.extensions import db
+        from app.models import FGCode, TDItem
+        db.create_all()
+        seed_dataset(200, random.Random(1))
+        create_user("metrics_operator")
+        fg = FGCode.query.filter(FGCode.is_active.is_(True), FGCode.td_items.any(TDItem.is_active.is_(True))).first()
+        form = {f"actual_{i.id}": "1" for i in TDItem.query.filter_by(fg_id=fg.id, is_active=True)}
+        fg_id, line_code = fg.id, fg.line.code
+        db.session.remove()
+        db.engine.dispose()
+
+    checklist = f"/verify/fg/{fg_id}"
+    off = make_app({"SQLALCHEMY_DATABASE_URI": url, "METRICS_ENABLED": False})
+    results = {}
+    for name, instance in (("off", off), ("on", app), ("off", off), ("on", app)):
+        results.setdefault(name, []).extend(time_requests(instance, checklist, args.requests // 2))
+    p50_off, p50_on = percentile(results["off"], 50) * 1000, percentile(results["on"], 50) * 1000
+    print(f"{checklist} p50: metrics off {p50_off:.3f} ms, on {p50_on:.3f} ms ({p50_on - p50_off:+.3f} ms)")
+
+    scrape = app.test_client()
+    before = scrape.get("/metrics", headers={"Authorization": f"Bearer {TOKEN}"}).get_data(as_text=True)
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_worker, args=(config, fg_id, form, args.requests)) for _ in range(args.workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    resp = scrape.get("/metrics", headers={"Authorization": f"Bearer {TOKEN}"})
+    after = resp.get_data(as_text=True)
+    denied = app.test_client().get("/metrics").status_code
+
+    loads = [sample(text, "td_http_request_duration_seconds_count", endpoint="verification.load_checklist") for text in (before, after)]
+    submits = [sample(text, "td_verification_submits_total", line=line_code) for text in (before, after)]
+    db_seconds = sample(after, "td_request_db_seconds_sum", endpoint="verification.load_checklist")
+    redis_seconds = sample(after, "td_request_redis_seconds_sum", endpoint="verification.load_checklist")
+    print(f"\n{args.workers} workers x {args.requests} checklist loads + 1 submit:")
+    print(f"  load_checklist requests  {loads[1] - loads[0]:.0f} (expected {args.workers * args.requests})")
+    print(f"  submits on line {line_code:8} {submits[1] - submits[0]:.0f} (expected {args.workers})")
+    print(f"  load_checklist db / redis time  {db_seconds * 1000 / loads[1]:.2f} / {redis_seconds * 1000 / loads[1]:.2f} ms per request")
+    print(f"  /metrics {resp.status_code} with token, {denied} without; {len(after.splitlines())} lines")
+    ok = (loads[1] - loads[0] == args.workers * args.requests and submits[1] - submits[0] == args.workers
+          and resp.status_code == 200 and denied == 403)
+    if not ok:
+        print("FAIL")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
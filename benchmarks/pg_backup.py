@@ -0,0 +1,94 @@
+"""
+PostgreSQL backup and restore times: legacy plain pg_dump + psql against directory-format
+pg_dump + parallel pg_restore.
+
+Needs BENCH_DATABASE_URL pointing at a local PostgreSQL scratch database (its role must be allowed
+to CREATE DATABASE) and pg_dump, pg_restore and psql on PATH. Loads a synthetic plant
+(services/synthetic_data.py) unless the database already has FG codes, then for the plain format
+and each --jobs value dumps the database and restores the dump into a fresh scratch database,
+printing dump time, restore time and size. Restores go to <db>_restore_bench, dropped afterwards,
+so the source database is never touched.
+
+Usage:
+  BENCH_DATABASE_URL=postgresql://postgres@localhost/td_bench python benchmarks/pg_backup.py \\
+      [--fg-codes 20000] [--verifications 50000] [--jobs 1,2,4,8]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from common import make_app
+
+
+def psql(url, sql):
+    from app.services.backup_service import _pg_connection
+    args, env = _pg_connection(url, "postgres")
+    subprocess.run(["psql", *args, "-v", "ON_ERROR_STOP=1", "-c", sql], env=env, check=True, capture_output=True)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fg-codes", type=int, default=20000)
+    parser.add_argument("--verifications", type=int, default=50000)
+    parser.add_argument("--jobs", default="1,2,4,8")
+    args = parser.parse_args()
+    url = os.environ.get("BENCH_DATABASE_URL", "")
+    if not url.startswith("postgresql"):
+        raise SystemExit("Set BENCH_DATABASE_URL to a PostgreSQL scratch database")
+    for tool in ("pg_dump", "pg_restore", "psql"):
+        if not shutil.which(tool):
+            raise SystemExit(f"{tool} not found on PATH")
+
+    app = make_app({"SQLALCHEMY_DATABASE_URI": url})
+    with app.app_context():
+        from app.extensions import db
+        from app.models import FGCode
+        from app.services.backup_catalog import download_size
+        from app.services.backup_service import _pg_connection, _pg_dump, _pg_restore
+        from app.services.migration_service import upgrade
+        from app.services.synthetic_data import generate
+        db.create_all()
+        upgrade()
+        if not db.session.query(FGCode.id).first():
+            print("Loading synthetic data ...")
+            generate(fg_codes=args.fg_codes, verifications=args.verifications)
+        db.session.remove()
+        rows = sum(db.session.execute(db.text(f"SELECT COUNT(*) FROM {t.name}")).scalar()
+                   for t in db.metadata.sorted_tables)
+        print(f"{rows:,} rows\n")
+
+        scratch_db = _pg_connection(url)[0][-1] + "_restore_bench"
+        work = tempfile.mkdtemp(prefix="td_bench_pg_backup_")
+        print(f"{'format':24}{'dump s':>9}{'restore s':>11}{'size MB':>10}")
+        runs = [("plain .sql (psql)", None)] + [(f"directory -j {n}", int(n)) for n in args.jobs.split(",")]
+        try:
+            for label, jobs in runs:
+                if jobs is None:
+                    path = os.path.join(work, "td_backup_plain.sql")
+                    conn_args, env = _pg_connection(url)
+                    dump_s = timed(lambda: subprocess.run(
+                        ["pg_dump", *conn_args, "-f", path, "--no-owner", "--no-acl"],
+                        env=env, check=True, capture_output=True))
+                else:
+                    path = os.path.join(work, f"td_backup_j{jobs}.pgdump")
+                    dump_s = timed(lambda: _pg_dump(url, path, jobs=jobs))
+                psql(url, f"DROP DATABASE IF EXISTS {scratch_db}")
+                psql(url, f"CREATE DATABASE {scratch_db}")
+                restore_s = timed(lambda: _pg_restore(url, path, dbname=scratch_db, jobs=jobs))
+                print(f"{label:24}{dump_s:>9.2f}{restore_s:>11.2f}{download_size(path) / 1048576:>10.1f}")
+        finally:
+            psql(url, f"DROP DATABASE IF EXISTS {scratch_db}")
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
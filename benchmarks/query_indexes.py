@@ -0,0 +1,127 @@
+"""
+Hot query latency before and after the index migrations, on a scaled synthetic dataset.
+
+Builds the schema, drops the migration-managed indexes to reproduce a pre-migration database,
+loads the dataset, times each hot query from the routes, then runs migration_service.upgrade()
+and times them again. Query plans (EXPLAIN) after the upgrade are printed for reference.
+
+Database is BENCH_DATABASE_URL (e.g. PostgreSQL) or a temporary SQLite file. BENCH_DATABASE_URL
+must be a scratch database: all tables are dropped and recreated.
+
+Usage:
+  python benchmarks/query_indexes.py [--verifications 100000] [--repeat 10]
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from common import make_app, percentile, seed_dataset, temp_sqlite_url
+
+MIGRATION_INDEXES = [
+    "ix_verification_items_verification_id",
+    "ix_verification_items_td_item_id",
+    "ix_verifications_verified_at",
+    "ix_verifications_fg_verified_at",
+    "ix_verifications_operator_verified_at",
+    "ix_audit_logs_created_at",
+    "ix_login_attempts_created_at",
+    "ix_fg_codes_line_active",
+    "ix_td_items_fg_active",
+]
+def hot_queries(n_verifications):
+    """(name, fn(rng) -> ORM query, terminal) for the queries the routes run most."""
+    from app.models import AuditLog, FGCode, LoginAttempt, TDItem, Verification, VerificationItem
+    now = datetime.utcnow()
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        ("checklist items", lambda r: TDItem.query.filter_by(fg_id=r.randrange(1, 1001), is_active=True).order_by(TDItem.item_code), "all"),
+        ("active FG codes of line", lambda r: FGCode.query.filter_by(line_id=r.randrange(1, 21), is_active=True).order_by(FGCode.code), "all"),
+        ("verification detail", lambda r: Verification.query.filter_by(id=r.randrange(1, n_verifications + 1)), "all"),
+        ("recent verifications", lambda r: Verification.query.order_by(Verification.verified_at.desc()).limit(5), "all"),
+        ("verifications today", lambda r: Verification.query.filter(Verification.verified_at >= day), "count"),
+        ("FG history", lambda r: Verification.query.filter_by(fg_id=r.randrange(1, 1001)).order_by(Verification.verified_at.desc()).limit(20), "all"),
+        ("operator history", lambda r: Verification.query.filter_by(operator_id=r.randrange(1, 51)).order_by(Verification.verified_at.desc()).limit(20), "all"),
+        ("TD item usage", lambda r: VerificationItem.query.filter_by(td_item_id=r.randrange(1, 20001)), "count"),
+        ("audit log page", lambda r: AuditLog.query.order_by(AuditLog.created_at.desc()).limit(50), "all"),
+        ("audit log one day", lambda r: AuditLog.query.filter(AuditLog.created_at >= day - timedelta(days=r.randrange(300)),
+                                                              AuditLog.created_at < day - timedelta(days=r.randrange(300)) + timedelta(days=1)), "count"),
+        ("login attempts last hour", lambda r: LoginAttempt.query.filter(LoginAttempt.created_at >= now - timedelta(hours=1)), "count"),
+    ]
+
+
+def time_queries(queries, repeat, seed_value):
+    from app.extensions import db
+    results = {}
+    for name, build, terminal in queries:
+        rng = random.Random(seed_value)
+        times = []
+        for _ in range(repeat):
+            query = build(rng)
+            db.session.expire_all()
+            start = time.perf_counter()
+            query.all() if terminal == "all" else query.count()
+            times.append(time.perf_counter() - start)
+        results[name] = percentile(times, 50)
+    return results
+
+
+def explain(query):
+    from app.extensions import db
+    conn = db.session.connection()
+    compiled = query.statement.compile(conn)
+    params = compiled.construct_params()
+    args = tuple(params[name] for name in compiled.positiontup) if compiled.positional else params
+    if conn.dialect.name == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + compiled.string, args).fetchall()
+        return "; ".join(row[-1] for row in rows)
+    rows = conn.exec_driver_sql("EXPLAIN " + compiled.string, args).fetchall()
+    return rows[0][0].strip()
+
+
+def analyze():
+    from app.extensions import db
+    db.session.execute(db.text("ANALYZE"))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verifications", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    url = os.environ.get("BENCH_DATABASE_URL") or temp_sqlite_url("query_indexes")
+    app = make_app({"SQLALCHEMY_DATABASE_URI": url})
+    with app.app_context():
+        from app.extensions import db
+        from app.services.migration_service import drop_index, upgrade
+        db.drop_all()
+        db.create_all()
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for name in MIGRATION_INDEXES:
+                drop_index(conn, name)
+            conn.exec_driver_sql("DROP TABLE IF EXISTS schema_migrations")
+        start = time.perf_counter()
+        seed_dataset(args.verifications, random.Random(1))
+        print(f"seeded {args.verifications} verifications in {time.perf_counter() - start:.1f}s ({db.engine.dialect.name})")
+        analyze()
+
+        queries = hot_queries(args.verifications)
+        before = time_queries(queries, args.repeat, 7)
+        start = time.perf_counter()
+        upgrade()
+        print(f"migrations applied in {time.perf_counter() - start:.1f}s\n")
+        analyze()
+        after = time_queries(queries, args.repeat, 7)
+
+        print(f"{'query':26}{'before ms':>11}{'after ms':>10}{'speedup':>9}  plan after")
+        for name, build, _ in queries:
+            b, a = before[name] * 1000, after[name] * 1000
+            plan = explain(build(random.Random(7)))
+            print(f"{name:26}{b:>11.2f}{a:>10.2f}{b / a if a else 0:>8.1f}x  {plan[:90]}")
+
+
+if __name__ == "__main__":
+    main()
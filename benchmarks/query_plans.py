@@ -0,0 +1,194 @@
+"""
+Query plan regression check for every blueprint route.
+
+Seeds a production-shaped dataset, requests each GET route of the admin, developer, verification,
+operator and auth blueprints (plus the checklist submit) as a user allowed to see it, captures
+every SQL statement and EXPLAINs it. Fails (exit 1) when:
+  - a route answers with a server error (status >= 500): its statements are not the route's
+  - a statement reads a large table with a full scan (no index), unless allow-listed below
+  - a route issues more statements than recorded in query_plan_baseline.json, or has no entry
+    there (compared only when the baseline was taken with the same --verifications, since exports
+    grow with the data); add new routes with --update-baseline
+
+Runs on a temporary SQLite file, or on BENCH_DATABASE_URL (e.g. a local PostgreSQL scratch
+database; all tables are dropped and recreated).
+
+Usage:
+  python benchmarks/query_plans.py [--verifications 20000] [--update-baseline] [-v]
+"""
+import argparse
+import json
+import os
+import random
+import re
+
+from common import create_user, is_query, login, make_app, seed_dataset, temp_sqlite_url
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_plan_baseline.json")
+
+LARGE_TABLES = {"verification_items", "verifications", "audit_logs", "login_attempts", "td_items"}
+
+# (endpoint, table): whole-table reads that are the point of the route
+ALLOWED_SCANS = {
+    ("admin.export_verifications", "verifications"),  # export without a date range is every row
+    ("admin.export_audit_logs", "audit_logs"),
+    ("admin.dashboard", "td_items"),  # active item total counts every active row
+}
+
+# GET routes with side effects or binary downloads, and restore job pages (they need a running restore)
+SKIP_ENDPOINTS = {"static", "developer.backup_create", "developer.backup_download", "developer.trace_detail",
+                  "developer.restore_progress", "developer.restore_status", "developer.restore_progress_poll",
+                  "maintenance_message", "index"}
+
+ROLE_FOR_BLUEPRINT = {
+    "admin": "admin",
+    "developer": "developer",
+    "verification": "operator",
+    "operator": "operator",
+    "auth": None,  # login page is anonymous; change-password uses the operator
+}
+
+
+class StatementRecorder:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.active = False
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active and is_query(statement):
+            self.statements.append((statement, parameters))
+
+
+def full_scans(conn, statement, parameters):
+    """Large tables read without an index, from the dialect's EXPLAIN output."""
+    if conn.dialect.name == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        details = [row[-1] for row in rows]
+        # "SCAN t" is a table scan; "SCAN t USING [COVERING] INDEX i" walks an index
+        pattern = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+    else:
+        rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).fetchall()
+        details = [row[0] for row in rows]
+        pattern = re.compile(r"Seq Scan on (\w+)")
+    tables = set()
+    for detail in details:
+        match = pattern.search(detail.strip())
+        if match:
+            tables.add(re.sub(r"_\d+$", "", match.group(1)))  # SQLAlchemy aliases: verification_items_1
+    return tables & LARGE_TABLES, details
+
+
+def route_targets(app, ids):
+    """[(endpoint, method, url, role, form)] for the routes to check."""
+    from flask import url_for
+    targets = []
+    with app.test_request_context():
+        for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.endpoint):
+            blueprint = rule.endpoint.split(".")[0]
+            if rule.endpoint in SKIP_ENDPOINTS or blueprint not in ROLE_FOR_BLUEPRINT or "GET" not in rule.methods:
+                continue
+            role = ROLE_FOR_BLUEPRINT[blueprint]
+            if rule.endpoint == "auth.change_password":
+                role = "operator"
+            url = url_for(rule.endpoint, **{arg: ids[arg] for arg in rule.arguments})
+            targets.append((rule.endpoint, "GET", url, role, None))
+        form = {f"actual_{item_id}": "1" for item_id in ids["active_items"]}
+        targets.append(("verification.submit_checklist", "POST", url_for("verification.submit_checklist", fg_id=ids["fg_id"]), "operator", form))
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verifications", type=int, default=20000)
+    parser.add_argument("--update-baseline", action="store_true", help="write current query counts as the baseline")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every statement and plan")
+    args = parser.parse_args()
+
+    url = os.environ.get("BENCH_DATABASE_URL") or temp_sqlite_url("query_plans")
+    app = make_app({"SQLALCHEMY_DATABASE_URI": url})
+    with app.app_context():
+        from app.extensions import db
+        from app.models import FGCode, TDItem
+        from app.services.migration_service import upgrade
+        db.drop_all()
+        db.create_all()
+        upgrade()
+        seed_dataset(args.verifications, random.Random(1))
+        for role in ("developer", "admin", "operator"):
+            create_user(f"plan_{role}", role=role)
+        db.session.execute(db.text("ANALYZE"))
+        db.session.commit()
+        fg = FGCode.query.filter(FGCode.is_active.is_(True), FGCode.td_items.any(TDItem.is_active.is_(True))).first()
+        active_items = [i.id for i in TDItem.query.filter_by(fg_id=fg.id, is_active=True)]
+        ids = {
+            "line_id": fg.line_id,
+            "fg_id": fg.id,
+            "item_id": active_items[0],
+            "active_items": active_items,
+            "verification_id": 1,
+            "user_id": 1,
+        }
+        recorder = StatementRecorder(db.engine)
+
+    clients = {None: app.test_client()}
+    for role in ("developer", "admin", "operator"):
+        clients[role] = app.test_client()
+        login(clients[role], f"plan_{role}")
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            recorded = json.load(f)
+        if recorded["verifications"] == args.verifications:
+            baseline = recorded["queries"]
+        else:
+            print(f"baseline was taken with --verifications {recorded['verifications']}; query counts not compared")
+    counts, failures, server_errors = {}, [], []
+    print(f"{'route':40}{'HTTP':>5}{'queries':>9}{'baseline':>10}  full scans")
+    for endpoint, method, target_url, role, form in route_targets(app, ids):
+        recorder.statements = []
+        recorder.active = True
+        resp = clients[role].open(target_url, method=method, data=form)
+        recorder.active = False
+        counts[endpoint] = len(recorder.statements)
+        scanned = set()
+        with app.app_context():
+            from app.extensions import db
+            with db.engine.connect() as conn:
+                for statement, parameters in recorder.statements:
+                    if not statement.lstrip().upper().startswith("SELECT"):
+                        continue
+                    tables, plan = full_scans(conn, statement, parameters)
+                    scanned |= {t for t in tables if (endpoint, t) not in ALLOWED_SCANS}
+                    if args.verbose:
+                        print(f"    {' '.join(statement.split())[:150]}\n      " + "\n      ".join(plan))
+        expected = baseline.get(endpoint)
+        over = expected is not None and counts[endpoint] > expected
+        if resp.status_code >= 500:
+            server_errors.append(f"{endpoint}: HTTP {resp.status_code}")
+        if scanned:
+            failures.append(f"{endpoint}: full scan of {', '.join(sorted(scanned))}")
+        if over:
+            failures.append(f"{endpoint}: {counts[endpoint]} queries, baseline {expected}")
+        elif expected is None and baseline:
+            failures.append(f"{endpoint}: no baseline entry ({counts[endpoint]} queries)")
+        print(f"{endpoint:40}{resp.status_code:>5}{counts[endpoint]:>9}{'-' if expected is None else expected:>10}"
+              f"{'!' if over else ' '} {', '.join(sorted(scanned))}")
+
+    if args.update_baseline and server_errors:
+        print("\nBaseline not written; server errors:\n  " + "\n  ".join(server_errors))
+        raise SystemExit(1)
+    if args.update_baseline:
+        with open(BASELINE, "w") as f:
+            json.dump({"verifications": args.verifications, "queries": counts}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {BASELINE}")
+    elif failures or server_errors:
+        print("\nPlan regressions:\n  " + "\n  ".join(server_errors + failures))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
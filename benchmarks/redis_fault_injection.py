@@ -0,0 +1,65 @@
+"""
+Fault injection for the Redis circuit breaker.
+
+Runs the app through a TCP proxy in front of Redis (BENCH_REDIS_URL or in-process fakeredis),
+then degrades Redis and measures what the Redis-touching request hooks cost:
+  healthy    normal traffic
+  blackhole  Redis accepts connections but never answers (socket timeouts)
+  recovered  proxy back to pass-through; breaker must close via its background probe
+
+Usage:
+  python benchmarks/redis_fault_injection.py [--calls 50]
+"""
+import argparse
+import time
+
+from common import FaultProxy, make_app, percentile, redis_url
+
+
+def exercise(app, calls):
+    """Time the service calls every login/checklist request makes."""
+    from app.services.maintenance_service import is_maintenance_mode
+    from app.services.rate_limit_service import login_cooldown
+    from app.services.session_service import get_active_sessions_count
+    times = []
+    with app.test_request_context("/"):
+        for _ in range(calls):
+            start = time.perf_counter()
+            is_maintenance_mode()
+            login_cooldown("127.0.0.1", "fault_user")
+            get_active_sessions_count()
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def report(name, times, breaker):
+    print(f"{name:10} p50 {percentile(times, 50) * 1e6:9.0f} us   p95 {percentile(times, 95) * 1e6:9.0f} us"
+          f"   max {max(times) * 1e3:7.0f} ms   total {sum(times):6.2f} s   breaker {breaker.state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+
+    proxy = FaultProxy(redis_url())
+    app = make_app({"REDIS_URL": proxy.url, "REDIS_BREAKER_PROBE_SECONDS": 1})
+    from app.extensions import get_redis_breaker
+    breaker = get_redis_breaker()
+    if breaker is None:
+        raise SystemExit("Redis unavailable at startup")
+
+    report("healthy", exercise(app, args.calls), breaker)
+    proxy.mode = "blackhole"
+    report("blackhole", exercise(app, args.calls), breaker)
+    proxy.mode = "pass"
+    deadline = time.time() + 10
+    while breaker.state != "closed" and time.time() < deadline:
+        time.sleep(0.1)
+    report("recovered", exercise(app, args.calls), breaker)
+    print("breaker:", breaker.snapshot())
+    proxy.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Read-replica routing check with two local SQLite databases.
+
+The replica is a snapshot of the seeded primary, so rows written afterwards exist only on the
+primary. Checks that:
+  - @replica_reads views (dashboards, audit logs, exports) run their SELECTs on the replica
+  - the checklist submit and the result page that follows it use only the primary
+  - the lag guard (REPLICA_MAX_LAG_SECONDS) and an unreachable replica send reads to the primary
+and prints per-route statement counts per database.
+
+Usage:
+  python benchmarks/replica_routing.py [--verifications 2000]
+"""
+import argparse
+import random
+import sqlite3
+
+from common import create_user, is_query, login, make_app, seed_dataset, temp_sqlite_url
+
+READ_ROUTES = [
+    ("admin", "/admin/"),
+    ("admin", "/admin/audit-logs"),
+    ("admin", "/admin/export/verifications?from=2000-01-01"),
+    ("admin", "/admin/export/audit-logs"),
+    ("developer", "/developer/"),
+    ("developer", "/developer/audit-logs"),
+]
+
+
+class Counter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, *args):
+        if statement != "SELECT 1" and is_query(statement):  # not the lag probe
+            self.count += 1
+
+
+def snapshot(primary_url, replica_url):
+    src = sqlite3.connect(primary_url.replace("sqlite:///", ""))
+    dst = sqlite3.connect(replica_url.replace("sqlite:///", ""))
+    src.backup(dst)
+    src.close()
+    dst.close()
+
+
+def run(client, method, url, counters, data=None):
+    for c in counters.values():
+        c.count = 0
+    resp = client.open(url, method=method, data=data)
+    return resp, {name: c.count for name, c in counters.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verifications", type=int, default=2000)
+    args = parser.parse_args()
+
+    primary_url, replica_url = temp_sqlite_url("replica_primary"), temp_sqlite_url("replica_replica")
+    app = make_app({
+        "SQLALCHEMY_DATABASE_URI": primary_url,
+        "DATABASE_REPLICA_URL": replica_url,
+        "REPLICA_LAG_CHECK_SECONDS": 0,  # re-check on every read so config changes apply at once
+    })
+    with app.app_context():
+        from app.extensions import db
+        from app.models import FGCode, TDItem
+        db.drop_all()
+        db.create_all()
+        seed_dataset(args.verifications, random.Random(1))
+        for role in ("developer", "admin", "operator"):
+            create_user(f"replica_{role}", role=role)
+        fg = FGCode.query.filter(FGCode.is_active.is_(True), FGCode.td_items.any(TDItem.is_active.is_(True))).first()
+        form = {f"actual_{i.id}": "1" for i in TDItem.query.filter_by(fg_id=fg.id, is_active=True)}
+        db.session.remove()
+        db.engine.dispose()
+        snapshot(primary_url, replica_url)
+        counters = {"primary": Counter(db.engine), "replica": Counter(db.engines["replica"])}
+
+    clients = {}
+    for role in ("developer", "admin", "operator"):
+        clients[role] = app.test_client()
+        login(clients[role], f"replica_{role}")
+
+    failures = []
+    print(f"{'route':48}{'HTTP':>5}{'primary':>9}{'replica':>9}")
+    for role, url in READ_ROUTES:
+        resp, counts = run(clients[role], "GET", url, counters)
+        print(f"{url:48}{resp.status_code:>5}{counts['primary']:>9}{counts['replica']:>9}")
+        if counts["replica"] == 0:
+            failures.append(f"{url}: no reads on the replica")
+
+    resp, counts = run(clients["operator"], "POST", f"/verify/fg/{fg.id}/submit", counters, data=form)
+    print(f"{'POST /verify/fg/<id>/submit':48}{resp.status_code:>5}{counts['primary']:>9}{counts['replica']:>9}")
+    if counts["replica"]:
+        failures.append("submit read from the replica")
+    result_url = resp.headers.get("Location", "")
+    resp, counts = run(clients["operator"], "GET", result_url, counters)
+    print(f"{result_url:48}{resp.status_code:>5}{counts['primary']:>9}{counts['replica']:>9}")
+    if counts["replica"]:
+        failures.append("result page read from the replica")
+
+    print("\nlag guard (REPLICA_MAX_LAG_SECONDS = -1):")
+    app.config["REPLICA_MAX_LAG_SECONDS"] = -1
+    resp, counts = run(clients["admin"], "GET", "/admin/", counters)
+    print(f"{'/admin/':48}{resp.status_code:>5}{counts['primary']:>9}{counts['replica']:>9}")
+    if counts["replica"]:
+        failures.append("lag guard did not route reads to the primary")
+    app.config["REPLICA_MAX_LAG_SECONDS"] = 10
+
+    print("\nunreachable replica:")
+    down = make_app({
+        "SQLALCHEMY_DATABASE_URI": primary_url,
+        "DATABASE_REPLICA_URL": "sqlite:////nonexistent-dir/replica.db",
+        "REPLICA_LAG_CHECK_SECONDS": 0,
+    })
+    client = down.test_client()
+    login(client, "replica_admin")
+    resp = client.get("/admin/")
+    print(f"{'/admin/':48}{resp.status_code:>5}")
+    if resp.status_code != 200:
+        failures.append("unreachable replica broke /admin/")
+
+    if failures:
+        print("\nFAIL:\n  " + "\n  ".join(failures))
+        raise SystemExit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Session and rate-limit store comparison: Redis vs the SQLite local store vs filesystem sessions.
+
+For each backend: latency of authenticated requests that rewrite the session every time
+(SESSION_TOUCH_INTERVAL_SECONDS=0) and of a rate-limit hit. Then --workers processes hammer one
+login rate-limit key on the local store to check cross-worker consistency: exactly
+MAX_LOGIN_ATTEMPTS hits must be accepted before the cooldown, however they interleave.
+
+Redis is BENCH_REDIS_URL or the in-process fakeredis server; the other backends run with Redis
+unreachable at startup, as in production fallback.
+
+Usage:
+  python benchmarks/session_backends.py [--requests 300] [--workers 4]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from common import create_user, login, make_app, percentile, redis_url
+
+UNREACHABLE_REDIS = "redis://127.0.0.1:1/0"
+
+
+def backend_config(name, workdir):
+    if name == "redis":
+        return {"REDIS_URL": redis_url()}
+    if name == "local":
+        return {"REDIS_URL": UNREACHABLE_REDIS, "LOCAL_STORE_PATH": os.path.join(workdir, "local_store.db")}
+    return {"REDIS_URL": UNREACHABLE_REDIS, "LOCAL_STORE_PATH": "", "SESSION_FILE_DIR": os.path.join(workdir, "sessions")}
+
+
+def measure(name, requests, workdir):
+    import app.services.session_service as session_service
+    session_service.SESSION_TOUCH_INTERVAL_SECONDS = 0
+    app = make_app(dict(backend_config(name, workdir), SESSION_REFRESH_EACH_REQUEST=True))
+    with app.app_context():
+        from app.extensions import db
+        db.create_all()
+        create_user("bench_op")
+    client = app.test_client()
+    login(client, "bench_op")
+    request_times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        resp = client.get("/verify/")
+        request_times.append(time.perf_counter() - start)
+        if resp.status_code != 200:
+            raise SystemExit(f"{name}: unexpected HTTP {resp.status_code}")
+
+    from app.services.rate_limit_service import hit
+    hit_times = []
+    with app.app_context():
+        for i in range(requests):
+            start = time.perf_counter()
+            hit([f"bench-{i % 50}"], 1000, 60, 60, "bench")
+            hit_times.append(time.perf_counter() - start)
+    return request_times, hit_times
+
+
+def _hammer(store_path, attempts, results):
+    app = make_app({"REDIS_URL": UNREACHABLE_REDIS, "LOCAL_STORE_PATH": store_path})
+    from app.services.rate_limit_service import hit
+    from app.config import MAX_LOGIN_ATTEMPTS, LOGIN_ATTEMPT_WINDOW_SECONDS, LOGIN_COOLDOWN_SECONDS
+    accepted = 0
+    with app.app_context():
+        for _ in range(attempts):
+            allowed, _ = hit(["10.0.0.1"], MAX_LOGIN_ATTEMPTS, LOGIN_ATTEMPT_WINDOW_SECONDS, LOGIN_COOLDOWN_SECONDS, "login")
+            accepted += allowed
+    results.put(accepted)
+
+
+def cross_worker_check(workers, workdir):
+    from app.config import MAX_LOGIN_ATTEMPTS
+    store_path = os.path.join(workdir, "shared_store.db")
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_hammer, args=(store_path, 20, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    accepted = sum(results.get() for _ in procs)
+    status = "OK" if accepted == MAX_LOGIN_ATTEMPTS else "INCONSISTENT"
+    print(f"\n{workers} workers x 20 failed logins on one key: {accepted} accepted (limit {MAX_LOGIN_ATTEMPTS}) {status}")
+    return accepted == MAX_LOGIN_ATTEMPTS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="td_bench_backends_")
+    print(f"{'backend':12}{'request p50':>13}{'request p95':>13}{'ratelimit p50':>15}{'ratelimit p95':>15}")
+    for name in ("redis", "local", "filesystem"):
+        request_times, hit_times = measure(name, args.requests, workdir)
+        cells = [percentile(t, p) * 1000 for t in (request_times, hit_times) for p in (50, 95)]
+        print(f"{name:12}{cells[0]:>11.2f}ms{cells[1]:>11.2f}ms{cells[2]:>13.3f}ms{cells[3]:>13.3f}ms")
+    if not cross_worker_check(args.workers, workdir):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
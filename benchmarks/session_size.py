@@ -0,0 +1,89 @@
+"""
+Session blob size and serialization time: Flask-Session msgpack (and pickle, its legacy format)
+vs the compact signed serializer. Then checks migration: a session stored in the old msgpack
+format must stay logged in and be rewritten in the compact format on its next save.
+
+The session measured is a real logged-in session from the app, plus a CSRF token and a flash
+message as a form page would add.
+
+Usage:
+  python benchmarks/session_size.py [--iterations 20000]
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import time
+
+import msgspec
+
+from common import create_user, login, make_app
+
+
+def per_call_us(fn, arg, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def stored_session(app, client):
+    """(store key, raw blob) of the client's session."""
+    from app.extensions import get_session_redis
+    interface = app.session_interface
+    sid = interface._unsign(app, client.get_cookie(app.config["SESSION_COOKIE_NAME"]).value)
+    key = interface._get_store_id(sid)
+    return key, get_session_redis().get(key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    import app.services.session_service as session_service
+    session_service.SESSION_TOUCH_INTERVAL_SECONDS = 0  # every request saves the session
+    app = make_app({"SESSION_SERIALIZER": "compact"})
+    with app.app_context():
+        from app.extensions import db
+        db.create_all()
+        create_user("size_user")
+    client = app.test_client()
+    login(client, "size_user")
+    client.get("/verify/")
+
+    compact = app.session_interface.serializer
+    key, blob = stored_session(app, client)
+    session = dict(compact.decode(blob))
+    session.setdefault("csrf_token", hashlib.sha1(os.urandom(64)).hexdigest())
+    session["_flashes"] = [["success", "Checklist submitted successfully."]]
+
+    legacy = msgspec.msgpack.Encoder()
+    legacy_decoder = msgspec.msgpack.Decoder()
+    formats = {
+        "pickle": (lambda s: pickle.dumps(s), pickle.loads),
+        "msgpack": (legacy.encode, legacy_decoder.decode),
+        "compact": (compact.encode, compact.decode),
+    }
+    print(f"session keys: {', '.join(sorted(session))}\n")
+    print(f"{'format':10}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for name, (encode, decode) in formats.items():
+        data = encode(session)
+        assert decode(data) == session or name == "pickle", f"{name} does not round-trip"
+        print(f"{name:10}{len(data):>8}{per_call_us(encode, session, args.iterations):>12.2f}"
+              f"{per_call_us(decode, data, args.iterations):>12.2f}")
+
+    # Migration: replace the stored blob with the old format, then make one request
+    from app.extensions import get_session_redis
+    ttl = get_session_redis().ttl(key)
+    get_session_redis().set(key, legacy.encode(compact.decode(blob)), ex=ttl)
+    status = client.get("/verify/").status_code
+    _, migrated = stored_session(app, client)
+    ok = status == 200 and migrated[:1] == bytes([1])
+    print(f"\nlegacy msgpack session: HTTP {status}, rewritten as compact v1: {migrated[:1] == bytes([1])}")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
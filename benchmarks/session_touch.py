@@ -0,0 +1,45 @@
+"""
+Redis commands per authenticated request (before_request activity tracking + session save).
+
+Usage:
+  python benchmarks/session_touch.py [--requests 300] [--interval 60]
+
+--interval 0 reproduces the old behaviour of writing activity on every request.
+"""
+import argparse
+
+from common import RedisCommandCounter, create_user, login, make_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--interval", type=int, default=None, help="SESSION_TOUCH_INTERVAL_SECONDS override")
+    args = parser.parse_args()
+
+    if args.interval is not None:
+        import app.services.session_service as session_service
+        session_service.SESSION_TOUCH_INTERVAL_SECONDS = args.interval
+    app = make_app({"SESSION_REFRESH_EACH_REQUEST": args.interval == 0})
+    with app.app_context():
+        from app.extensions import db
+        db.create_all()
+        create_user("bench_op")
+    client = app.test_client()
+    login(client, "bench_op")
+    client.get("/verify/")  # first touch after login
+
+    counter = RedisCommandCounter()
+    with counter.installed():
+        for _ in range(args.requests):
+            resp = client.get("/verify/")
+            if resp.status_code != 200:
+                raise SystemExit(f"Unexpected HTTP {resp.status_code}")
+    n = args.requests
+    print(f"requests:               {n}")
+    print(f"redis commands/request: {counter.commands / n:.2f}")
+    print(f"round trips/request:    {counter.round_trips / n:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Slow query log (SLOW_QUERY_LOG): what it records, with both backends, and what it costs.
+
+With a low SLOW_QUERY_MS, walks the same routes as query_plans.py once with Redis and once with
+the local store (Redis unreachable), then prints the top offenders as /developer/slow-queries
+groups them. Every record must name an endpoint and an app/ code location, and the buffer must
+stay within SLOW_QUERY_BUFFER. Then times a checklist page with the log off and on at the
+default threshold (nothing recorded: the cost every request pays in production).
+
+Usage:
+  python benchmarks/slow_queries.py [--verifications 2000] [--threshold-ms 2] [--requests 300]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import create_user, login, make_app, percentile, seed_dataset, temp_sqlite_url
+from query_plans import route_targets
+
+BUFFER = 100
+
+
+def time_requests(app, url, n):
+    client = app.test_client()
+    login(client, "slow_operator")
+    client.get(url)
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client.get(url)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def walk(app, ids):
+    from app.services import slow_query_log
+    clients = {None: app.test_client()}
+    for role in ("developer", "admin", "operator"):
+        clients[role] = app.test_client()
+        login(clients[role], f"slow_{role}")
+    with app.app_context():
+        slow_query_log.clear()
+    for endpoint, method, target_url, role, form in route_targets(app, ids):
+        clients[role].open(target_url, method=method, data=form)
+    page = clients["developer"].get("/developer/slow-queries")
+    with app.app_context():
+        records = slow_query_log.entries()
+    return page.status_code, records, slow_query_log.top_offenders(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verifications", type=int, default=2000)
+    parser.add_argument("--threshold-ms", type=float, default=2.0)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    url = temp_sqlite_url("slow_queries")
+    config = {"SQLALCHEMY_DATABASE_URI": url, "SLOW_QUERY_LOG": True, "SLOW_QUERY_MS": args.threshold_ms,
+              "SLOW_QUERY_BUFFER": BUFFER}
+    app = make_app(config)
+    with app.app_context():
+        from app.extensions import db
+        from app.models import FGCode, TDItem
+        db.create_all()
+        seed_dataset(args.verifications, random.Random(1))
+        for role in ("developer", "admin", "operator"):
+            create_user(f"slow_{role}", role=role)
+        fg = FGCode.query.filter(FGCode.is_active.is_(True), FGCode.td_items.any(TDItem.is_active.is_(True))).first()
+        active_items = [i.id for i in TDItem.query.filter_by(fg_id=fg.id, is_active=True)]
+        ids = {"line_id": fg.line_id, "fg_id": fg.id, "item_id": active_items[0], "active_items": active_items,
+               "verification_id": 1, "user_id": 1}
+
+    local = dict(config, REDIS_URL="redis://127.0.0.1:1/0",
+                 LOCAL_STORE_PATH=os.path.join(tempfile.mkdtemp(prefix="td_bench_slow_"), "local.db"))
+    ok = True
+    for backend, overrides in (("redis", config), ("local store", local)):
+        # Redis clients are process globals, so each backend gets a fresh app
+        status, records, groups = walk(make_app(overrides), ids)
+        print(f"\n{backend}: {len(records)} statements >= {args.threshold_ms:g} ms in {len(groups)} groups, "
+              f"/developer/slow-queries HTTP {status}")
+        print(f"{'count':>6}{'total ms':>10}{'avg ms':>8}  {'endpoint':32}location")
+        for group in groups[:8]:
+            endpoint = group["endpoints"].most_common(1)[0][0]
+            print(f"{group['count']:>6}{group['total_ms']:>10.1f}{group['avg_ms']:>8.1f}  {endpoint:32}{group['location']}")
+        ok &= (status == 200 and 0 < len(records) <= BUFFER and sum(g["count"] for g in groups) == len(records)
+               and all(r["endpoint"] and r["location"] for r in records))
+
+    checklist = f"/verify/fg/{fg.id}"
+    off = make_app({"SQLALCHEMY_DATABASE_URI": url, "SLOW_QUERY_LOG": False})
+    on = make_app({"SQLALCHEMY_DATABASE_URI": url, "SLOW_QUERY_LOG": True, "SLOW_QUERY_MS": 200})
+    results = {}
+    for name, instance in (("off", off), ("on", on), ("off", off), ("on", on)):
+        results.setdefault(name, []).extend(time_requests(instance, checklist, args.requests // 2))
+    p50_off, p50_on = percentile(results["off"], 50) * 1000, percentile(results["on"], 50) * 1000
+    print(f"\n{checklist} p50: slow query log off {p50_off:.3f} ms, on {p50_on:.3f} ms ({p50_on - p50_off:+.3f} ms)")
+    if not ok:
+        print("FAIL")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Per-request SQL profiling (SQL_PROFILING): N+1 report for every route, and its overhead.
+
+Walks the same routes as query_plans.py, printing each request's statement count and DB time
+(what developers see in X-SQL-Queries / X-SQL-Time-Ms) and each statement shape that crossed
+SQL_N_PLUS_ONE_THRESHOLD. Then times a checklist page with profiling off and on.
+
+Usage:
+  python benchmarks/sql_profiling.py [--verifications 2000] [--requests 300]
+"""
+import argparse
+import logging
+import random
+import time
+
+from common import create_user, login, make_app, percentile, seed_dataset, temp_sqlite_url
+from query_plans import route_targets
+
+
+class WarningCollector(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        if record.getMessage().startswith("Possible N+1"):
+            self.messages.append(record.getMessage())
+
+
+def time_requests(app, url, n):
+    client = app.test_client()
+    login(client, "prof_operator")
+    client.get(url)
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client.get(url)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verifications", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    url = temp_sqlite_url("sql_profiling")
+    app = make_app({"SQLALCHEMY_DATABASE_URI": url, "SQL_PROFILING": True})
+    with app.app_context():
+        from app.extensions import db
+        from app.models import FGCode, TDItem
+        db.create_all()
+        seed_dataset(args.verifications, random.Random(1))
+        for role in ("developer", "admin", "operator"):
+            create_user(f"prof_{role}", role=role)
+        fg = FGCode.query.filter(FGCode.is_active.is_(True), FGCode.td_items.any(TDItem.is_active.is_(True))).first()
+        active_items = [i.id for i in TDItem.query.filter_by(fg_id=fg.id, is_active=True)]
+        ids = {"line_id": fg.line_id, "fg_id": fg.id, "item_id": active_items[0], "active_items": active_items,
+               "verification_id": 1, "user_id": 1}
+
+    captured = []
+
+    @app.after_request
+    def capture(response):
+        from app.services.sql_profiler import current_stats
+        captured.append(current_stats())
+        return response
+
+    collector = WarningCollector()
+    app.logger.addHandler(collector)
+    clients = {None: app.test_client()}
+    for role in ("developer", "admin", "operator"):
+        clients[role] = app.test_client()
+        login(clients[role], f"prof_{role}")
+    print(f"{'route':40}{'HTTP':>5}{'queries':>9}{'db ms':>9}  N+1 suspects")
+    for endpoint, method, target_url, role, form in route_targets(app, ids):
+        collector.messages, captured[:] = [], []
+        resp = clients[role].open(target_url, method=method, data=form)
+        stats = captured[-1]
+        suspects = "; ".join(m.split(": ", 1)[1][:70] for m in collector.messages)
+        print(f"{endpoint:40}{resp.status_code:>5}{stats.count:>9}{stats.seconds * 1000:>9.1f}  {suspects}")
+
+    checklist = f"/verify/fg/{fg.id}"
+    off = make_app({"SQLALCHEMY_DATABASE_URI": url, "SQL_PROFILING": False})
+    on = make_app({"SQLALCHEMY_DATABASE_URI": url, "SQL_PROFILING": True})
+    results = {}
+    for name, instance in (("off", off), ("on", on), ("off ", off), ("on ", on)):
+        results.setdefault(name.strip(), []).extend(time_requests(instance, checklist, args.requests // 2))
+    p50_off, p50_on = percentile(results["off"], 50) * 1000, percentile(results["on"], 50) * 1000
+    print(f"\n{checklist} p50: profiling off {p50_off:.3f} ms, on {p50_on:.3f} ms ({p50_on - p50_off:+.3f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Concurrent checklist submits on one SQLite file, bare vs SQLite mode (SQLITE_TUNING).
+
+Each of --workers processes (like Gunicorn workers) creates its own app, logs in operators and
+submits checklists back to back, loading a checklist between submits. Reports submit throughput,
+latency and failed requests (HTTP 500, typically "database is locked") per mode. Afterwards a
+backup of the tuned database is taken while it is in use, more rows are written, and the backup is
+restored; the verification count must match the backup.
+
+Usage:
+  python benchmarks/sqlite_concurrency.py [--workers 4] [--submits 100]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("BACKUP_DIR", tempfile.mkdtemp(prefix="td_bench_backups_"))
+
+from common import create_user, login, make_app, percentile, redis_url, seed_dataset, temp_sqlite_url  # noqa: E402
+
+USERS_PER_WORKER = 6  # submit rate limit is per user
+
+
+def _worker(url, tuning, index, submits, fg_id, form, barrier, results):
+    try:
+        app = make_app({"SQLALCHEMY_DATABASE_URI": url, "SQLITE_TUNING": tuning})
+        clients = []
+        for u in range(USERS_PER_WORKER):
+            client = app.test_client()
+            login(client, f"sq_w{index}_{u}")
+            clients.append(client)
+        barrier.wait()
+    except Exception as e:
+        barrier.abort()  # release the other workers instead of leaving them at the barrier
+        results.put(str(e))
+        return
+    times, failures = [], 0
+    start = time.perf_counter()
+    for n in range(submits):
+        client = clients[n % len(clients)]
+        t = time.perf_counter()
+        resp = client.post(f"/verify/fg/{fg_id}/submit", data=form)
+        times.append(time.perf_counter() - t)
+        failures += resp.status_code != 302
+        failures += client.get(f"/verify/fg/{fg_id}").status_code != 200
+    results.put((times, failures, time.perf_counter() - start))
+
+
+def clear_rate_limits():
+    """Both modes reuse the same user ids; start each with empty submit windows."""
+    import redis
+    from app.config import REDIS_RATE_LIMIT_PREFIX
+    r = redis.Redis.from_url(redis_url())
+    for key in r.scan_iter(REDIS_RATE_LIMIT_PREFIX + "*"):
+        r.delete(key)
+
+
+def run_mode(tuning, workers, submits):
+    clear_rate_limits()
+    url = temp_sqlite_url("concurrency_tuned" if tuning else "concurrency_bare")
+    app = make_app({"SQLALCHEMY_DATABASE_URI": url, "SQLITE_TUNING": tuning})
+    with app.app_context():
+        from app.extensions import db
+        from app.models import FGCode, TDItem
+        db.create_all()
+        seed_dataset(500, random.Random(1))
+        for w in range(workers):
+            for u in range(USERS_PER_WORKER):
+                create_user(f"sq_w{w}_{u}")
+        fg = FGCode.query.filter(FGCode.is_active.is_(True), FGCode.td_items.any(TDItem.is_active.is_(True))).first()
+        form = {f"actual_{i.id}": "1" for i in TDItem.query.filter_by(fg_id=fg.id, is_active=True)}
+        fg_id = fg.id
+        db.session.remove()
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context("fork")
+    barrier, results = ctx.Barrier(workers), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(url, tuning, w, submits, fg_id, form, barrier, results)) for w in range(workers)]
+    for p in procs:
+        p.start()
+    outcomes = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    errors = [o for o in outcomes if isinstance(o, str)]
+    if errors:
+        raise SystemExit(f"worker failed to start: {errors[0]}")
+    times = [t for o in outcomes for t in o[0]]
+    failures = sum(o[1] for o in outcomes)
+    elapsed = max(o[2] for o in outcomes)
+    return url, app, len(times) / elapsed, percentile(times, 50), percentile(times, 95), percentile(times, 99), failures
+
+
+def backup_restore_check(url, app, workers, submits):
+    """Back up while workers write, write more, restore; the verification count must match the backup."""
+    import sqlite3
+    from app.services.backup_service import restore_from_file, run_backup
+    path = url.replace("sqlite:///", "")
+    ctx = multiprocessing.get_context("fork")
+    with app.app_context():
+        from app.models import FGCode, TDItem
+        fg = FGCode.query.filter(FGCode.is_active.is_(True), FGCode.td_items.any(TDItem.is_active.is_(True))).first()
+        form = {f"actual_{i.id}": "1" for i in TDItem.query.filter_by(fg_id=fg.id, is_active=True)}
+        clear_rate_limits()
+        barrier, results = ctx.Barrier(workers + 1), ctx.Queue()
+        procs = [ctx.Process(target=_worker, args=(url, True, w, submits, fg.id, form, barrier, results)) for w in range(workers)]
+        for p in procs:
+            p.start()
+        barrier.wait()
+        backup = run_backup()
+        for _ in procs:
+            results.get()
+        for p in procs:
+            p.join()
+        snapshot = sqlite3.connect(backup).execute("SELECT COUNT(*) FROM verifications").fetchone()[0]
+        live_before = sqlite3.connect(path).execute("SELECT COUNT(*) FROM verifications").fetchone()[0]
+        start = time.perf_counter()
+        ok, err = restore_from_file(backup, None, "bench")
+        restore_s = time.perf_counter() - start
+        live_after = sqlite3.connect(path).execute("SELECT COUNT(*) FROM verifications").fetchone()[0]
+    print(f"\nbackup during writes: {os.path.getsize(backup) / 1e6:.1f} MB, {snapshot} verifications; "
+          f"live {live_before} -> restored {live_after} in {restore_s * 1000:.0f} ms")
+    return ok and live_after == snapshot, err
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--submits", type=int, default=100, help="submits per worker")
+    args = parser.parse_args()
+
+    redis_url()  # start the shared fake Redis before forking workers
+    print(f"{args.workers} workers x {args.submits} submits")
+    print(f"{'mode':10}{'submits/s':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'failed':>8}")
+    for tuning in (False, True):
+        url, app, rate, p50, p95, p99, failures = run_mode(tuning, args.workers, args.submits)
+        print(f"{'tuned' if tuning else 'bare':10}{rate:>11.1f}{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}{p99 * 1000:>9.1f}{failures:>8}")
+    ok, err = backup_restore_check(url, app, args.workers, args.submits // 4)
+    if not ok or failures:
+        print("FAIL" + (f": {err}" if err else ""))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
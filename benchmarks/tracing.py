@@ -0,0 +1,160 @@
+"""
+Request tracing (TRACING): span coverage of traced requests and the cost of tracing.
+
+A developer forces traces (X-Trace: 1) of the verifications export and a checklist submit; each
+response must carry X-Trace-Id, the trace must be readable from TRACE_FILE with SQL, Redis and
+export / template spans, and its waterfall page must render. A login traced by sampling must
+show the bcrypt span. Several processes then append traces past a small TRACE_FILE_MAX_BYTES at
+once: exactly one rotation is due, so no line may be lost or torn. Finally
+times a checklist page with tracing off, on with nothing sampled, and on with every request
+sampled.
+
+Usage:
+  python benchmarks/tracing.py [--verifications 2000] [--requests 300]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from common import create_user, login, make_app, percentile, seed_dataset, temp_sqlite_url
+
+
+def time_requests(app, url, n):
+    client = app.test_client()
+    login(client, "trace_operator")
+    client.get(url)
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client.get(url)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(trace):
+    by_category = {}
+    for name, category, start, duration, detail in trace["spans"]:
+        count, ms = by_category.get(category, (0, 0.0))
+        by_category[category] = (count + 1, ms + duration)
+    parts = [f"{c} {n} / {ms:.1f} ms" for c, (n, ms) in sorted(by_category.items(), key=lambda kv: -kv[1][1])]
+    return by_category, ", ".join(parts)
+
+
+def _append_traces(path, max_bytes, n, start):
+    from app.services import tracing
+    tracing._state.update(file=path, max_bytes=max_bytes)
+    start.wait()
+    for i in range(n):
+        tracing._write({"id": f"{os.getpid()}-{i}", "spans": [["sql", "sql", 0.0, 0.1, "x" * 200]]})
+
+
+def concurrent_rotation(writers=8, traces=300):
+    """True if concurrent writers crossing TRACE_FILE_MAX_BYTES together rotate exactly once, losing no line."""
+    path = os.path.join(tempfile.mkdtemp(prefix="td_bench_rotate_"), "traces.jsonl")
+    max_bytes = writers * traces * 150  # about half of what is written: one rotation is due
+    context = multiprocessing.get_context("fork")
+    start = context.Event()
+    procs = [context.Process(target=_append_traces, args=(path, max_bytes, traces, start)) for _ in range(writers)]
+    for proc in procs:
+        proc.start()
+    start.set()
+    for proc in procs:
+        proc.join()
+    lines = torn = 0
+    for name in (path, path + ".1"):
+        with open(name) as f:
+            for line in f:
+                lines += 1
+                try:
+                    json.loads(line)
+                except ValueError:
+                    torn += 1
+    print(f"{writers} writers x {traces} traces crossing {max_bytes / 1e3:.0f} kB: rotated file "
+          f"{os.path.getsize(path + '.1') / 1e3:.0f} kB, {writers * traces - lines} lines lost, {torn} torn")
+    return lines == writers * traces and torn == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verifications", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    url = temp_sqlite_url("tracing")
+    trace_file = os.path.join(tempfile.mkdtemp(prefix="td_bench_traces_"), "traces.jsonl")
+    config = {"SQLALCHEMY_DATABASE_URI": url, "TRACING": True, "TRACE_SAMPLE_RATE": 0.0, "TRACE_FILE": trace_file}
+    app = make_app(config)
+    with app.app_context():
+        from app.extensions import db
+        from app.models import FGCode, TDItem
+        db.create_all()
+        seed_dataset(args.verifications, random.Random(1))
+        create_user("trace_developer", role="developer")
+        create_user("trace_operator")
+        fg = FGCode.query.filter(FGCode.is_active.is_(True), FGCode.td_items.any(TDItem.is_active.is_(True))).first()
+        form = {f"actual_{i.id}": "1" for i in TDItem.query.filter_by(fg_id=fg.id, is_active=True)}
+        fg_id = fg.id
+
+    from app.services import tracing
+    developer = app.test_client()
+    login(developer, "trace_developer")
+    ok = True
+    checks = (
+        ("GET", "/admin/export/verifications", None, {"sql", "export"}),
+        ("GET", f"/verify/fg/{fg_id}", None, {"sql", "template"}),
+        ("POST", f"/verify/fg/{fg_id}/submit", form, {"sql", "redis"}),
+    )
+    for method, target, data, expected in checks:
+        resp = developer.open(target, method=method, data=data, headers={"X-Trace": "1"})
+        trace_id = resp.headers.get("X-Trace-Id")
+        trace = tracing.find(trace_id) if trace_id else None
+        if trace is None:
+            print(f"{method} {target}: HTTP {resp.status_code}, no trace")
+            ok = False
+            continue
+        by_category, text = summarize(trace)
+        page = developer.get(f"/developer/traces/{trace_id}").status_code
+        print(f"{method} {target}: HTTP {resp.status_code} in {trace['duration_ms']:.1f} ms, trace {trace_id} "
+              f"({len(trace['spans'])} spans, {trace['dropped']} dropped; waterfall HTTP {page})\n    {text}")
+        ok &= expected <= set(by_category) and page == 200
+    untraced = developer.get(f"/verify/fg/{fg_id}")
+    ok &= "X-Trace-Id" not in untraced.headers
+
+    sampled = make_app(dict(config, TRACE_SAMPLE_RATE=1.0))
+    client = sampled.test_client()
+    resp = login(client, "trace_operator")
+    trace = tracing.find(resp.headers.get("X-Trace-Id", ""))
+    by_category, text = summarize(trace) if trace else ({}, "no trace")
+    print(f"POST /auth/login (sampled): {text}")
+    ok &= "bcrypt" in by_category
+    listing = developer.get("/developer/traces")
+    print(f"/developer/traces HTTP {listing.status_code}, {len(tracing.recent(100))} traces in {os.path.getsize(trace_file) / 1e3:.0f} kB")
+    ok &= listing.status_code == 200
+    ok &= concurrent_rotation()
+
+    checklist = f"/verify/fg/{fg_id}"
+    modes = (
+        ("off", make_app({"SQLALCHEMY_DATABASE_URI": url, "TRACING": False})),
+        ("on, 0% sampled", make_app(config)),
+        ("on, 100% sampled", make_app(dict(config, TRACE_SAMPLE_RATE=1.0))),
+    )
+    results = {}
+    for _ in range(2):
+        for name, instance in modes:
+            results.setdefault(name, []).extend(time_requests(instance, checklist, args.requests // 2))
+    base = percentile(results["off"], 50) * 1000
+    print(f"\n{checklist} p50:")
+    for name, _ in modes:
+        p50 = percentile(results[name], 50) * 1000
+        print(f"  tracing {name:18} {p50:.3f} ms ({p50 - base:+.3f} ms)")
+    if not ok:
+        print("FAIL")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+End-to-end benchmark of the plant workflows, with a JSON report and a regression comparison.
+
+Seeds a database (BENCH_DATABASE_URL, default a temporary SQLite file) and runs --concurrency
+forked workers (like Gunicorn workers), each with its own app and logged-in clients, against a
+shared Redis (BENCH_REDIS_URL or an in-process fake). The workers run these phases together:
+
+  login      POST /auth/login with a fresh client (bcrypt at the configured cost)
+  navigate   line list -> FG list of a line -> checklist
+  submit     checklist submit
+  admin      FG list, FG search, TD item search, audit log page
+  exports    TD, audit log and verification exports
+
+Reports throughput per phase and count / errors / p50 / p95 / p99 per request, and writes them
+with the commit, database and parameters to --output. Run it at two commits and compare:
+
+  python benchmarks/workflows.py --output base.json        # at the base commit
+  python benchmarks/workflows.py --output new.json         # at the new commit
+  python benchmarks/workflows.py --compare base.json new.json [--tolerance 0.15]
+
+--compare exits 1 when a request's p50 or p95 grew, or a phase's throughput fell, by more than
+--tolerance (and by more than --min-ms for latencies).
+
+Usage:
+  python benchmarks/workflows.py [--concurrency 4] [--scale 1.0] [--verifications 5000] [--output FILE]
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from common import ROOT, BENCH_PASSWORD, create_user, login, make_app, percentile, redis_url, seed_dataset, temp_sqlite_url
+
+# phase: iterations per worker at --scale 1
+ITERATIONS = {"login": 5, "navigate": 40, "submit": 30, "admin": 20, "exports": 2}
+SUBMITS_PER_USER = 15  # below SUBMIT_RATE_LIMIT per window
+EXPECTED_STATUS = {"login": 302, "submit": 302}
+
+
+def _pick(ctx, rng):
+    return ctx["checklists"][rng.randrange(len(ctx["checklists"]))]
+
+
+def phase_requests(phase, ctx, clients, rng, n):
+    """Yield (request name, client, method, url, form) for iteration n of a phase."""
+    if phase == "login":  # a fresh client per login, like a new browser
+        yield "login", ctx["app"].test_client(), "POST", "/auth/login", {"username": clients["login_user"], "password": BENCH_PASSWORD}
+    elif phase == "navigate":
+        line_id, fg_id, _ = _pick(ctx, rng)
+        yield "line_index", clients["operator"], "GET", "/verify/", None
+        yield "line_fgs", clients["operator"], "GET", f"/verify/line/{line_id}", None
+        yield "checklist", clients["operator"], "GET", f"/verify/fg/{fg_id}", None
+    elif phase == "submit":
+        _, fg_id, form = _pick(ctx, rng)
+        submitters = clients["submitters"]
+        yield "submit", submitters[n % len(submitters)], "POST", f"/verify/fg/{fg_id}/submit", form
+    elif phase == "admin":
+        _, fg_id, _ = _pick(ctx, rng)
+        yield "admin_fg_list", clients["admin"], "GET", f"/admin/fg?page={rng.randrange(1, 10)}", None
+        yield "admin_fg_search", clients["admin"], "GET", f"/admin/fg?q=FG{rng.randrange(100):03d}", None
+        yield "admin_td_search", clients["admin"], "GET", f"/admin/fg/{fg_id}/td?q=IT", None
+        yield "admin_audit_logs", clients["admin"], "GET", f"/admin/audit-logs?page={rng.randrange(1, 10)}", None
+    elif phase == "exports":
+        _, fg_id, _ = _pick(ctx, rng)
+        yield "export_td", clients["admin"], "GET", f"/admin/export/td/{fg_id}", None
+        yield "export_audit_logs", clients["admin"], "GET", "/admin/export/audit-logs", None
+        yield "export_verifications", clients["admin"], "GET", "/admin/export/verifications", None
+
+
+def _worker(index, url, ctx, iterations, barrier, results):
+    try:
+        app = make_app({"SQLALCHEMY_DATABASE_URI": url})
+        ctx = dict(ctx, app=app)
+        clients = {"login_user": f"wf_login_{index}"}
+        for role in ("operator", "admin"):
+            clients[role] = app.test_client()
+            login(clients[role], f"wf_{role}_{index}")
+        clients["submitters"] = []
+        for k in range(ctx["submitters"]):
+            client = app.test_client()
+            login(client, f"wf_submit_{index}_{k}")
+            clients["submitters"].append(client)
+    except Exception as e:
+        barrier.abort()  # release the other workers instead of leaving them at the barrier
+        results.put((index, f"setup failed: {e}"))
+        return
+    rng = random.Random(index)
+    out = {}
+    for phase, n in iterations.items():
+        barrier.wait()
+        latencies, errors = {}, {}
+        start = time.perf_counter()
+        for i in range(n):
+            for name, client, method, target, form in phase_requests(phase, ctx, clients, rng, i):
+                t = time.perf_counter()
+                resp = client.open(target, method=method, data=form)
+                latencies.setdefault(name, []).append(time.perf_counter() - t)
+                if resp.status_code != EXPECTED_STATUS.get(name, 200):
+                    errors[name] = errors.get(name, 0) + 1
+        out[phase] = {"latencies": latencies, "errors": errors, "elapsed": time.perf_counter() - start}
+    results.put((index, out))
+
+
+def clear_rate_limits():
+    """Reruns reuse user names; start with empty submit windows."""
+    import redis
+    from app.config import REDIS_RATE_LIMIT_PREFIX
+    r = redis.Redis.from_url(redis_url())
+    for key in r.scan_iter(REDIS_RATE_LIMIT_PREFIX + "*"):
+        r.delete(key)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup(url, args, iterations):
+    """Seed the database and create the benchmark users; returns the shared worker context."""
+    app = make_app({"SQLALCHEMY_DATABASE_URI": url})
+    submitters = max(1, math.ceil(iterations["submit"] / SUBMITS_PER_USER))
+    with app.app_context():
+        from app.extensions import db
+        from app.models import FGCode, TDItem
+        db.create_all()
+        seed_dataset(args.verifications, random.Random(args.seed))
+        for w in range(args.concurrency):
+            create_user(f"wf_login_{w}")
+            create_user(f"wf_operator_{w}")
+            create_user(f"wf_admin_{w}", role="admin")
+            for k in range(submitters):
+                create_user(f"wf_submit_{w}_{k}")
+        checklists = []
+        fgs = FGCode.query.filter(FGCode.is_active.is_(True), FGCode.td_items.any(TDItem.is_active.is_(True))).order_by(FGCode.id).limit(50)
+        for fg in fgs:
+            form = {f"actual_{i.id}": "1" for i in TDItem.query.filter_by(fg_id=fg.id, is_active=True)}
+            checklists.append((fg.line_id, fg.id, form))
+        dialect = db.engine.dialect.name
+        db.session.remove()
+        db.engine.dispose()
+    return {"checklists": checklists, "submitters": submitters}, dialect
+
+
+def run(args):
+    iterations = {phase: max(1, round(n * args.scale)) for phase, n in ITERATIONS.items()}
+    redis_url()  # start the shared fake Redis before forking workers
+    clear_rate_limits()
+    url = os.environ.get("BENCH_DATABASE_URL") or temp_sqlite_url("workflows")
+    ctx, dialect = setup(url, args, iterations)
+
+    mp = multiprocessing.get_context("fork")
+    barrier, results = mp.Barrier(args.concurrency), mp.Queue()
+    procs = [mp.Process(target=_worker, args=(w, url, ctx, iterations, barrier, results)) for w in range(args.concurrency)]
+    for p in procs:
+        p.start()
+    outcomes = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    failed = [o for _, o in outcomes if isinstance(o, str)]
+    if failed:
+        raise SystemExit(f"worker {failed[0]}")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "database": dialect,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "concurrency": args.concurrency,
+            "verifications": args.verifications,
+            "scale": args.scale,
+            "seed": args.seed,
+        },
+        "phases": {},
+        "requests": {},
+    }
+    for phase in iterations:
+        runs = [o[phase] for _, o in outcomes]
+        elapsed = max(r["elapsed"] for r in runs)
+        names = list(runs[0]["latencies"])
+        total = 0
+        for name in names:
+            values = [v for r in runs for v in r["latencies"][name]]
+            errors = sum(r["errors"].get(name, 0) for r in runs)
+            total += len(values)
+            report["requests"][name] = {
+                "phase": phase,
+                "count": len(values),
+                "errors": errors,
+                "mean_ms": round(sum(values) / len(values) * 1000, 3),
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+            }
+        report["phases"][phase] = {"requests": total, "elapsed_s": round(elapsed, 3),
+                                   "throughput_rps": round(total / elapsed, 2)}
+    return report
+
+
+def print_report(report):
+    meta = report["meta"]
+    print(f"commit {meta['commit']}, {meta['database']}, {meta['concurrency']} workers, "
+          f"{meta['verifications']} verifications, scale {meta['scale']}")
+    print(f"{'request':24}{'n':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for phase, stats in report["phases"].items():
+        print(f"[{phase}] {stats['throughput_rps']:.1f} req/s")
+        for name, row in report["requests"].items():
+            if row["phase"] == phase:
+                print(f"  {name:22}{row['count']:>6}{row['errors']:>5}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+
+
+def compare(base, new, tolerance, min_ms):
+    """Print base vs new; returns the list of regressions."""
+    regressions = []
+    for key in ("database", "concurrency", "verifications", "scale", "cpus"):
+        if base["meta"].get(key) != new["meta"].get(key):
+            print(f"warning: {key} differs ({base['meta'].get(key)} vs {new['meta'].get(key)}); results are not comparable")
+    print(f"base {base['meta']['commit']} ({base['meta']['created_at']}) vs new {new['meta']['commit']} ({new['meta']['created_at']})")
+    print(f"{'':28}{'base':>10}{'new':>10}{'change':>9}")
+    for phase, stats in new["phases"].items():
+        old = base["phases"].get(phase)
+        if old is None:
+            continue
+        change = stats["throughput_rps"] / old["throughput_rps"] - 1
+        flag = change < -tolerance
+        print(f"{'[' + phase + '] req/s':28}{old['throughput_rps']:>10.1f}{stats['throughput_rps']:>10.1f}{change:>+9.0%}{'  REGRESSION' if flag else ''}")
+        if flag:
+            regressions.append(f"{phase} throughput {change:+.0%}")
+        for name, row in new["requests"].items():
+            old_row = base["requests"].get(name)
+            if row["phase"] != phase or old_row is None:
+                continue
+            for metric in ("p50_ms", "p95_ms"):
+                delta = row[metric] - old_row[metric]
+                change = row[metric] / old_row[metric] - 1 if old_row[metric] else 0.0
+                flag = change > tolerance and delta > min_ms
+                print(f"  {name + ' ' + metric[:3]:26}{old_row[metric]:>10.1f}{row[metric]:>10.1f}{change:>+9.0%}{'  REGRESSION' if flag else ''}")
+                if flag:
+                    regressions.append(f"{name} {metric[:3]} {old_row[metric]:.1f} -> {row[metric]:.1f} ms")
+            if row["errors"] > old_row["errors"]:
+                print(f"  {name + ' errors':26}{old_row['errors']:>10}{row['errors']:>10}  REGRESSION")
+                regressions.append(f"{name} errors {old_row['errors']} -> {row['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the iterations of every phase")
+    parser.add_argument("--verifications", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two JSON reports instead of running")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="relative change counted as a regression")
+    parser.add_argument("--min-ms", type=float, default=2.0, help="ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = compare(base, new, args.tolerance, args.min_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): " + "; ".join(regressions))
+            sys.exit(1)
+        print("\nno regressions")
+        return
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nwrote {args.output}")
+    if any(row["errors"] for row in report["requests"].values()):
+        print("FAIL: requests with unexpected status")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
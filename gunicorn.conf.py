@@ -0,0 +1,22 @@
+"""
+Gunicorn server hooks; Gunicorn loads ./gunicorn.conf.py by default (command line in procfile).
+
+Metrics (METRICS_ENABLED): each worker writes its own snapshot to METRICS_DIR. The master clears
+the directory when it starts and archives the snapshot of every worker that exits, so the
+directory does not grow with worker restarts (see services/metrics_service.py).
+"""
+import os
+
+
+def on_starting(server):
+    from app.config import METRICS_DIR
+    from app.services.metrics_service import reset_dir
+    if os.path.isdir(METRICS_DIR):
+        reset_dir(METRICS_DIR)
+
+
+def child_exit(server, worker):
+    from app.config import METRICS_DIR
+    from app.services.metrics_service import archive_worker
+    if os.path.isdir(METRICS_DIR):
+        archive_worker(METRICS_DIR, worker.pid)